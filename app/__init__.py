@@ -1,11 +1,14 @@
 from flask import Flask, request, jsonify, redirect
 from flasgger import Swagger
 
+from app.utils import (activity_store, apispec, cache, database, email, jobs, json_provider, metrics, rollups,
+                       strava_webhook, training_load)
 from app.utils.log import log_action
 
 
 def create_app():
     app = Flask(__name__)
+    json_provider.init_app(app)
     swagger = Swagger(app, template={
         "info": {
             "title": "Triathlon Forge API",
@@ -16,11 +19,27 @@ def create_app():
 
     from .auth import auth_bp
     from app.strava import strava_bp
+    from app.imports import import_bp
+    from app.training import training_bp
     from app.utils.log import log_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(strava_bp)
+    app.register_blueprint(training_bp)
+    app.register_blueprint(import_bp)
     app.register_blueprint(log_bp)
+    app.register_blueprint(database.db_bp)
+    app.register_blueprint(cache.cache_bp)
+
+    database.init_app(app)
+    metrics.init_app(app)
+    jobs.init_app(app)
+    email.init_app(app)
+    activity_store.init_app(app)
+    rollups.init_app(app)
+    strava_webhook.init_app(app)
+    training_load.init_app(app)
+    apispec.init_app(app)  # last: the spec fingerprint covers every route
 
     @app.before_request
     def log_request_info():
@@ -1,13 +1,14 @@
 import random
 
 from flask import Blueprint, request, jsonify
-from argon2 import PasswordHasher
+from mysql.connector import IntegrityError, errorcode
 from app.utils.database import get_db_connection
-from app.utils.email import send_email
+from app.utils.email import queue_verification_email
+from app.utils.passwords import HashingBusy, get_password_service
+from app.utils.user_store import (email_exists, find_pending_verification, get_login_user, insert_user,
+                                  mark_verified, update_password_hash)
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api')
-# Create an Argon2 PasswordHasher instance
-ph = PasswordHasher()
 
 
 #  login register functions
@@ -57,6 +58,8 @@ def login():
                 message:
                   type: string
                   example: "Invalid username or password."
+          503:
+            description: Password hashing is saturated or timed out; retry after the Retry-After delay
         """
     # Get the data from the request
     data = request.get_json()
@@ -72,39 +75,40 @@ def login():
     if not conn:
         return jsonify({'success': False, 'message': 'Database connection failed.'}), 500
 
-    cursor = conn.cursor(dictionary=True)
     try:
-        # Query to check if the username exists
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
+        # Query to check if the username exists (id + hash only)
+        user = get_login_user(conn, email)
 
         if user:
             # Compare the hashed password from the database with the one provided
-            try:
-                # The hashed password stored in the database
-                stored_password_hash = user['password_hash']  # Adjust according to your column name
-                ph.verify(stored_password_hash, password)
-
-                # If password matches
-                return jsonify({'success': True, 'message': 'Login successful!', 'user': {
-                    'id': user['user_id'],
-                    'email': user['email'],
-                    'name': user['first_name'],
-                    'surname': user['last_name']
-                }}), 200
-
-            except Exception as e:
-                # If password doesn't match
-                print(e)
+            # (runs on the hashing pool, not on this request thread)
+            stored_password_hash = user['password_hash']  # Adjust according to your column name
+            matches, new_hash = get_password_service().verify(stored_password_hash, password)
+            if not matches:
                 return jsonify({'success': False, 'message': 'Invalid username or password.'}), 401
+
+            # Upgrade hashes created with older Argon2 parameters
+            if new_hash:
+                update_password_hash(conn, user['user_id'], new_hash)
+                conn.commit()
+
+            # If password matches
+            return jsonify({'success': True, 'message': 'Login successful!', 'user': {
+                'id': user['user_id'],
+                'email': user['email'],
+                'name': user['first_name'],
+                'surname': user['last_name']
+            }}), 200
         else:
             return jsonify({'success': False, 'message': 'Invalid username.'}), 401
 
+    except HashingBusy as e:
+        return jsonify({'success': False, 'message': str(e)}), 503, {'Retry-After': '1'}
+
     except Exception as e:
         return jsonify({'success': False, 'message': f'Database query failed: {e}'}), 500
 
     finally:
-        cursor.close()
         conn.close()
 
 
@@ -182,6 +186,8 @@ def register():
                 message:
                   type: string
                   example: "Database connection failed."
+          503:
+            description: Password hashing is saturated or timed out; retry after the Retry-After delay
         """
 
     data = request.get_json()
@@ -200,7 +206,10 @@ def register():
         return jsonify({'success': False, 'message': 'Missing required fields.'}), 400
 
     # Hash password
-    hashed_password = ph.hash(password)
+    try:
+        hashed_password = get_password_service().hash(password)
+    except HashingBusy as e:
+        return jsonify({'success': False, 'message': str(e)}), 503, {'Retry-After': '1'}
 
     # Generate a 6-digit verification code
     verification_code = f"{random.randint(100000, 999999)}"
@@ -211,23 +220,25 @@ def register():
         print("Database connection failed. Please check configuration.")
         return jsonify({'success': False, 'message': 'Database connection failed.'}), 500
 
-    cursor = conn.cursor(dictionary=True)
     try:
         # Check if email already exists
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        if cursor.fetchone():
+        if email_exists(conn, email):
             return jsonify({'success': False, 'message': 'Email already registered.'}), 400
 
         # Insert the user with a verification code
-        cursor.execute("""
-            INSERT INTO users (first_name, last_name, email, password_hash, bio, birth_year, strava_profile, garmin_profile, verification_code)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (first_name, last_name, email, hashed_password, bio, birth_year, strava_profile, garmin_profile,
-              verification_code))
-        conn.commit()
+        try:
+            insert_user(conn, first_name, last_name, email, hashed_password, bio, birth_year, strava_profile,
+                        garmin_profile, verification_code)
+        except IntegrityError as e:
+            # Registered concurrently; the unique index on email caught it
+            if e.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            conn.rollback()
+            return jsonify({'success': False, 'message': 'Email already registered.'}), 400
 
-        # Send the verification email
-        send_email(email, verification_code)
+        # Queue the verification email; it is sent by `flask email-worker`
+        queue_verification_email(conn, email, verification_code)
+        conn.commit()
 
         return jsonify({'success': True, 'message': 'Registration successful. Please verify your email.'})
 
@@ -235,7 +246,6 @@ def register():
         return jsonify({'success': False, 'message': f'Error: {e}'}), 500
 
     finally:
-        cursor.close()
         conn.close()
 
 
@@ -287,17 +297,15 @@ def verify_code():
     if not conn:
         return jsonify({'success': False, 'message': 'Database connection failed.'}), 500
 
-    cursor = conn.cursor(dictionary=True)
     try:
         # Check the verification code
-        cursor.execute("SELECT * FROM users WHERE email = %s AND verification_code = %s", (email, verification_code))
-        user = cursor.fetchone()
+        user_id = find_pending_verification(conn, email, verification_code)
 
-        if not user:
+        if not user_id:
             return jsonify({'success': False, 'message': 'Invalid verification code.'}), 400
 
         # Mark the user as verified
-        cursor.execute("UPDATE users SET verified = TRUE, verification_code = NULL WHERE email = %s", (email,))
+        mark_verified(conn, user_id)
         conn.commit()
 
         return jsonify({'success': True, 'message': 'Email verified successfully.'})
@@ -306,5 +314,4 @@ def verify_code():
         return jsonify({'success': False, 'message': f'Error: {e}'}), 500
 
     finally:
-        cursor.close()
         conn.close()
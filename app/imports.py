@@ -0,0 +1,81 @@
+import os
+import uuid
+import zipfile
+
+from flask import Blueprint, request, jsonify, url_for
+
+from app.utils.activity_import import IMPORT_DIR, IMPORT_MAX_BYTES, archive_members
+from app.utils.database import get_db_connection
+from app.utils.jobs import enqueue_job
+
+import_bp = Blueprint('import', __name__, url_prefix='/api/import')
+
+
+@import_bp.route('/archive', methods=['POST'])
+def import_activity_archive():
+    """
+    Uvoz zip arhive sa GPX/TCX/FIT fajlovima (npr. Garmin ili Strava bulk export).
+    ---
+    tags:
+      - Import
+    consumes:
+      - multipart/form-data
+    parameters:
+      - name: user_id
+        in: formData
+        type: integer
+        required: true
+      - name: archive
+        in: formData
+        type: file
+        required: true
+        description: Zip sa .gpx, .tcx i .fit fajlovima (i .gz varijantama).
+    responses:
+      202:
+        description: >
+          Uvoz je zakazan; napredak se prati na status_url (pages_fetched =
+          obrađeni fajlovi, activities_written = upisane aktivnosti).
+      400:
+        description: Nedostaje user_id ili arhiva, ili arhiva nije ispravan zip.
+      413:
+        description: Arhiva je veća od IMPORT_MAX_BYTES.
+    """
+    user_id = request.form.get('user_id', type=int)
+    upload = request.files.get('archive')
+    if not user_id or not upload:
+        return jsonify({"success": False, "message": "Missing user_id or archive"}), 400
+    if request.content_length and request.content_length > IMPORT_MAX_BYTES:
+        return jsonify({"success": False, "message": "Archive is too large"}), 413
+
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    archive_path = os.path.join(IMPORT_DIR, f"{user_id}_{uuid.uuid4().hex}.zip")
+    upload.save(archive_path)
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            file_count = len(archive_members(archive))
+    except zipfile.BadZipFile:
+        os.remove(archive_path)
+        return jsonify({"success": False, "message": "Archive is not a valid zip file"}), 400
+    if not file_count:
+        os.remove(archive_path)
+        return jsonify({"success": False, "message": "No GPX, TCX or FIT files in the archive"}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        os.remove(archive_path)
+        return jsonify({"success": False, "message": "Database connection failed."}), 500
+    try:
+        job = enqueue_job(conn, user_id, "archive_import", {"archive_path": archive_path})
+    except Exception as e:
+        os.remove(archive_path)
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        conn.close()
+
+    return jsonify({
+        "success": True,
+        "message": "Import queued",
+        "files": file_count,
+        "job": job,
+        "status_url": url_for("strava.get_sync_job", job_id=job["job_id"])
+    }), 202
@@ -1,10 +1,20 @@
+import base64
+import json
 import os
-import requests
-import time
 
-from flask import Blueprint, request, redirect, jsonify
+from flask import Blueprint, Response, request, redirect, jsonify, stream_with_context, url_for
 
+from app.utils.cache import get_cache
 from app.utils.database import get_db_connection
+from app.utils import polyline as polyline_codec
+from app.utils.activity_store import ACTIVITY_COLUMNS, DETAIL_UPDATE_COLUMNS
+from app.utils.export import EXPORT_FORMATS, export_activities
+from app.utils.jobs import enqueue_sync_job, get_job
+from app.utils.rate_limit import RateLimitExceeded, get_rate_limit_scheduler
+from app.utils.streams import STREAM_KEYS, ingest_streams, load_streams, stream_to_list
+from app.utils.strava_client import get_strava_client
+from app.utils.strava_tokens import StravaTokenError, get_token_manager, get_user_access_token
+from app.utils.strava_webhook import STRAVA_WEBHOOK_SUBSCRIPTION_ID, STRAVA_WEBHOOK_VERIFY_TOKEN, record_event
 
 strava_bp = Blueprint('strava', __name__, url_prefix='/api/strava')
 
@@ -13,6 +23,23 @@ STRAVA_ID = os.getenv("STRAVA_CLIENT_ID")
 STRAVA_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
 STRAVA_REDIRECT_URI = os.getenv("STRAVA_REDIRECT_URI")#"https://22064563c47f.ngrok-free.app"
 STRAVA_CALLBACK_PATH = "/api/strava/callback"  # Append this dynamically
+ROUTES_MAX_IDS = 100  # most activities per /routes call
+BATCH_MAX_IDS = 100  # most activities per /get_activity_batch call
+# Fields /get_activities can return (`fields`) -> column in the query
+ACTIVITY_LIST_FIELDS = {
+    **{column: f"a.{column}" for column in (
+        "activity_id", "user_id", "stravaActivityID", "activity_type", "distance", "duration", "pace", "speed",
+        "calories_burned", "heart_rate_avg", "heart_rate_max", "elevation_gain", "date",
+    )},
+    "first_name": "u.first_name",
+    "last_name": "u.last_name",
+}
+# Fields /get_activity and /get_activity_batch can return -> column in the JOIN query
+BATCH_FIELDS = {
+    "activity_id": "a.activity_id",
+    **{column: f"a.{column}" for column in ACTIVITY_COLUMNS},
+    **{column: f"d.{column}" for column in DETAIL_UPDATE_COLUMNS if column != "polyline_bin"},
+}
 
 
 @strava_bp.route('/auth', methods=['GET'])
@@ -42,7 +69,6 @@ def strava_callback():
         return jsonify({"success": False, "message": "Authorization code is missing."}), 400
 
     # Exchange the authorization code for an access token
-    token_url = "https://www.strava.com/oauth/token"
     payload = {
         "client_id": STRAVA_ID,
         "client_secret": STRAVA_SECRET,
@@ -50,7 +76,7 @@ def strava_callback():
         "grant_type": "authorization_code"
     }
 
-    response = requests.post(token_url, data=payload)
+    response = get_strava_client().exchange_token(payload)
     if response.status_code != 200:
         return jsonify({"success": False, "message": "Failed to retrieve access token."}), 500
 
@@ -58,6 +84,7 @@ def strava_callback():
     access_token = tokens.get("access_token")
     refresh_token = tokens.get("refresh_token")
     expires_at = tokens.get("expires_at")
+    athlete_id = (tokens.get("athlete") or {}).get("id")  # webhook events are keyed by athlete id
 
     # Store tokens in the database
     user_id = 1  # Replace this with the authenticated user's ID
@@ -65,10 +92,12 @@ def strava_callback():
     cursor = conn.cursor(dictionary=True)
     try:
         cursor.execute(
-            "UPDATE users SET strava_access_token = %s, strava_refresh_token = %s, strava_token_expires_at = %s WHERE user_id = %s",
-            (access_token, refresh_token, expires_at, user_id)
+            "UPDATE users SET strava_access_token = %s, strava_refresh_token = %s, strava_token_expires_at = %s, "
+            "strava_athlete_id = COALESCE(%s, strava_athlete_id) WHERE user_id = %s",
+            (access_token, refresh_token, expires_at, athlete_id, user_id)
         )
         conn.commit()
+        get_token_manager().store(user_id, access_token, expires_at)
     except Exception as e:
         return jsonify({"success": False, "message": f"Database error: {e}"}), 500
     finally:
@@ -95,172 +124,45 @@ def base_redirect():
 @strava_bp.route('/activities', methods=['GET'])
 def get_strava_activities():
     """
-    Fetches all the user's activities from Strava using pagination
-    and stores them in the database (including location).
+    Queues a sync of the user's Strava activities into the database.
+
+    The sync runs in a background worker (`flask sync-worker`), so this returns
+    202 right away with the job; poll /api/strava/sync_jobs/<job_id> for
+    progress. If a sync for the user is already queued or running, that job is
+    returned instead of starting a second one.
+
+    By default only activities newer than the user's sync watermark are pulled.
+    Pass `full=true` to backfill the whole history; a queued sync is upgraded
+    to a full one, a running one is not (the message says so).
     """
     user_id = request.args.get("id")
     if not user_id:
         return jsonify({"success": False, "message": "Missing user id"}), 400
+    full_sync = request.args.get("full", "false").lower() == "true"
 
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True, buffered=True)
+    if not conn:
+        return jsonify({"success": False, "message": "Database connection failed."}), 500
 
+    cursor = conn.cursor()
     try:
-        # 1. Dohvati Strava tokene
-        cursor.execute("""
-            SELECT strava_access_token, strava_refresh_token, strava_token_expires_at
-            FROM users WHERE user_id = %s
-        """, (user_id,))
-        user = cursor.fetchone()
-        if not user:
+        cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
+        if not cursor.fetchone():
             return jsonify({"success": False, "message": "User not found"}), 404
 
-        access_token = user["strava_access_token"]
-        refresh_token = user["strava_refresh_token"]
-        expires_at = user["strava_token_expires_at"]
-
-        # 2. Refresh token ako je istekao
-        if time.time() > expires_at:
-            refresh_url = "https://www.strava.com/oauth/token"
-            payload = {
-                "client_id": STRAVA_ID,
-                "client_secret": STRAVA_SECRET,
-                "refresh_token": refresh_token,
-                "grant_type": "refresh_token"
-            }
-            response = requests.post(refresh_url, data=payload)
-            if response.status_code != 200:
-                return jsonify({
-                    "success": False,
-                    "message": "Failed to fetch activities",
-                    "status_code": response.status_code,
-                    "error": response.text
-                }), 500
-
-            tokens = response.json()
-            access_token = tokens["access_token"]
-            refresh_token = tokens["refresh_token"]
-            expires_at = tokens["expires_at"]
-
-            cursor.execute("""
-                UPDATE users 
-                SET strava_access_token = %s, strava_refresh_token = %s, strava_token_expires_at = %s 
-                WHERE user_id = %s
-            """, (access_token, refresh_token, expires_at, user_id))
-            conn.commit()
-
-        # 3. Povuci sve aktivnosti sa Strave (paginacija)
-        all_activities = []
-        page = 1
-        per_page = 200
-
-        while True:
-            url = f"https://www.strava.com/api/v3/athlete/activities?per_page={per_page}&page={page}"
-            resp = requests.get(url, headers={"Authorization": f"Bearer {access_token}"})
-            if resp.status_code != 200:
-                return jsonify({
-                    "success": False,
-                    "message": "Failed to fetch activities",
-                    "status_code": resp.status_code,
-                    "error": resp.text
-                }), 500
-
-            activities = resp.json()
-            if not activities:
-                break
-
-            all_activities.extend(activities)
-            page += 1
-
-        # 4. Ubaci u bazu
-        for act in all_activities:
-            strava_id = act.get("id")
-            activity_type = act.get("type", "Other")
-            activity_name = act.get("name")
-            distance = act.get("distance", 0.0)
-            duration = act.get("moving_time", 0)
-            pace = None
-            speed = act.get("average_speed", None)
-            calories = act.get("calories", None)
-            hr_avg = act.get("average_heartrate", None)
-            hr_max = act.get("max_heartrate", None)
-            elevation = act.get("total_elevation_gain", 0.0)
-            date = act.get("start_date_local", "").split("T")[0]
-
-            # ⚠️ Povuci detalje da bi dobio lokaciju
-            detail_url = f"https://www.strava.com/api/v3/activities/{strava_id}"
-            detail_resp = requests.get(detail_url, headers={"Authorization": f"Bearer {access_token}"})
-            location_city, location_country = None, None
-            gear_name, device_name, polyline = None, None, None
-            if detail_resp.status_code == 200:
-                details = detail_resp.json()
-                location_city = details.get("location_city")
-                location_country = details.get("location_country")
-                gear_name = details.get("gear", {}).get("name") if details.get("gear") else None
-                device_name = details.get("device_name")
-                polyline = details.get("map", {}).get("summary_polyline")
-                calories = details.get("calories", None)
-
-            # Ubaci u activities
-            cursor.execute("""
-                INSERT INTO activities 
-                    (user_id, stravaActivityID, activity_type,activity_name ,distance, duration, pace, speed, calories_burned, 
-                     heart_rate_avg, heart_rate_max, elevation_gain, date, location_city, location_country)
-                VALUES (%s, %s, %s, %s ,%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE 
-                    distance = VALUES(distance),
-                    duration = VALUES(duration),
-                    pace = VALUES(pace),
-                    speed = VALUES(speed),
-                    calories_burned = VALUES(calories_burned),
-                    heart_rate_avg = VALUES(heart_rate_avg),
-                    heart_rate_max = VALUES(heart_rate_max),
-                    elevation_gain = VALUES(elevation_gain),
-                    date = VALUES(date),
-                    location_city = VALUES(location_city),
-                    location_country = VALUES(location_country)
-            """, (
-                user_id, strava_id, activity_type, activity_name, distance, duration, pace, speed,
-                calories, hr_avg, hr_max, elevation, date, location_city, location_country
-            ))
-            conn.commit()
-
-            # 🔑 Uzmi lokalni ID
-            cursor.execute("SELECT activity_id FROM activities WHERE stravaActivityID = %s", (strava_id,))
-            activity_row = cursor.fetchone()
-            if activity_row:
-                local_activity_id = activity_row["activity_id"]
-
-                # Ubaci u activity_details
-                cursor.execute("""
-                    INSERT INTO activity_details 
-                        (activity_id, max_speed, average_cadence, average_watts, max_watts, kilojoules, calories, gear_name, device_name, polyline)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE 
-                        max_speed = VALUES(max_speed),
-                        average_cadence = VALUES(average_cadence),
-                        average_watts = VALUES(average_watts),
-                        max_watts = VALUES(max_watts),
-                        kilojoules = VALUES(kilojoules),
-                        calories = VALUES(calories),
-                        gear_name = VALUES(gear_name),
-                        device_name = VALUES(device_name),
-                        polyline = VALUES(polyline)
-                """, (
-                    local_activity_id,
-                    act.get("max_speed"),
-                    act.get("average_cadence"),
-                    act.get("average_watts"),
-                    act.get("max_watts"),
-                    act.get("kilojoules"),
-                    calories,  # 🔥 ovde dodaješ kalorije
-                    gear_name,
-                    device_name,
-                    polyline
-                ))
-                conn.commit()
-
-        return jsonify({"success": True, "message": f"Synced {len(all_activities)} activities"})
+        job, created = enqueue_sync_job(conn, user_id, full_sync)
+        if created:
+            message = "Sync queued"
+        elif full_sync and not job["full_sync"]:
+            message = "Sync already in progress; request the full sync again once it finishes"
+        else:
+            message = "Sync already in progress"
+        return jsonify({
+            "success": True,
+            "message": message,
+            "job": job,
+            "status_url": url_for("strava.get_sync_job", job_id=job["job_id"])
+        }), 202
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
     finally:
@@ -268,68 +170,278 @@ def get_strava_activities():
         conn.close()
 
 
+@strava_bp.route('/webhook', methods=['GET'])
+def strava_webhook_challenge():
+    """
+    Strava push subscription handshake: echoes hub.challenge when hub.verify_token matches.
+    """
+    if request.args.get("hub.mode") != "subscribe" or not STRAVA_WEBHOOK_VERIFY_TOKEN \
+            or request.args.get("hub.verify_token") != STRAVA_WEBHOOK_VERIFY_TOKEN:
+        return jsonify({"success": False, "message": "Invalid verify token"}), 403
+    return jsonify({"hub.challenge": request.args.get("hub.challenge")})
+
+
+@strava_bp.route('/webhook', methods=['POST'])
+def strava_webhook_event():
+    """
+    Receives a Strava push event (activity create/update/delete, athlete deauthorization).
+
+    The event is only stored here and applied by `flask webhook-worker`, because
+    Strava expects a 200 within two seconds. Redelivered events are ignored.
+    """
+    event = request.get_json(silent=True)
+    if not event:
+        return jsonify({"success": False, "message": "Missing event"}), 400
+    if STRAVA_WEBHOOK_SUBSCRIPTION_ID and str(event.get("subscription_id")) != STRAVA_WEBHOOK_SUBSCRIPTION_ID:
+        return jsonify({"success": False, "message": "Unknown subscription"}), 403
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"success": False, "message": "Database connection failed."}), 500
+    try:
+        created = record_event(conn, event)
+        return jsonify({"success": True, "duplicate": not created})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        conn.close()
+
+
+@strava_bp.route('/sync_jobs/<int:job_id>', methods=['GET'])
+def get_sync_job(job_id):
+    """
+    Returns the status of a sync job: pages fetched, activities written and errors.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"success": False, "message": "Database connection failed."}), 500
+
+    try:
+        job = get_job(conn, job_id)
+        if not job:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+        return jsonify({"success": True, "data": job})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        conn.close()
+
+
+@strava_bp.route('/rate_limit', methods=['GET'])
+def get_rate_limit():
+    """
+    Returns the remaining Strava request budget shared by all workers on this host.
+    """
+    return jsonify({"success": True, "data": get_rate_limit_scheduler().status()})
+
+
+def _encode_cursor(row):
+    """Opaque pagination cursor for the (date, activity_id) position of `row`."""
+    date = row["date"].isoformat() if hasattr(row["date"], "isoformat") else str(row["date"])
+    raw = json.dumps([date, row["activity_id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _requested_fields(data, allowed):
+    """
+    Reads the `fields` projection (a JSON list in the body, or a comma-separated
+    string in the body or query string). Returns (fields, error); fields is
+    None when the client wants every field.
+    """
+    fields = (data or {}).get("fields") or request.args.get("fields")
+    if not fields:
+        return None, None
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        return None, "fields must be a list of strings or a comma-separated string"
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        return None, f"Unknown fields: {', '.join(map(str, unknown))}"
+    return list(dict.fromkeys(fields)), None
+
+
+def _decode_cursor(cursor_token):
+    raw = base64.urlsafe_b64decode(cursor_token + "=" * (-len(cursor_token) % 4))
+    date, activity_id = json.loads(raw)
+    return date, int(activity_id)
+
+
 @strava_bp.route('/get_activities', methods=['POST'])
 def get_activities():
+    """
+    Vraća aktivnosti korisnika, najnovije prvo.
+
+    Paginacija je po kursoru (date, activity_id): prvi poziv šalje samo
+    `user_id` i `limit`, a sledeći šalju `cursor` = `next_cursor` iz prethodnog
+    odgovora. `next_cursor` je null kada nema više aktivnosti.
+    Stari klijenti i dalje mogu da šalju `offset` (limit/offset mod).
+    `fields` (npr. ["activity_id", "date", "distance"]) bira kolone koje se
+    čitaju i vraćaju; bez njega se vraćaju sve.
+    """
     try:
         data = request.get_json()
         user_id = data.get('user_id')
         limit = int(data.get('limit', 15))
-        offset = int(data.get('offset', 0))
+        cursor_token = data.get('cursor')
+        offset = int(data['offset']) if 'offset' in data and not cursor_token else None
 
         if not user_id:
             return jsonify({"success": False, "message": "Missing user_id"}), 400
+        fields, error = _requested_fields(data, ACTIVITY_LIST_FIELDS)
+        if error:
+            return jsonify({"success": False, "message": error}), 400
+
+        position = None
+        if cursor_token:
+            try:
+                position = _decode_cursor(cursor_token)
+            except (ValueError, TypeError):
+                return jsonify({"success": False, "message": "Invalid cursor"}), 400
+
+        cache = get_cache()
+        cache_key = f"activities:{user_id}:{limit}:{cursor_token}:{offset}:{','.join(fields or [])}"
+        cached = cache.get(cache_key, user_id)
+        if cached is not None:
+            return jsonify(cached)
+        generation = cache.generation(user_id)
 
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
 
-        query = """
-            SELECT a.activity_id, a.user_id, a.stravaActivityID, a.activity_type, a.distance,
-                   a.duration, a.pace, a.speed, a.calories_burned, a.heart_rate_avg,
-                   a.heart_rate_max, a.elevation_gain, a.date,
-                   u.first_name, u.last_name
+        # date and activity_id are always read because they build next_cursor
+        selected = list(dict.fromkeys([*(fields or ACTIVITY_LIST_FIELDS), "date", "activity_id"]))
+        query = f"""
+            SELECT {', '.join(f'{ACTIVITY_LIST_FIELDS[field]} AS {field}' for field in selected)}
             FROM activities a
-            JOIN users u ON a.user_id = u.user_id
-            WHERE a.user_id = %s
-            ORDER BY a.date DESC
-            LIMIT %s OFFSET %s
         """
-        cursor.execute(query, (user_id, limit, offset))
+        if any(ACTIVITY_LIST_FIELDS[field].startswith("u.") for field in selected):
+            query += " JOIN users u ON a.user_id = u.user_id"
+        query += " WHERE a.user_id = %s"
+        params = [user_id]
+        if position:
+            query += " AND (a.date < %s OR (a.date = %s AND a.activity_id < %s))"
+            params += [position[0], position[0], position[1]]
+        # One row more than requested tells whether there is a next page
+        query += " ORDER BY a.date DESC, a.activity_id DESC LIMIT %s"
+        params.append(limit + 1)
+        if offset is not None:
+            query += " OFFSET %s"
+            params.append(offset)
+
+        cursor.execute(query, params)
         activities = cursor.fetchall()
 
         cursor.close()
         conn.close()
 
-        return jsonify({
+        has_more = len(activities) > limit
+        activities = activities[:limit]
+        next_cursor = _encode_cursor(activities[-1]) if has_more else None
+        if fields:
+            activities = [{field: row[field] for field in fields} for row in activities]
+
+        result = {
             "success": True,
             "data": activities,
             "limit": limit,
             "offset": offset,
-            "count": len(activities)
-        })
+            "count": len(activities),
+            "next_cursor": next_cursor
+        }
+        cache.set(cache_key, user_id, result, generation)
+        return jsonify(result)
 
     except Exception as e:
         return jsonify({"success": False, "message": str(e)})
 
+@strava_bp.route('/export', methods=['GET'])
+def export_user_activities():
+    """
+    Izvoz kompletne istorije aktivnosti korisnika (sa detaljima) kao NDJSON ili CSV.
+
+    Odgovor se strimuje red po red iz nebaferovanog kursora, pa memorija ne
+    raste sa brojem aktivnosti. Parametri: `user_id`, `format` (ndjson ili
+    csv, podrazumevano ndjson) i `gzip=true` za .gz fajl.
+    """
+    user_id = request.args.get("user_id", type=int)
+    fmt = request.args.get("format", "ndjson").lower()
+    compress = request.args.get("gzip", "false").lower() == "true"
+    if not user_id:
+        return jsonify({"success": False, "message": "Missing user_id"}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"success": False, "message": "format must be ndjson or csv"}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"success": False, "message": "Database connection failed."}), 500
+
+    filename = f"activities_{user_id}.{fmt}" + (".gz" if compress else "")
+    return Response(
+        stream_with_context(export_activities(conn, user_id, fmt, compress)),
+        mimetype="application/gzip" if compress else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
 @strava_bp.route("/get_activity", methods=["POST"])
 def get_activity():
     """
     Vraća detalje jedne aktivnosti po activity_id.
     Body zahteva JSON:
     {
-        "activity_id": 123
+        "activity_id": 123,
+        "fields": ["activity_name", "distance", "polyline"]
     }
+    `fields` je opciono (kao kod /get_activity_batch); tada se čitaju samo te kolone.
     """
     data = request.get_json()
     if not data or "activity_id" not in data:
         return jsonify({"success": False, "message": "Missing activity_id"}), 400
+    fields, error = _requested_fields(data, BATCH_FIELDS)
+    if error:
+        return jsonify({"success": False, "message": error}), 400
 
     activity_id = data["activity_id"]
+    cache = get_cache()
+    cache_key = f"activity:{activity_id}"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        if fields:
+            cached = {field: cached.get(field) for field in fields}
+        return jsonify({"success": True, "data": cached})
+
     conn = get_db_connection()
 
     try:
         # Koristi buffered cursor da pročita sve rezultate odmah
         cursor = conn.cursor(dictionary=True, buffered=True)
 
+        if fields:
+            # Only the requested columns, in one query; a partial row is not cached
+            cursor.execute(f"""
+                SELECT {', '.join(f'{BATCH_FIELDS[field]} AS {field}' for field in fields)}
+                FROM activities a
+                LEFT JOIN activity_details d ON d.activity_id = a.activity_id
+                WHERE a.activity_id = %s
+            """, (activity_id,))
+            activity = cursor.fetchone()
+            cursor.close()
+            if not activity:
+                return jsonify({"success": False, "message": "Activity not found"}), 404
+            return jsonify({"success": True, "data": activity})
+
+        # Owner (and its cache generation) before reading the row; the commit ends the snapshot
+        cursor.execute("SELECT user_id FROM activities WHERE activity_id = %s", (activity_id,))
+        owner = cursor.fetchone()
+        if not owner:
+            cursor.close()
+            return jsonify({"success": False, "message": "Activity not found"}), 404
+        generation = cache.generation(owner["user_id"])
+        conn.commit()
+
         cursor.execute("SELECT * FROM activities WHERE activity_id = %s", (activity_id,))
         activity = cursor.fetchone()
 
@@ -342,11 +454,236 @@ def get_activity():
         cursor.close()
 
         if details:
+            details.pop("polyline_bin", None)  # the binary form is served by /routes
             activity.update(details)
 
+        cache.set(cache_key, activity["user_id"], activity, generation)
         return jsonify({"success": True, "data": activity})
 
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
     finally:
         conn.close()
+
+
+@strava_bp.route("/get_activity_batch", methods=["POST"])
+def get_activity_batch():
+    """
+    Vraća detalje više aktivnosti korisnika jednim upitom (activities LEFT JOIN activity_details).
+    Body zahteva JSON:
+    {
+        "user_id": 1,
+        "activity_ids": [123, 124],
+        "fields": ["activity_id", "activity_name", "distance", "date"]
+    }
+    Bez `fields` vraćaju se sva polja kao iz /get_activity; liste mogu da
+    izostave teška polja kao polyline. Najviše BATCH_MAX_IDS aktivnosti po
+    pozivu. `data` je u redosledu `activity_ids`, a `missing` su id-jevi koji
+    ne postoje ili ne pripadaju korisniku.
+    """
+    data = request.get_json()
+    if not data or not data.get("user_id"):
+        return jsonify({"success": False, "message": "Missing user_id"}), 400
+
+    user_id = data["user_id"]
+    try:
+        activity_ids = list(dict.fromkeys(int(activity_id) for activity_id in data.get("activity_ids") or []))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Invalid activity_ids"}), 400
+    if not activity_ids:
+        return jsonify({"success": False, "message": "Missing activity_ids"}), 400
+    if len(activity_ids) > BATCH_MAX_IDS:
+        return jsonify({"success": False, "message": f"At most {BATCH_MAX_IDS} activity_ids per request"}), 400
+
+    fields, error = _requested_fields(data, BATCH_FIELDS)
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+    fields = fields or list(BATCH_FIELDS)
+    full = set(fields) == set(BATCH_FIELDS)
+
+    # The cache holds whole BATCH_FIELDS rows and the fields are picked from them. The key
+    # differs from /get_activity's because the rows have a different shape.
+    cache = get_cache()
+    found, missing = {}, []
+    for activity_id in activity_ids:
+        cached = cache.get(f"activity_batch:{activity_id}", user_id)
+        if cached is not None:
+            found[activity_id] = {field: cached.get(field) for field in fields}
+        else:
+            missing.append(activity_id)
+
+    if missing:
+        generation = cache.generation(user_id)
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"success": False, "message": "Database connection failed."}), 500
+        selected = list(dict.fromkeys(["activity_id", *fields]))
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"""
+                SELECT {', '.join(f'{BATCH_FIELDS[field]} AS {field}' for field in selected)}
+                FROM activities a
+                LEFT JOIN activity_details d ON d.activity_id = a.activity_id
+                WHERE a.user_id = %s AND a.activity_id IN ({', '.join(['%s'] * len(missing))})
+            """, [user_id, *missing])
+            rows = cursor.fetchall()
+        except Exception as e:
+            return jsonify({"success": False, "message": str(e)}), 500
+        finally:
+            cursor.close()
+            conn.close()
+
+        for row in rows:
+            if full:
+                cache.set(f"activity_batch:{row['activity_id']}", user_id, row, generation)
+            found[row["activity_id"]] = {field: row[field] for field in fields}
+
+    return jsonify({
+        "success": True,
+        "data": [found[activity_id] for activity_id in activity_ids if activity_id in found],
+        "missing": [activity_id for activity_id in activity_ids if activity_id not in found],
+    })
+
+
+@strava_bp.route("/routes", methods=["POST"])
+def get_routes():
+    """
+    Vraća pojednostavljene rute (za mape i sličice u listi) za jednu ili više aktivnosti.
+    Body zahteva JSON:
+    {
+        "user_id": 1,
+        "activity_ids": [123, 124],
+        "zoom": 12,
+        "format": "coords"
+    }
+    Ruta se pojednostavljuje (Douglas-Peucker) sa tolerancijom od jednog piksela
+    na datom zoom nivou (0-20, podrazumevano 12). `format` je "coords"
+    ([[lat, lng], ...]) ili "polyline" (Google encoded polyline).
+    Rezultat je keširan po (aktivnost, zoom). Najviše ROUTES_MAX_IDS aktivnosti po
+    pozivu; više od toga ili nepoznat `format` vraća 400.
+    """
+    data = request.get_json()
+    if not data or not data.get("user_id"):
+        return jsonify({"success": False, "message": "Missing user_id"}), 400
+
+    user_id = data["user_id"]
+    activity_ids = data.get("activity_ids") or ([data["activity_id"]] if "activity_id" in data else [])
+    try:
+        activity_ids = [int(activity_id) for activity_id in activity_ids]
+        zoom = min(max(int(data.get("zoom", 12)), 0), 20)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "Invalid activity_ids or zoom"}), 400
+    output = data.get("format", "coords")
+    if output not in ("coords", "polyline"):
+        return jsonify({"success": False, "message": "format must be coords or polyline"}), 400
+    if not activity_ids:
+        return jsonify({"success": False, "message": "Missing activity_ids"}), 400
+    if len(activity_ids) > ROUTES_MAX_IDS:
+        return jsonify({"success": False, "message": f"At most {ROUTES_MAX_IDS} activity_ids per request"}), 400
+
+    cache = get_cache()
+    routes, missing = {}, []
+    for activity_id in activity_ids:
+        cached = cache.get(f"route:{activity_id}:{zoom}", user_id)
+        if cached is not None:
+            routes[activity_id] = cached
+        else:
+            missing.append(activity_id)
+
+    if missing:
+        generation = cache.generation(user_id)
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"success": False, "message": "Database connection failed."}), 500
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT d.activity_id, d.polyline_bin, d.polyline
+                FROM activities a
+                JOIN activity_details d ON d.activity_id = a.activity_id
+                WHERE a.user_id = %s AND a.activity_id IN ({', '.join(['%s'] * len(missing))})
+            """, [user_id, *missing])
+            rows = cursor.fetchall()
+        except Exception as e:
+            return jsonify({"success": False, "message": str(e)}), 500
+        finally:
+            cursor.close()
+            conn.close()
+
+        tolerance = polyline_codec.zoom_tolerance(zoom)
+        for activity_id, packed, encoded in rows:
+            try:
+                coords = polyline_codec.from_binary(packed) if packed else polyline_codec.decode(encoded)
+            except (IndexError, ValueError, OverflowError):
+                continue  # invalid polyline; the activity is returned without a route
+            simplified = polyline_codec.simplify(coords, tolerance)
+            cache.set(f"route:{activity_id}:{zoom}", user_id, simplified, generation)
+            routes[activity_id] = simplified
+
+    result = {}
+    for activity_id in activity_ids:
+        if activity_id in routes:
+            coords = routes[activity_id]
+            result[str(activity_id)] = polyline_codec.encode(coords) if output == "polyline" \
+                else polyline_codec.to_latlng(coords)
+    return jsonify({"success": True, "zoom": zoom, "data": result})
+
+
+@strava_bp.route("/streams", methods=["POST"])
+def get_streams():
+    """
+    Vraća Strava streamove (time, distance, heartrate, watts, cadence, altitude, latlng) jedne aktivnosti.
+    Body zahteva JSON:
+    {
+        "user_id": 1,
+        "activity_id": 123,
+        "keys": ["time", "heartrate"]
+    }
+    Ako streamovi još nisu sačuvani, povlače se sa Strave i čuvaju kolonski.
+    """
+    data = request.get_json()
+    if not data or not data.get("user_id") or "activity_id" not in data:
+        return jsonify({"success": False, "message": "Missing user_id or activity_id"}), 400
+
+    user_id = data["user_id"]
+    try:
+        activity_id = int(data["activity_id"])
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "activity_id must be an integer"}), 400
+    keys = [key for key in data.get("keys") or STREAM_KEYS if key in STREAM_KEYS]
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"success": False, "message": "Database connection failed."}), 500
+    cursor = conn.cursor()
+    try:
+        # Ownership is checked before reading from disk
+        cursor.execute("SELECT stravaActivityID FROM activities WHERE activity_id = %s AND user_id = %s",
+                       (activity_id, user_id))
+        row = cursor.fetchone()
+        if not row:
+            return jsonify({"success": False, "message": "Activity not found"}), 404
+
+        streams = load_streams(activity_id, keys, mmap=False)
+        if not streams:
+            if not row[0]:
+                return jsonify({"success": False, "message": "Activity has no Strava streams"}), 404
+            client = get_strava_client()
+            access_token = get_user_access_token(conn, user_id, client)
+            ingest_streams(conn, client, access_token, [(activity_id, row[0])])
+            streams = load_streams(activity_id, keys, mmap=False)
+    except StravaTokenError as e:
+        return jsonify({"success": False, "message": str(e), "error": e.error}), e.status_code or 502
+    except RateLimitExceeded as e:
+        return jsonify({"success": False, "message": str(e)}), 429, {"Retry-After": str(e.retry_after or 60)}
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    return jsonify({
+        "success": True,
+        "activity_id": activity_id,
+        "data": {key: stream_to_list(key, values) for key, values in streams.items()}
+    })
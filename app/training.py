@@ -0,0 +1,147 @@
+from datetime import date
+
+from flask import Blueprint, request, jsonify
+
+from app.utils.database import get_db_connection
+from app.utils.rollups import PERIODS, ROLLUP_COLUMNS, get_rollups
+from app.utils.sports import SPORTS
+from app.utils.training_load import get_training_load
+
+training_bp = Blueprint('training', __name__, url_prefix='/api')
+
+
+def _date_range():
+    from_date = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+    to_date = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+    return from_date, to_date
+
+
+@training_bp.route('/training-load', methods=['GET'])
+def training_load():
+    """
+    Vraća dnevni fitness (CTL), umor (ATL) i formu (TSB) korisnika.
+    ---
+    tags:
+      - Training
+    parameters:
+      - name: user_id
+        in: query
+        type: integer
+        required: true
+      - name: from
+        in: query
+        type: string
+        format: date
+        description: Prvi dan (YYYY-MM-DD), podrazumevano ceo period.
+      - name: to
+        in: query
+        type: string
+        format: date
+        description: Poslednji dan (YYYY-MM-DD).
+    responses:
+      200:
+        description: Dnevni redovi sa stress, ctl, atl i tsb, od najstarijeg.
+      400:
+        description: Nedostaje user_id ili je datum neispravan.
+    """
+    user_id = request.args.get('user_id', type=int)
+    if not user_id:
+        return jsonify({"success": False, "message": "Missing user_id"}), 400
+    try:
+        from_date, to_date = _date_range()
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"success": False, "message": "Database connection failed."}), 500
+    try:
+        rows = get_training_load(conn, user_id, from_date, to_date)
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        conn.close()
+
+    data = [{
+        "day": row["day"].isoformat(),
+        "stress": round(row["stress"], 1),
+        "ctl": round(row["ctl"], 1),
+        "atl": round(row["atl"], 1),
+        "tsb": round(row["tsb"], 1),
+    } for row in rows]
+    return jsonify({"success": True, "user_id": user_id, "count": len(data), "data": data})
+
+
+@training_bp.route('/volume', methods=['GET'])
+def volume_summary():
+    """
+    Nedeljni ili mesečni obim treninga po sportu (broj, distanca, trajanje, uspon, kalorije).
+    Čita samo activity_rollups, koje održava sinhronizacija.
+    ---
+    tags:
+      - Training
+    parameters:
+      - name: user_id
+        in: query
+        type: integer
+        required: true
+      - name: period
+        in: query
+        type: string
+        enum: [week, month]
+        default: week
+      - name: from
+        in: query
+        type: string
+        format: date
+        description: Uključuje period koji sadrži ovaj dan.
+      - name: to
+        in: query
+        type: string
+        format: date
+      - name: sport
+        in: query
+        type: string
+        description: Zarezom odvojeni sportovi (swim, bike, run, other), podrazumevano svi.
+    responses:
+      200:
+        description: Jedan red po periodu, sa totalima po sportu i ukupno.
+      400:
+        description: Neispravan user_id, period, sport ili datum.
+    """
+    user_id = request.args.get('user_id', type=int)
+    period = request.args.get('period', 'week')
+    sports = [sport for sport in request.args.get('sport', '').split(',') if sport]
+    if not user_id:
+        return jsonify({"success": False, "message": "Missing user_id"}), 400
+    if period not in PERIODS:
+        return jsonify({"success": False, "message": "period must be week or month"}), 400
+    if any(sport not in SPORTS for sport in sports):
+        return jsonify({"success": False, "message": f"sport must be one of {', '.join(SPORTS)}"}), 400
+    try:
+        from_date, to_date = _date_range()
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"success": False, "message": "Database connection failed."}), 500
+    try:
+        rows = get_rollups(conn, user_id, period, from_date, to_date, sports)
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+    finally:
+        conn.close()
+
+    periods = {}
+    for row in rows:
+        entry = periods.setdefault(row["period_start"], {
+            "period_start": row["period_start"].isoformat(),
+            "sports": {},
+            "total": dict.fromkeys(ROLLUP_COLUMNS, 0),
+        })
+        totals = {column: row[column] for column in ROLLUP_COLUMNS}
+        entry["sports"][row["sport"]] = totals
+        for column, value in totals.items():
+            entry["total"][column] += value
+    return jsonify({"success": True, "user_id": user_id, "period": period, "data": list(periods.values())})
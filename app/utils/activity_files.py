@@ -0,0 +1,421 @@
+import gzip
+import hashlib
+import io
+import struct
+import xml.etree.ElementTree as ET
+from array import array
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.utils import polyline as polyline_codec
+
+IMPORT_SUFFIXES = (".gpx", ".tcx", ".fit")
+# Imported routes are simplified to about a metre, like Strava's summary_polyline.
+IMPORT_ROUTE_ZOOM = 14
+# Segments slower than this count as stopped when deriving moving time from track points.
+MOVING_SPEED = 0.5  # m/s
+EARTH_RADIUS = 6371008.8  # m
+
+# File sport names -> Strava activity types (so app/utils/sports.py groups them).
+SPORT_NAMES = {
+    "running": "Run", "run": "Run", "trail_running": "TrailRun", "treadmill": "Run",
+    "cycling": "Ride", "biking": "Ride", "bike": "Ride", "road_biking": "Ride", "mountain_biking": "MountainBikeRide",
+    "indoor_cycling": "VirtualRide", "swimming": "Swim", "swim": "Swim", "open_water": "Swim",
+    "lap_swimming": "Swim", "walking": "Walk", "walk": "Walk", "hiking": "Hike", "hike": "Hike",
+}
+# FIT `sport` enum values used by the session message.
+FIT_SPORTS = {1: "Run", 2: "Ride", 5: "Swim", 11: "Walk", 17: "Hike"}
+
+
+def _activity_type(name):
+    return SPORT_NAMES.get((name or "").strip().lower().replace(" ", "_"), "Workout")
+
+
+def _parse_time(text):
+    value = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _utc_offset(text):
+    """Seconds east of UTC for a timestamp written with a numeric offset; None for Z or naive times."""
+    text = text.strip()
+    if text.endswith("Z"):
+        return None
+    offset = datetime.fromisoformat(text).utcoffset()
+    return int(offset.total_seconds()) if offset is not None else None
+
+
+def local_date(activity):
+    """
+    The activity's calendar day where it took place, as Strava stores it
+    (start_date_local). Files that only carry UTC times (most GPX/TCX
+    exports) fall back to the UTC date, which can differ by a day.
+    """
+    offset = activity.get("utc_offset")
+    start_time = activity["start_time"]
+    return (start_time + timedelta(seconds=offset)).date() if offset is not None else start_time.date()
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _summarize_points(times, lats, lngs, elevations, heart_rates, watts, cadences):
+    """
+    Activity totals from track points (lists of equal length, None where a
+    value is missing), computed with NumPy: haversine distance, moving time,
+    positive elevation gain and heart rate / power / cadence averages.
+    """
+    summary = {}
+    seconds = np.array([(t - times[0]).total_seconds() for t in times]) if times else np.zeros(0)
+    lat = np.radians(np.array(lats, dtype=float))
+    lng = np.radians(np.array(lngs, dtype=float))
+
+    distance, moving_time, max_speed = 0.0, None, None
+    if len(lat) > 1:
+        a = (np.sin(np.diff(lat) / 2) ** 2
+             + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2)
+        step = np.nan_to_num(2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+        distance = float(step.sum())
+        if len(seconds) == len(lat):
+            dt = np.diff(seconds)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                speed = np.where(dt > 0, step / dt, 0.0)
+            moving_time = float(dt[speed >= MOVING_SPEED].sum())
+            max_speed = float(speed.max()) if len(speed) and distance else None
+
+    elapsed = float(seconds[-1]) if len(seconds) else 0.0
+    summary["duration"] = int(round(moving_time if moving_time else elapsed))
+    summary["distance"] = distance
+    summary["max_speed"] = max_speed
+
+    elevation = np.array(elevations, dtype=float)
+    elevation = elevation[~np.isnan(elevation)]
+    summary["elevation_gain"] = float(np.clip(np.diff(elevation), 0, None).sum()) if len(elevation) > 1 else 0.0
+
+    for key, values in (("heart_rate", heart_rates), ("watts", watts), ("cadence", cadences)):
+        column = np.array(values, dtype=float)
+        column = column[~np.isnan(column)]
+        summary[f"{key}_avg"] = float(column.mean()) if len(column) else None
+        summary[f"{key}_max"] = float(column.max()) if len(column) else None
+    return summary
+
+
+def _route(lats, lngs):
+    coords = array("i")
+    for lat, lng in zip(lats, lngs):
+        if lat is not None and lng is not None:
+            coords.append(round(lat * polyline_codec.SCALE))
+            coords.append(round(lng * polyline_codec.SCALE))
+    return coords
+
+
+def _activity(start_time, activity_type, summary, coords, **overrides):
+    activity = {
+        "start_time": start_time,
+        "activity_type": activity_type,
+        "duration": summary["duration"],
+        "distance": summary["distance"],
+        "elevation_gain": summary["elevation_gain"],
+        "calories": None,
+        "heart_rate_avg": summary["heart_rate_avg"],
+        "heart_rate_max": summary["heart_rate_max"],
+        "average_watts": summary["watts_avg"],
+        "max_watts": summary["watts_max"],
+        "average_cadence": summary["cadence_avg"],
+        "max_speed": summary["max_speed"],
+        "coords": coords,
+    }
+    activity.update({key: value for key, value in overrides.items() if value is not None})
+    return activity
+
+
+def _iter_points(data, point_tag):
+    """Yields (point element, enclosing sport/type text) while parsing, clearing each point after use."""
+    sport = None
+    for event, elem in ET.iterparse(io.BytesIO(data), events=("start", "end")):
+        name = _local_name(elem.tag)
+        if event == "start":
+            if name == "Activity":
+                sport = elem.get("Sport")
+            continue
+        if name == "type" and elem.text:
+            sport = elem.text
+        elif name == point_tag:
+            yield elem, sport
+            elem.clear()
+
+
+def _child_values(elem):
+    """{local tag name: text} for all descendants of a track point (hr, power, cad, ele, ...)."""
+    return {_local_name(child.tag): child.text for child in elem.iter() if child is not elem and child.text}
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_gpx(data):
+    times, lats, lngs, elevations, heart_rates, watts, cadences = [], [], [], [], [], [], []
+    sport, utc_offset = None, None
+    for point, point_sport in _iter_points(data, "trkpt"):
+        sport = point_sport or sport
+        values = _child_values(point)
+        if "time" not in values:
+            continue
+        if not times:
+            utc_offset = _utc_offset(values["time"])
+        times.append(_parse_time(values["time"]))
+        lats.append(_float(point.get("lat")))
+        lngs.append(_float(point.get("lon")))
+        elevations.append(_float(values.get("ele")))
+        heart_rates.append(_float(values.get("hr")))
+        watts.append(_float(values.get("power") or values.get("PowerInWatts")))
+        cadences.append(_float(values.get("cad")))
+    if not times:
+        return []
+    summary = _summarize_points(times, lats, lngs, elevations, heart_rates, watts, cadences)
+    return [_activity(times[0], _activity_type(sport), summary, _route(lats, lngs), utc_offset=utc_offset)]
+
+
+def parse_tcx(data):
+    times, lats, lngs, elevations, heart_rates, watts, cadences = [], [], [], [], [], [], []
+    sport, last_distance, utc_offset = None, None, None
+    for point, point_sport in _iter_points(data, "Trackpoint"):
+        sport = point_sport or sport
+        values = _child_values(point)
+        if "Time" not in values:
+            continue
+        if not times:
+            utc_offset = _utc_offset(values["Time"])
+        last_distance = _float(values.get("DistanceMeters")) or last_distance
+        times.append(_parse_time(values["Time"]))
+        lats.append(_float(values.get("LatitudeDegrees")))
+        lngs.append(_float(values.get("LongitudeDegrees")))
+        elevations.append(_float(values.get("AltitudeMeters")))
+        heart_rates.append(_float(values.get("Value")))  # HeartRateBpm/Value
+        watts.append(_float(values.get("Watts")))
+        cadences.append(_float(values.get("Cadence") or values.get("RunCadence")))
+    if not times:
+        return []
+    summary = _summarize_points(times, lats, lngs, elevations, heart_rates, watts, cadences)
+    # Without GPS (treadmill, pool) the distance comes from the last point's DistanceMeters
+    distance = None if summary["distance"] else last_distance
+    return [_activity(times[0], _activity_type(sport), summary, _route(lats, lngs), distance=distance,
+                      utc_offset=utc_offset)]
+
+
+# --- FIT -------------------------------------------------------------------
+
+FIT_EPOCH = datetime(1989, 12, 31)
+SEMICIRCLE_TO_SCALED = 180.0 / 2 ** 31 * polyline_codec.SCALE
+# base type -> (struct code, size, invalid value)
+FIT_BASE_TYPES = {
+    0x00: ("B", 1, 0xFF), 0x01: ("b", 1, 0x7F), 0x02: ("B", 1, 0xFF), 0x83: ("h", 2, 0x7FFF),
+    0x84: ("H", 2, 0xFFFF), 0x85: ("i", 4, 0x7FFFFFFF), 0x86: ("I", 4, 0xFFFFFFFF), 0x88: ("f", 4, None),
+    0x89: ("d", 8, None), 0x0A: ("B", 1, 0), 0x8B: ("H", 2, 0), 0x8C: ("I", 4, 0), 0x0D: ("B", 1, 0xFF),
+    0x8E: ("q", 8, 0x7FFFFFFFFFFFFFFF), 0x8F: ("Q", 8, 0xFFFFFFFFFFFFFFFF), 0x90: ("Q", 8, 0),
+}
+FIT_SESSION, FIT_RECORD, FIT_ACTIVITY = 18, 20, 34
+FIT_TIMESTAMP_FIELD = 253
+FIT_ACTIVITY_LOCAL_TIMESTAMP = 5
+# record fields kept for the route
+FIT_RECORD_LAT, FIT_RECORD_LNG = 0, 1
+
+
+class _FitDefinition:
+    """A local message definition compiled into one struct.Struct."""
+
+    __slots__ = ("global_number", "struct", "index", "invalid", "timestamp_offset", "timestamp_struct")
+
+    def __init__(self, global_number, little_endian, fields, developer_size):
+        self.global_number = global_number
+        endian = "<" if little_endian else ">"
+        codes, self.index, self.invalid = [], {}, []
+        self.timestamp_offset, offset = None, 0
+        for number, size, base_type in fields:
+            code, base_size, invalid = FIT_BASE_TYPES.get(base_type, ("s", 1, None))
+            if code == "s" or size != base_size:
+                codes.append(f"{size}s")  # strings and arrays are not decoded
+                invalid = None
+            else:
+                codes.append(code)
+                if number == FIT_TIMESTAMP_FIELD:
+                    self.timestamp_offset = offset
+            self.index[number] = len(self.invalid)
+            self.invalid.append(invalid)
+            offset += size
+        if developer_size:
+            codes.append(f"{developer_size}x")
+        self.struct = struct.Struct(endian + "".join(codes))
+        self.timestamp_struct = struct.Struct(endian + "I")
+
+
+def _fit_messages(data):
+    """
+    Streams (global message number, definition, values, timestamp) for the
+    session, record and activity messages of a FIT file.
+
+    Every local definition is compiled once into a struct.Struct and data
+    messages are unpacked in place with unpack_from, so the file is never
+    sliced; messages we do not need are skipped by size without decoding.
+    """
+    header_size = data[0]
+    if len(data) < 12 or data[8:12] != b".FIT":
+        raise ValueError("Not a FIT file")
+    data_size = struct.unpack_from("<I", data, 4)[0]
+    end = min(header_size + data_size, len(data))
+    pos = header_size
+    definitions = {}
+    last_timestamp = 0
+
+    while pos < end:
+        header = data[pos]
+        pos += 1
+        if header & 0x80:  # compressed timestamp header
+            local = (header >> 5) & 0x03
+            time_offset = header & 0x1F
+            timestamp = (last_timestamp & ~0x1F) + time_offset
+            if time_offset < (last_timestamp & 0x1F):
+                timestamp += 0x20
+            last_timestamp = timestamp
+        elif header & 0x40:  # definition message
+            local = header & 0x0F
+            little_endian = data[pos + 1] == 0
+            global_number = struct.unpack_from("<H" if little_endian else ">H", data, pos + 2)[0]
+            field_count = data[pos + 4]
+            pos += 5
+            fields = [(data[pos + 3 * i], data[pos + 3 * i + 1], data[pos + 3 * i + 2]) for i in range(field_count)]
+            pos += 3 * field_count
+            developer_size = 0
+            if header & 0x20:
+                developer_count = data[pos]
+                developer_size = sum(data[pos + 1 + 3 * i + 1] for i in range(developer_count))
+                pos += 1 + 3 * developer_count
+            definitions[local] = _FitDefinition(global_number, little_endian, fields, developer_size)
+            continue
+        else:
+            local = header & 0x0F
+            timestamp = None
+
+        definition = definitions.get(local)
+        if definition is None:
+            raise ValueError("FIT data message without a definition")
+        if timestamp is None and definition.timestamp_offset is not None:
+            timestamp = definition.timestamp_struct.unpack_from(data, pos + definition.timestamp_offset)[0]
+            last_timestamp = timestamp
+        if definition.global_number in (FIT_SESSION, FIT_RECORD, FIT_ACTIVITY):
+            values = definition.struct.unpack_from(data, pos)
+            yield definition.global_number, definition, values, timestamp
+        pos += definition.struct.size
+
+
+def _fit_field(definition, values, number, scale=1.0):
+    index = definition.index.get(number)
+    if index is None:
+        return None
+    value = values[index]
+    if isinstance(value, bytes) or value == definition.invalid[index]:
+        return None
+    return value / scale if scale != 1.0 else value
+
+
+def parse_fit(data):
+    """
+    Activities from a FIT file, one per session (a multisport triathlon file
+    gives the swim, bike and run separately). Each session's route is built
+    from the record messages that fall inside it. The activity message's
+    local_timestamp gives the local time offset.
+    """
+    sessions, utc_offset = [], None
+    record_times, record_lats, record_lngs = array("I"), array("i"), array("i")
+    for number, definition, values, timestamp in _fit_messages(data):
+        if number == FIT_RECORD:
+            lat = _fit_field(definition, values, FIT_RECORD_LAT)
+            lng = _fit_field(definition, values, FIT_RECORD_LNG)
+            if lat is not None and lng is not None and timestamp is not None:
+                record_times.append(timestamp)
+                record_lats.append(round(lat * SEMICIRCLE_TO_SCALED))
+                record_lngs.append(round(lng * SEMICIRCLE_TO_SCALED))
+            continue
+        if number == FIT_ACTIVITY:
+            local_timestamp = _fit_field(definition, values, FIT_ACTIVITY_LOCAL_TIMESTAMP)
+            if local_timestamp is not None and timestamp is not None \
+                    and abs(int(local_timestamp) - int(timestamp)) <= 14 * 3600:
+                utc_offset = int(local_timestamp) - int(timestamp)
+            continue
+
+        start = _fit_field(definition, values, 2)
+        elapsed = _fit_field(definition, values, 7, 1000.0)
+        if start is None:
+            continue
+        sessions.append({
+            "start": start,
+            "elapsed": elapsed or 0,
+            "activity_type": FIT_SPORTS.get(_fit_field(definition, values, 5), "Workout"),
+            "duration": int(round(_fit_field(definition, values, 8, 1000.0) or elapsed or 0)),
+            "distance": _fit_field(definition, values, 9, 100.0) or 0.0,
+            "elevation_gain": _fit_field(definition, values, 22) or 0.0,
+            "calories": _fit_field(definition, values, 11),
+            "heart_rate_avg": _fit_field(definition, values, 16),
+            "heart_rate_max": _fit_field(definition, values, 17),
+            "average_cadence": _fit_field(definition, values, 18),
+            "average_watts": _fit_field(definition, values, 20),
+            "max_watts": _fit_field(definition, values, 21),
+            "max_speed": _fit_field(definition, values, 125, 1000.0) or _fit_field(definition, values, 15, 1000.0),
+        })
+
+    times = np.frombuffer(record_times, dtype=np.uint32) if record_times else np.zeros(0, dtype=np.uint32)
+    activities = []
+    for session in sessions:
+        first = np.searchsorted(times, session["start"], side="left")
+        last = np.searchsorted(times, session["start"] + session["elapsed"], side="right")
+        coords = array("i")
+        for i in range(first, last):
+            coords.append(record_lats[i])
+            coords.append(record_lngs[i])
+        activity = {key: value for key, value in session.items() if key not in ("start", "elapsed")}
+        activity["start_time"] = FIT_EPOCH + timedelta(seconds=session["start"])
+        activity["coords"] = coords
+        if utc_offset is not None:
+            activity["utc_offset"] = utc_offset
+        activities.append(activity)
+    return activities
+
+
+PARSERS = {".gpx": parse_gpx, ".tcx": parse_tcx, ".fit": parse_fit}
+
+
+def parse_activity_file(name, data):
+    """
+    Parses one GPX, TCX or FIT file (optionally .gz compressed).
+
+    Returns a list of activity dicts ready for activity_store.imported_activity_row():
+    totals, the start time in UTC (and `utc_offset` in seconds when the file
+    records local time), the simplified route as an encoded and a
+    packed polyline, and an `external_id` derived from the file contents so the
+    same file imported twice maps to the same row.
+    """
+    lower = name.lower()
+    if lower.endswith(".gz"):
+        data = gzip.decompress(data)
+        lower = lower[:-3]
+    suffix = lower[lower.rfind("."):]
+    parser = PARSERS.get(suffix)
+    if parser is None:
+        raise ValueError(f"Unsupported file type: {name}")
+
+    digest = hashlib.sha1(data).hexdigest()
+    activities = parser(data)
+    for index, activity in enumerate(activities):
+        coords = polyline_codec.simplify(activity.pop("coords"), polyline_codec.zoom_tolerance(IMPORT_ROUTE_ZOOM))
+        activity["polyline"] = polyline_codec.encode(coords) if coords else None
+        activity["polyline_bin"] = polyline_codec.to_binary(coords) if coords else None
+        activity["external_id"] = digest if len(activities) == 1 else f"{digest}:{index}"
+    return activities
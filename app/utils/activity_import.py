@@ -0,0 +1,196 @@
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from app.utils.activity_files import IMPORT_SUFFIXES, local_date, parse_activity_file
+from app.utils.activity_store import imported_activity_row, upsert_activities
+from app.utils.strava_sync import update_derived_tables
+
+IMPORT_DIR = os.getenv("IMPORT_DIR", os.path.join("data", "imports"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 1024 ** 3))
+# Parser processes; 0 parses inline in the worker process.
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", os.cpu_count() or 2))
+IMPORT_POOL_START_METHOD = os.getenv("IMPORT_POOL_START_METHOD", "spawn")
+# Activities written (and progress reported) per batch.
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 200))
+# Files sent to a parser process at a time.
+IMPORT_MAP_CHUNK = 8
+# An imported activity is a duplicate of a stored one that started within this
+# many seconds and whose duration differs by at most IMPORT_DEDUP_DURATION
+# (fraction) or 60 seconds, whichever is larger.
+IMPORT_DEDUP_SECONDS = int(os.getenv("IMPORT_DEDUP_SECONDS", 120))
+IMPORT_DEDUP_DURATION = float(os.getenv("IMPORT_DEDUP_DURATION", 0.05))
+EPOCH = datetime(1970, 1, 1)  # start_time is naive UTC
+
+
+def archive_members(archive):
+    """Names of the activity files in the archive (also .gz compressed ones, as in Strava's bulk export)."""
+    members = []
+    for info in archive.infolist():
+        name = info.filename.lower()
+        if name.endswith(".gz"):
+            name = name[:-3]
+        if not info.is_dir() and name.endswith(IMPORT_SUFFIXES):
+            members.append(info.filename)
+    return members
+
+
+# These run inside the parser processes, which open the archive once each.
+_worker_archive = None
+
+
+def _init_worker(archive_path):
+    global _worker_archive
+    _worker_archive = zipfile.ZipFile(archive_path)
+
+
+def _parse_member(name):
+    """Returns (name, [activity, ...], error). Errors are returned, not raised, so one bad file skips only itself."""
+    try:
+        return name, parse_activity_file(name, _worker_archive.read(name)), None
+    except Exception as e:
+        return name, [], f"{type(e).__name__}: {e}"
+
+
+class _StoredActivities:
+    """
+    Start times and durations of stored activities, indexed by
+    IMPORT_DEDUP_SECONDS-wide start time buckets (and by day for rows written
+    before the start_time column existed), so each lookup checks only the
+    activities that started nearby.
+    """
+
+    def __init__(self):
+        self.by_bucket = {}
+        self.by_day = {}
+
+    @staticmethod
+    def _bucket(start_time):
+        return int((start_time - EPOCH).total_seconds()) // IMPORT_DEDUP_SECONDS
+
+    def add(self, start_time, day, duration):
+        if start_time is not None:
+            self.by_bucket.setdefault(self._bucket(start_time), []).append((start_time, duration or 0))
+        else:
+            self.by_day.setdefault(str(day)[:10], []).append(duration or 0)
+
+    def contains(self, activity):
+        tolerance = max(60, activity["duration"] * IMPORT_DEDUP_DURATION)
+        bucket = self._bucket(activity["start_time"])
+        for nearby in (bucket - 1, bucket, bucket + 1):
+            for start_time, duration in self.by_bucket.get(nearby, ()):
+                if abs(duration - activity["duration"]) <= tolerance \
+                        and abs((start_time - activity["start_time"]).total_seconds()) <= IMPORT_DEDUP_SECONDS:
+                    return True
+        # Activities written before the start_time column have only a date
+        return any(abs(duration - activity["duration"]) <= tolerance
+                   for duration in self.by_day.get(local_date(activity).isoformat(), ()))
+
+
+def _drop_duplicates(conn, user_id, activities):
+    """
+    Leaves out activities that are already stored (by start time and duration)
+    or appear twice in the batch. Existing activities around the batch are
+    read with one range query, so batches should cover a short time span
+    (import_archive() writes activities in start time order).
+    """
+    first = min(local_date(activity) for activity in activities) - timedelta(days=1)
+    last = max(local_date(activity) for activity in activities) + timedelta(days=1)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT start_time, date, duration FROM activities
+            WHERE user_id = %s AND date BETWEEN %s AND %s
+        """, (user_id, first, last))
+        stored = _StoredActivities()
+        for start_time, day, duration in cursor.fetchall():
+            stored.add(start_time, day, duration)
+    finally:
+        cursor.close()
+
+    fresh = []
+    for activity in activities:
+        if stored.contains(activity):
+            continue
+        fresh.append(activity)
+        stored.add(activity["start_time"], None, activity["duration"])
+    return fresh
+
+
+def import_archive(conn, user_id, archive_path, progress=None):
+    """
+    Imports every GPX/TCX/FIT file of a zip archive as the user's activities.
+
+    Files are parsed on a pool of IMPORT_WORKERS processes, each of which
+    opens the archive once and reads its own members. Archive order is
+    arbitrary, so all parsed activities are sorted by start time first; they
+    are then deduplicated against stored ones and written IMPORT_BATCH_SIZE at
+    a time with the same batched upsert the Strava sync uses, each batch
+    reading only the stored activities of its own time span.
+    `progress(files_parsed, activities_written, errors)` is called every
+    IMPORT_BATCH_SIZE files while parsing and after every written batch.
+    Training load and rollups are updated once at the end.
+
+    Returns a dict with the counters.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        members = archive_members(archive)
+
+    files_parsed, written, skipped, errors = 0, 0, 0, 0
+    first_day, last_day = None, None
+    parsed = []
+
+    executor = None
+    if IMPORT_WORKERS > 0:
+        executor = ProcessPoolExecutor(
+            max_workers=IMPORT_WORKERS,
+            mp_context=multiprocessing.get_context(IMPORT_POOL_START_METHOD),
+            initializer=_init_worker,
+            initargs=(archive_path,)
+        )
+        results = executor.map(_parse_member, members, chunksize=IMPORT_MAP_CHUNK)
+    else:
+        _init_worker(archive_path)
+        results = map(_parse_member, members)
+
+    try:
+        for name, activities, error in results:
+            files_parsed += 1
+            if error:
+                errors += 1
+                print(f"[IMPORT ERROR] {name}: {error}")
+            parsed.extend(activities)
+            if progress and files_parsed % IMPORT_BATCH_SIZE == 0:
+                progress(files_parsed, written, errors)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    parsed.sort(key=lambda activity: activity["start_time"])
+    for start in range(0, len(parsed), IMPORT_BATCH_SIZE):
+        batch = parsed[start:start + IMPORT_BATCH_SIZE]
+        fresh = _drop_duplicates(conn, user_id, batch)
+        skipped += len(batch) - len(fresh)
+        rows = [imported_activity_row(user_id, activity) for activity in fresh]
+        written += upsert_activities(conn, user_id, rows, "external_id")
+        for activity in fresh:
+            day = local_date(activity)
+            first_day = min(first_day or day, day)
+            last_day = max(last_day or day, day)
+        if progress:
+            progress(files_parsed, written, errors)
+    if progress and not parsed:
+        progress(files_parsed, written, errors)
+
+    if first_day:
+        update_derived_tables(conn, user_id, first_day, last_day)
+
+    return {
+        "files": len(members),
+        "files_parsed": files_parsed,
+        "activities_written": written,
+        "duplicates_skipped": skipped,
+        "errors": errors,
+    }
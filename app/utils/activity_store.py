@@ -0,0 +1,256 @@
+import os
+
+import click
+
+from app.utils import polyline as polyline_codec
+from app.utils.activity_files import local_date
+from app.utils.cache import get_cache
+from app.utils.database import get_db_connection
+
+ACTIVITY_WRITE_CHUNK = int(os.getenv("ACTIVITY_WRITE_CHUNK", 200))
+
+ACTIVITY_COLUMNS = (
+    "user_id", "stravaActivityID", "activity_type", "activity_name", "distance", "duration", "pace", "speed",
+    "calories_burned", "heart_rate_avg", "heart_rate_max", "elevation_gain", "date", "location_city",
+    "location_country", "start_time", "external_id",
+)
+# Position of the activity day in a strava_activity_row() tuple.
+ACTIVITY_DATE_INDEX = ACTIVITY_COLUMNS.index("date")
+ACTIVITY_UPDATE_COLUMNS = (
+    "activity_type", "activity_name", "distance", "duration", "pace", "speed", "calories_burned", "heart_rate_avg",
+    "heart_rate_max", "elevation_gain", "date", "location_city", "location_country", "start_time",
+)
+DETAIL_COLUMNS = (
+    "activity_id", "max_speed", "average_cadence", "average_watts", "max_watts", "kilojoules", "calories",
+    "gear_name", "device_name", "polyline", "polyline_bin",
+)
+DETAIL_UPDATE_COLUMNS = DETAIL_COLUMNS[1:]
+# Filled from the detail JSON; a row written without details (the fetch failed)
+# keeps the stored values instead of overwriting them with NULL.
+ACTIVITY_DETAIL_COLUMNS = ("calories_burned", "location_city", "location_country")
+
+
+def _upsert_sql(table, columns, update_columns, row_count, keep_columns=()):
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    updates = ",\n    ".join(
+        f"{column} = COALESCE(VALUES({column}), {column})" if column in keep_columns
+        else f"{column} = VALUES({column})"
+        for column in update_columns
+    )
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)})\n"
+        f"VALUES {', '.join([placeholders] * row_count)}\n"
+        f"ON DUPLICATE KEY UPDATE\n    {updates}"
+    )
+
+
+def pack_polyline(encoded, activity=None):
+    """Packed binary form of an encoded polyline, or None if it is empty or malformed."""
+    if not encoded:
+        return None
+    try:
+        return polyline_codec.to_binary(polyline_codec.decode(encoded))
+    except (IndexError, ValueError, OverflowError) as e:
+        print(f"[POLYLINE ERROR] activity {activity}: {e!r}")
+        return None
+
+
+def strava_activity_row(user_id, act, details=None):
+    """
+    Maps a Strava summary activity (and its optional detail JSON) to the
+    `activities` and `activity_details` column values.
+
+    Returns (activity_values, detail_values) where detail_values has no
+    activity_id yet; it is filled in once the local id is known. Without
+    `details`, detail_values is None and the stored details are left as they are.
+    """
+    location_city, location_country = None, None
+    gear_name, device_name, polyline = None, None, None
+    calories = act.get("calories", None)
+    if details:
+        location_city = details.get("location_city")
+        location_country = details.get("location_country")
+        gear_name = details.get("gear", {}).get("name") if details.get("gear") else None
+        device_name = details.get("device_name")
+        polyline = details.get("map", {}).get("summary_polyline")
+        calories = details.get("calories", None)
+
+    activity_values = (
+        user_id,
+        act.get("id"),
+        act.get("type", "Other"),
+        act.get("name"),
+        act.get("distance", 0.0),
+        act.get("moving_time", 0),
+        None,  # pace
+        act.get("average_speed", None),
+        calories,
+        act.get("average_heartrate", None),
+        act.get("max_heartrate", None),
+        act.get("total_elevation_gain", 0.0),
+        act.get("start_date_local", "").split("T")[0],
+        location_city,
+        location_country,
+        (act.get("start_date") or "").replace("T", " ").rstrip("Z") or None,
+        None,  # external_id
+    )
+    if not details:
+        return activity_values, None
+    detail_values = (
+        act.get("max_speed"),
+        act.get("average_cadence"),
+        act.get("average_watts"),
+        act.get("max_watts"),
+        act.get("kilojoules"),
+        calories,
+        gear_name,
+        device_name,
+        polyline,
+        pack_polyline(polyline, act.get("id")),
+    )
+    return activity_values, detail_values
+
+
+def imported_activity_row(user_id, parsed):
+    """
+    Maps an activity parsed from a GPX/TCX/FIT file (see activity_files.py) to
+    the same (activity_values, detail_values) shape as strava_activity_row().
+    """
+    duration = parsed["duration"]
+    distance = parsed["distance"]
+    activity_values = (
+        user_id,
+        None,  # stravaActivityID
+        parsed["activity_type"],
+        f"{parsed['activity_type']} {parsed['start_time']:%Y-%m-%d %H:%M}",
+        distance,
+        duration,
+        None,  # pace
+        distance / duration if duration and distance else None,
+        parsed["calories"],
+        parsed["heart_rate_avg"],
+        parsed["heart_rate_max"],
+        parsed["elevation_gain"],
+        local_date(parsed).isoformat(),
+        None,
+        None,
+        parsed["start_time"].strftime("%Y-%m-%d %H:%M:%S"),
+        parsed["external_id"],
+    )
+    detail_values = (
+        parsed["max_speed"],
+        parsed["average_cadence"],
+        parsed["average_watts"],
+        parsed["max_watts"],
+        None,  # kilojoules
+        parsed["calories"],
+        None,  # gear_name
+        None,  # device_name
+        parsed["polyline"],
+        parsed["polyline_bin"],
+    )
+    return activity_values, detail_values
+
+
+def upsert_strava_activities(conn, user_id, rows, chunk_size=ACTIVITY_WRITE_CHUNK, resolved_ids=None):
+    """Writes synced activities, matched on stravaActivityID. See upsert_activities()."""
+    return upsert_activities(conn, user_id, rows, "stravaActivityID", chunk_size, resolved_ids)
+
+
+def upsert_activities(conn, user_id, rows, key_column, chunk_size=ACTIVITY_WRITE_CHUNK, resolved_ids=None):
+    """
+    Writes activities in chunks of `chunk_size`, matched on `key_column`
+    (stravaActivityID for synced activities, external_id for imported files).
+
+    Each chunk is one multi-row upsert into `activities`, one query resolving
+    the local activity ids, one multi-row upsert into `activity_details` and a
+    single commit, so the number of round trips grows with the number of
+    chunks rather than the number of activities.
+
+    `rows` is a list of (activity_values, detail_values) as returned by
+    strava_activity_row() or imported_activity_row(); rows whose
+    detail_values is None only write `activities`. Returns the number of activities written. The
+    user's cached activity reads are invalidated after every committed chunk.
+    If `resolved_ids` is a dict, it is filled with key -> activity_id.
+    """
+    key_index = ACTIVITY_COLUMNS.index(key_column)
+    cursor = conn.cursor()
+    written = 0
+    try:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+
+            cursor.execute(
+                _upsert_sql("activities", ACTIVITY_COLUMNS, ACTIVITY_UPDATE_COLUMNS, len(chunk),
+                            keep_columns=ACTIVITY_DETAIL_COLUMNS),
+                [value for activity_values, _ in chunk for value in activity_values]
+            )
+
+            keys = [activity_values[key_index] for activity_values, _ in chunk]
+            cursor.execute(
+                f"SELECT {key_column}, activity_id FROM activities "
+                f"WHERE user_id = %s AND {key_column} IN ({', '.join(['%s'] * len(keys))})",
+                [user_id, *keys]
+            )
+            local_ids = dict(cursor.fetchall())
+            if resolved_ids is not None:
+                resolved_ids.update(local_ids)
+
+            detail_rows = [
+                (local_ids[activity_values[key_index]], *detail_values)
+                for activity_values, detail_values in chunk
+                if detail_values is not None and activity_values[key_index] in local_ids
+            ]
+            if detail_rows:
+                cursor.execute(
+                    _upsert_sql("activity_details", DETAIL_COLUMNS, DETAIL_UPDATE_COLUMNS, len(detail_rows)),
+                    [value for row in detail_rows for value in row]
+                )
+
+            conn.commit()
+            get_cache().invalidate_user(user_id)
+            written += len(chunk)
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+@click.command("backfill-polylines")
+@click.option("--batch-size", default=500, show_default=True)
+def backfill_polylines_command(batch_size):
+    """Fill activity_details.polyline_bin for rows synced before it existed."""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException("Database connection failed.")
+    cursor = conn.cursor()
+    total, last_id = 0, 0
+    try:
+        while True:
+            # By activity_id, so invalid polylines (left NULL) are not read again
+            cursor.execute("""
+                SELECT activity_id, polyline FROM activity_details
+                WHERE polyline IS NOT NULL AND polyline <> '' AND polyline_bin IS NULL AND activity_id > %s
+                ORDER BY activity_id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            packed = [(pack_polyline(encoded, activity_id), activity_id) for activity_id, encoded in rows]
+            packed = [row for row in packed if row[0] is not None]
+            if packed:
+                cursor.executemany("UPDATE activity_details SET polyline_bin = %s WHERE activity_id = %s", packed)
+                conn.commit()
+            total += len(packed)
+    finally:
+        cursor.close()
+        conn.close()
+    click.echo(f"Packed {total} polylines")
+
+
+def init_app(app):
+    app.cli.add_command(backfill_polylines_command)
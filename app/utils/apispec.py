@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+import click
+import flasgger
+from flask import current_app
+
+API_SPEC_FILE = os.getenv("API_SPEC_FILE", os.path.join("data", "apispec.json"))
+API_SPEC_ENDPOINT = "apispec_1"
+
+
+def spec_fingerprint(app):
+    """
+    Hash of everything the generated spec depends on (routes, view docstrings,
+    the Swagger template and the flasgger version). Computing it does not
+    parse any YAML, so checking a precomputed spec costs almost nothing.
+    """
+    digest = hashlib.sha1()
+    digest.update(flasgger.__version__.encode())
+    digest.update(json.dumps(app.swag.template, sort_keys=True, default=str).encode())
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: (rule.rule, rule.endpoint)):
+        view = app.view_functions.get(rule.endpoint)
+        doc = getattr(view, "__doc__", None) or ""
+        digest.update(f"{rule.rule} {sorted(rule.methods)} {rule.endpoint}\n{doc}\n".encode())
+    return digest.hexdigest()
+
+
+def build_apispec(app):
+    """Generates the spec (parsing every docstring) and keeps it in flasgger's per-process cache."""
+    with app.app_context():
+        return app.swag.get_apispecs(API_SPEC_ENDPOINT)
+
+
+def load_apispec(app, path=API_SPEC_FILE):
+    """
+    Puts a spec written by `flask build-apispec` into flasgger's cache, so
+    /apispec_1.json never parses docstrings in this process. Returns False
+    (and the spec is built lazily on the first request as before) when the
+    file is missing or was generated from different code.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        print(f"[APISPEC ERROR] {path}: {e}")
+        return False
+    if stored.get("fingerprint") != spec_fingerprint(app):
+        print(f"[APISPEC] {path} is out of date; run `flask build-apispec`")
+        return False
+    app.swag.apispecs[API_SPEC_ENDPOINT] = stored["spec"]
+    return True
+
+
+def write_apispec(app, path=API_SPEC_FILE):
+    spec = build_apispec(app)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": spec_fingerprint(app), "spec": spec}, f, default=str)
+    os.replace(tmp_path, path)
+    return spec
+
+
+@click.command("build-apispec")
+@click.option("--output", default=API_SPEC_FILE, show_default=True)
+def build_apispec_command(output):
+    """Precompute the Swagger spec so workers load it instead of parsing docstrings."""
+    spec = write_apispec(current_app._get_current_object(), output)
+    click.echo(f"Wrote {len(spec.get('paths', {}))} paths to {output}")
+
+
+def init_app(app):
+    """Call after every blueprint is registered (the fingerprint covers all routes)."""
+    load_apispec(app)
+    app.cli.add_command(build_apispec_command)
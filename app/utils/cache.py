@@ -0,0 +1,201 @@
+import fcntl
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Blueprint, jsonify
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # "memory" or "redis"
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 2048))
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+CACHE_GENERATION_DIR = os.getenv(
+    "CACHE_GENERATION_DIR", os.path.join(tempfile.gettempdir(), "triathlonforge_cache_generations")
+)
+
+cache_bp = Blueprint('cache', __name__, url_prefix='/api/cache')
+
+_MISSING = object()
+
+
+class MemoryCache:
+    """
+    In-process LRU cache with a per-entry TTL.
+
+    Per-user generations are integer counters in files in CACHE_GENERATION_DIR,
+    incremented under flock, so a sync running in a worker process still
+    invalidates the caches of every web worker on the same host.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, generation_dir=CACHE_GENERATION_DIR):
+        self.max_entries = max_entries
+        self.generation_dir = generation_dir
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+        os.makedirs(generation_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_generation(self, user_id):
+        try:
+            with open(os.path.join(self.generation_dir, str(user_id))) as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def bump_generation(self, user_id):
+        # Same as Redis INCR: two bumps within the mtime resolution still give two generations
+        with open(os.path.join(self.generation_dir, str(user_id)), "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            generation = int(f.read() or 0) + 1
+            f.seek(0)
+            f.truncate()
+            f.write(str(generation))
+            f.flush()
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """
+    Shared cache for multi-host deployments (requires the `redis` package).
+
+    Size is bounded by Redis itself; configure `maxmemory` with the
+    `volatile-lru` policy so only TTL'd entries are evicted and the
+    generation counters survive.
+    """
+
+    def __init__(self, url=CACHE_URL):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.evictions = 0
+
+    def get(self, key):
+        raw = self._redis.get(f"tf:{key}")
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        self._redis.set(f"tf:{key}", pickle.dumps(value), ex=ttl)
+
+    def get_generation(self, user_id):
+        return int(self._redis.get(f"tf:gen:{user_id}") or 0)
+
+    def bump_generation(self, user_id):
+        self._redis.incr(f"tf:gen:{user_id}")
+
+    def size(self):
+        return None
+
+
+class ReadThroughCache:
+    """
+    Read-through cache for per-user data.
+
+    Every entry is stored together with its owner's generation, and
+    invalidate_user() bumps that generation, so all of a user's entries go
+    stale at once without having to track their keys.
+    """
+
+    def __init__(self, backend, ttl=CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, user_id=None):
+        """Returns the cached value or None. Without `user_id`, the owner stored with the entry is checked."""
+        entry = self.backend.get(key)
+        if entry is not _MISSING:
+            owner, generation, value = entry
+            if user_id is not None and str(owner) != str(user_id):
+                entry = _MISSING
+            elif self.backend.get_generation(owner) != generation:
+                entry = _MISSING
+        if entry is _MISSING:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def generation(self, user_id):
+        """Read before querying the database; pass the result to set()."""
+        return self.backend.get_generation(user_id)
+
+    def set(self, key, user_id, value, generation):
+        """
+        Stores `value` under the generation read before it was queried, so a
+        sync committing in between leaves the entry already stale.
+        """
+        self.backend.set(key, (user_id, generation, value), self.ttl)
+
+    def invalidate_user(self, user_id):
+        self.backend.bump_generation(user_id)
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.backend.evictions,
+            "entries": self.backend.size(),
+            "ttl": self.ttl,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = RedisCache() if CACHE_BACKEND == "redis" else MemoryCache()
+                _cache = ReadThroughCache(backend)
+    return _cache
+
+
+@cache_bp.route('/stats', methods=['GET'])
+def cache_stats():
+    """
+    Activity cache hit/miss counters for this worker process.
+    ---
+    tags:
+      - Diagnostics
+    responses:
+      200:
+        description: Cache counters.
+    """
+    return jsonify({"success": True, "data": get_cache().stats(), "pid": os.getpid()})
@@ -1,15 +1,375 @@
+import os
+import threading
+import time
+from collections import deque
+
+import click
 import mysql.connector
 from mysql.connector import Error
+from flask import Blueprint, g, has_request_context, jsonify
+
+from app.utils.metrics import record_db_time
+
+DB_HOST = os.getenv("DB_HOST", "127.0.0.1")  # Replace with your MySQL host
+DB_USER = os.getenv("DB_USER", "root")  # Replace with your MySQL username
+DB_PASSWORD = os.getenv("DB_PASSWORD", "root")  # Replace with your MySQL password
+DB_NAME = os.getenv("DB_NAME", "TriathlonForge")  # Replace with your database name
+DB_PORT = int(os.getenv("DB_PORT", 8889))
+
+# Pool sizing is per process, so with gunicorn the total number of MySQL
+# connections is roughly workers * (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                              "migrations")
+
+db_bp = Blueprint('db', __name__, url_prefix='/api/db')
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe MySQL connection pool.
+
+    Keeps up to `size` idle connections around and allows `max_overflow`
+    extra connections under load. Connections older than `recycle` seconds
+    are reopened, and with `pre_ping` every checkout is health-checked first.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW, timeout=DB_POOL_TIMEOUT,
+                 recycle=DB_POOL_RECYCLE, pre_ping=DB_POOL_PRE_PING, **connect_args):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.connect_args = connect_args or {
+            "host": DB_HOST,
+            "user": DB_USER,
+            "password": DB_PASSWORD,
+            "database": DB_NAME,
+            "port": DB_PORT,
+        }
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, created_at), most recently used on the right
+        self._created_at = {}  # id(connection) -> created_at for checked-out connections
+        self._total = 0
+        self._in_use = 0
+        self._waiting = 0
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+
+    def _connect(self):
+        return mysql.connector.connect(**self.connect_args), time.monotonic()
+
+    def _is_usable(self, conn, created_at):
+        if self.recycle > 0 and time.monotonic() - created_at > self.recycle:
+            return False
+        if self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except Error:
+                return False
+        return True
+
+    def checkout(self, timeout=None):
+        """Returns a raw connection from the pool, opening one if allowed."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, created_at = self._idle.pop()
+                    break
+                if self._total < self.size + self.max_overflow:
+                    conn, created_at = None, None
+                    self._total += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"Connection pool exhausted after waiting {timeout}s")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            if conn is not None and not self._is_usable(conn, created_at):
+                self._close_quietly(conn)
+                conn = None
+            if conn is None:
+                conn, created_at = self._connect()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._created_at[id(conn)] = created_at
+            self._checkouts += 1
+            self._checkout_time_total += elapsed
+            self._checkout_time_max = max(self._checkout_time_max, elapsed)
+        return conn
+
+    def checkin(self, conn, discard=False):
+        """Returns a connection to the pool, resetting any open transaction."""
+        if not discard:
+            try:
+                if conn.unread_result:
+                    conn.consume_results()
+                conn.rollback()
+            except Error:
+                discard = True
+
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+            self._in_use -= 1
+            if discard or len(self._idle) >= self.size:
+                self._total -= 1
+                keep = False
+            else:
+                self._idle.append((conn, created_at))
+                keep = True
+            self._cond.notify()
+
+        if not keep:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "total": self._total,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "checkout_ms_avg": round(self._checkout_time_total / self._checkouts * 1000, 3)
+                if self._checkouts else 0.0,
+                "checkout_ms_max": round(self._checkout_time_max * 1000, 3),
+            }
+
+
+class InstrumentedCursor:
+    """Cursor proxy that reports statement and fetch time to app/utils/metrics.py."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def _timed(self, method, args, kwargs, queries):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            record_db_time(time.perf_counter() - start, queries)
+
+    def execute(self, *args, **kwargs):
+        return self._timed(self._cursor.execute, args, kwargs, 1)
+
+    def executemany(self, *args, **kwargs):
+        return self._timed(self._cursor.executemany, args, kwargs, 1)
+
+    def callproc(self, *args, **kwargs):
+        return self._timed(self._cursor.callproc, args, kwargs, 1)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone, (), {}, 0)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(self._cursor.fetchmany, args, kwargs, 0)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall, (), {}, 0)
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled MySQL connection.
+
+    Behaves like a regular mysql-connector connection, except that close()
+    hands the connection back to the pool. Request-scoped connections ignore
+    close() and are released when the app context is torn down, so a handler
+    that calls get_db_connection() more than once shares one connection.
+    Cursors are wrapped so their statement time shows up in /metrics.
+    """
+
+    def __init__(self, pool, conn, request_scoped=False):
+        self._pool = pool
+        self._conn = conn
+        self._request_scoped = request_scoped
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise Error("Connection has already been returned to the pool.")
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.__getattr__("cursor")(*args, **kwargs))
+
+    @property
+    def raw_connection(self):
+        """The underlying mysql-connector connection (stable for as long as it stays open)."""
+        return self._conn
+
+    def close(self):
+        if not self._request_scoped:
+            self.release()
+
+    def release(self, discard=False):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.checkin(conn, discard=discard)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns the process-wide pool, creating a fresh one after a fork."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool()
+                _pool_pid = pid
+    return _pool
+
 
 def get_db_connection():
+    """
+    Returns a pooled database connection, or None if none could be obtained.
+
+    Inside a request the same connection is reused for the whole request and
+    returned to the pool automatically on teardown. Outside a request (CLI
+    commands, background workers) the caller owns the connection and must
+    call close() to give it back.
+    """
     try:
-        return mysql.connector.connect(
-            host='127.0.0.1',  # Replace with your MySQL host
-            user='root',  # Replace with your MySQL username
-            password='root',  # Replace with your MySQL password
-            database='TriathlonForge',  # Replace with your database name
-            port=8889
-        )
-    except Error as e:
+        pool = get_pool()
+        if has_request_context():
+            conn = g.get("_db_conn")
+            if conn is None:
+                conn = g._db_conn = PooledConnection(pool, pool.checkout(), request_scoped=True)
+            return conn
+        return PooledConnection(pool, pool.checkout())
+    except (Error, PoolTimeout) as e:
         print(f"Database connection Error: {e}")
         return None
+
+
+def release_db_connection(exception=None):
+    """Teardown hook returning the request's connection to the pool."""
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn.release()
+
+
+def apply_migrations(conn, directory=MIGRATIONS_DIR):
+    """
+    Applies every migrations/NNN_*.sql file that has not been applied yet.
+
+    Applied files are recorded in `schema_migrations`, so running this
+    repeatedly is safe. Returns the list of newly applied file names.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name VARCHAR(255) NOT NULL PRIMARY KEY,
+                applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT name FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+
+        applied = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".sql") or name in done:
+                continue
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                sql = "\n".join(line for line in f if not line.lstrip().startswith("--"))
+            for statement in sql.split(";"):
+                if statement.strip():
+                    cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+            conn.commit()
+            applied.append(name)
+        return applied
+    finally:
+        cursor.close()
+
+
+@click.command("migrate")
+def migrate_command():
+    """Apply pending SQL migrations from the migrations/ directory."""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException("Database connection failed.")
+    try:
+        applied = apply_migrations(conn)
+    finally:
+        conn.close()
+    click.echo(f"Applied {len(applied)} migration(s): {', '.join(applied) or '-'}")
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connection)
+    app.cli.add_command(migrate_command)
+
+
+@db_bp.route('/pool', methods=['GET'])
+def pool_stats():
+    """
+    Connection pool statistics for this worker process.
+    ---
+    tags:
+      - Diagnostics
+    responses:
+      200:
+        description: Current pool usage and checkout latency.
+    """
+    return jsonify({"success": True, "data": get_pool().stats(), "pid": os.getpid()})
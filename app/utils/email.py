@@ -1,81 +1,38 @@
+import json
 import os
 import smtplib
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from string import Template
 
-def send_email(to_email, verification_code):
-    """
-    Send Verification Email
-
-    Sends an email containing a verification code to the specified email address
-    using SMTP with a styled HTML template.
-
-    Parameters:
-    ----------
-    to_email : str
-        The recipient's email address.
-    verification_code : str
-        The verification code to include in the email.
-
-    Environment Variables:
-    ----------------------
-    - SMTP_SERVER : str
-        The address of the SMTP server.
-    - SMTP_PORT : int
-        The port number of the SMTP server.
-    - SMTP_USER : str
-        The username for the SMTP server authentication.
-    - SMTP_PASSWORD : str
-        The password for the SMTP server authentication.
+import click
 
-    Email Content:
-    --------------
-    - Subject: "Verify Your Registration"
-    - HTML Body: Includes a verification code, styled with inline CSS.
+from app.utils.database import get_db_connection
+from app.utils.metrics import record_upstream
 
-    Returns:
-    --------
-    None
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "true").lower() in ("1", "true", "yes")
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 50))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BACKOFF = int(os.getenv("EMAIL_RETRY_BACKOFF", 30))  # seconds, doubled after every failed attempt
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", 2))
+# A message claimed by a worker that died is picked up again after this many seconds.
+EMAIL_SENDING_LEASE = int(os.getenv("EMAIL_SENDING_LEASE", 600))
 
-    Raises:
-    -------
-    smtplib.SMTPException:
-        If an error occurs during email sending.
-    EnvironmentError:
-        If required environment variables are not set.
-
-    Example:
-    --------
-    >>> send_email("user@example.com", "123456")
-
-    Notes:
-    ------
-    - Ensure that the SMTP environment variables are configured properly.
-    - This function currently uses `smtplib` for email sending and does not support
-      asynchronous operations.
-    """
-    SMTP_SERVER = os.getenv("SMTP_SERVER")
-    SMTP_PORT = int(os.getenv("SMTP_PORT"))
-    SMTP_USER = os.getenv("SMTP_USER")
-    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-
-    if not all([SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD]):
-        raise EnvironmentError("One or more SMTP environment variables are not set.")
-    subject = "Verify Your Registration"
-    # Define the HTML body with the verification code
-    body = f"""
+# Parsed once at import; sending a message only substitutes the code.
+VERIFICATION_TEMPLATE = Template("""
     <html>
     <head>
       <title>Verify Your Registration</title>
       <style>
-        body {{
+        body {
           font-family: 'Arial', sans-serif;
           margin: 0;
           padding: 0;
           background-color: #e9ecef;
           text-align: center;
-        }}
-        .container {{
+        }
+        .container {
           width: 100%;
           max-width: 600px;
           margin: 20px auto;
@@ -84,8 +41,8 @@ def send_email(to_email, verification_code):
           border-radius: 8px;
           box-shadow: 0 0 15px rgba(0, 0, 0, 0.1);
           overflow: hidden;
-        }}
-        .header {{
+        }
+        .header {
           background-color: #007bff;
           color: #ffffff;
           padding: 15px;
@@ -96,31 +53,31 @@ def send_email(to_email, verification_code):
           justify-content: center;
           background-size: cover;
           background-repeat: no-repeat;
-        }}
-        .header img {{
+        }
+        .header img {
           width: 50px;
           margin-right: 15px;
-        }}
-        .header h2 {{
+        }
+        .header h2 {
           margin: 0;
           font-size: 24px;
           letter-spacing: 1px;
-        }}
-        .content {{
+        }
+        .content {
           padding: 20px;
           text-align: left;
           background-size: cover;
           background-repeat: no-repeat;
-        }}
-        h2 {{
+        }
+        h2 {
           color: #333333;
           margin-top: 0;
-        }}
-        p {{
+        }
+        p {
           color: #666666;
           line-height: 1.6;
-        }}
-        .code {{
+        }
+        .code {
           font-size: 24px;
           font-weight: bold;
           color: #ffffff;
@@ -128,8 +85,8 @@ def send_email(to_email, verification_code):
           padding: 10px;
           border-radius: 4px;
           display: inline-block;
-        }}
-        .footer {{
+        }
+        .footer {
           margin-top: 20px;
           padding: 10px;
           background-color: #007bff;
@@ -138,10 +95,10 @@ def send_email(to_email, verification_code):
           font-size: 12px;
           color: #ffffff;
           text-align: center;
-        }}
-        .footer p {{
+        }
+        .footer p {
           margin: 0;
-        }}
+        }
       </style>
     </head>
     <body>
@@ -152,7 +109,7 @@ def send_email(to_email, verification_code):
         </div>
         <div class="content">
           <p>Dear User,</p>
-          <p>Your verification code is: <span class="code">{verification_code}</span></p>
+          <p>Your verification code is: <span class="code">$verification_code</span></p>
           <p>Please enter this code to complete your registration.</p>
           <p>Best regards,<br>Triathlon Forge</p>
         </div>
@@ -162,23 +119,262 @@ def send_email(to_email, verification_code):
       </div>
     </body>
     </html>
-    """
+    """)
+
+# template name -> (subject, Template)
+EMAIL_TEMPLATES = {
+    "verification": ("Verify Your Registration", VERIFICATION_TEMPLATE),
+}
+
+
+def _smtp_settings():
+    settings = {
+        "server": os.getenv("SMTP_SERVER"),
+        "port": os.getenv("SMTP_PORT"),
+        "user": os.getenv("SMTP_USER"),
+        "password": os.getenv("SMTP_PASSWORD"),
+    }
+    if not all(settings.values()):
+        raise EnvironmentError("One or more SMTP environment variables are not set.")
+    settings["port"] = int(settings["port"])
+    return settings
+
+
+def _smtp_connect(settings):
+    smtp_class = smtplib.SMTP_SSL if SMTP_USE_SSL else smtplib.SMTP
+    server = smtp_class(settings["server"], settings["port"])
+    server.login(settings["user"], settings["password"])
+    return server
+
+
+def build_message(from_email, to_email, template, context):
+    """Renders a template from EMAIL_TEMPLATES into a ready-to-send MIME message."""
+    subject, body = EMAIL_TEMPLATES[template]
 
     # Create a multipart message
     message = MIMEMultipart()
-    message['From'] = SMTP_USER
+    message['From'] = from_email
     message['To'] = to_email
     message['Subject'] = subject
 
     # Attach the HTML body to the email
-    message.attach(MIMEText(body, 'html'))
+    message.attach(MIMEText(body.substitute(context), 'html'))
+    return message
+
+
+def send_email(to_email, verification_code):
+    """
+    Send Verification Email
+
+    Sends an email containing a verification code to the specified email address
+    using SMTP with a styled HTML template.
+
+    Parameters:
+    ----------
+    to_email : str
+        The recipient's email address.
+    verification_code : str
+        The verification code to include in the email.
+
+    Environment Variables:
+    ----------------------
+    - SMTP_SERVER : str
+        The address of the SMTP server.
+    - SMTP_PORT : int
+        The port number of the SMTP server.
+    - SMTP_USER : str
+        The username for the SMTP server authentication.
+    - SMTP_PASSWORD : str
+        The password for the SMTP server authentication.
+    - SMTP_USE_SSL : bool
+        Connect with SMTP_SSL (default) or plain SMTP, e.g. for a local stand-in.
+
+    Email Content:
+    --------------
+    - Subject: "Verify Your Registration"
+    - HTML Body: Includes a verification code, styled with inline CSS.
 
+    Returns:
+    --------
+    None
+
+    Raises:
+    -------
+    smtplib.SMTPException:
+        If an error occurs during email sending.
+    EnvironmentError:
+        If required environment variables are not set.
+
+    Example:
+    --------
+    >>> send_email("user@example.com", "123456")
+
+    Notes:
+    ------
+    - Ensure that the SMTP environment variables are configured properly.
+    - This sends synchronously over a new connection. Request handlers should
+      use queue_verification_email() instead and let `flask email-worker`
+      deliver the message.
+    """
+    settings = _smtp_settings()
+    message = build_message(settings["user"], to_email, "verification", {"verification_code": verification_code})
+
+    start = time.perf_counter()
     try:
-        with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as server:
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            result = server.sendmail(SMTP_USER, to_email, message.as_string())
-            server.set_debuglevel(1)
+        with _smtp_connect(settings) as server:
+            server.sendmail(settings["user"], to_email, message.as_string())
+        record_upstream("smtp", "ok", time.perf_counter() - start)
     except Exception as e:
+        record_upstream("smtp", "error", time.perf_counter() - start)
         print(f"[EMAIL ERROR] {e}")
         raise  # kako bi Flask uhvatio i vratio 500 sa detaljem
 
+
+def queue_email(conn, to_email, template, context):
+    """
+    Adds a message to the email outbox.
+
+    Does not commit: the row becomes visible together with the caller's
+    transaction, so a message is only sent if the change behind it is saved.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO email_outbox (to_email, template, context, next_attempt_at)
+            VALUES (%s, %s, %s, UTC_TIMESTAMP())
+        """, (to_email, template, json.dumps(context)))
+    finally:
+        cursor.close()
+
+
+def queue_verification_email(conn, to_email, verification_code):
+    queue_email(conn, to_email, "verification", {"verification_code": verification_code})
+
+
+class EmailSender:
+    """
+    Sends messages over one authenticated SMTP connection that stays open
+    between batches and is re-established if the server drops it.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or _smtp_settings()
+        self._server = None
+
+    def send(self, to_email, message):
+        for attempt in range(2):
+            start = time.perf_counter()
+            try:
+                if self._server is None:
+                    self._server = _smtp_connect(self.settings)
+                self._server.sendmail(self.settings["user"], to_email, message.as_string())
+                record_upstream("smtp", "ok", time.perf_counter() - start)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                record_upstream("smtp", "error", time.perf_counter() - start)
+                self._server = None
+                if attempt == 1:
+                    raise
+            except Exception:
+                record_upstream("smtp", "error", time.perf_counter() - start)
+                raise
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+
+def send_pending_emails(conn, sender, batch_size=EMAIL_BATCH_SIZE):
+    """
+    Sends one batch of due outbox messages. Returns (sent, failed).
+
+    Claimed rows are leased for EMAIL_SENDING_LEASE seconds so that parallel
+    workers skip them. A failed message is retried with exponential backoff
+    until EMAIL_MAX_ATTEMPTS, after which it is marked `failed`.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT email_id, to_email, template, context, attempts FROM email_outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= UTC_TIMESTAMP()
+            ORDER BY email_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (batch_size,))
+        batch = cursor.fetchall()
+        if batch:
+            cursor.execute(
+                f"UPDATE email_outbox SET status = 'sending', "
+                f"next_attempt_at = UTC_TIMESTAMP() + INTERVAL %s SECOND "
+                f"WHERE email_id IN ({', '.join(['%s'] * len(batch))})",
+                [EMAIL_SENDING_LEASE, *(row["email_id"] for row in batch)]
+            )
+        conn.commit()
+
+        sent, failed = 0, 0
+        for row in batch:
+            try:
+                context = json.loads(row["context"]) if isinstance(row["context"], (str, bytes)) else row["context"]
+                message = build_message(sender.settings["user"], row["to_email"], row["template"], context)
+                sender.send(row["to_email"], message)
+                cursor.execute(
+                    "UPDATE email_outbox SET status = 'sent', sent_at = UTC_TIMESTAMP(), attempts = attempts + 1 "
+                    "WHERE email_id = %s",
+                    (row["email_id"],)
+                )
+                sent += 1
+            except Exception as e:
+                print(f"[EMAIL ERROR] outbox {row['email_id']}: {e}")
+                attempts = row["attempts"] + 1
+                cursor.execute("""
+                    UPDATE email_outbox
+                    SET status = %s, attempts = %s, last_error = %s,
+                        next_attempt_at = UTC_TIMESTAMP() + INTERVAL %s SECOND
+                    WHERE email_id = %s
+                """, (
+                    "failed" if attempts >= EMAIL_MAX_ATTEMPTS else "pending",
+                    attempts,
+                    str(e),
+                    EMAIL_RETRY_BACKOFF * 2 ** (attempts - 1),
+                    row["email_id"]
+                ))
+                failed += 1
+            conn.commit()
+        return sent, failed
+    finally:
+        cursor.close()
+
+
+@click.command("email-worker")
+@click.option("--batch-size", default=EMAIL_BATCH_SIZE, show_default=True)
+@click.option("--poll-interval", default=EMAIL_POLL_INTERVAL, show_default=True,
+              help="Seconds to wait when the outbox is empty.")
+@click.option("--burst", is_flag=True, help="Exit once the outbox is empty.")
+def email_worker_command(batch_size, poll_interval, burst):
+    """Send queued emails from the outbox."""
+    sender = EmailSender()
+    try:
+        while True:
+            conn = get_db_connection()
+            sent = failed = 0
+            if conn:
+                try:
+                    sent, failed = send_pending_emails(conn, sender, batch_size)
+                finally:
+                    conn.close()
+            if sent or failed:
+                click.echo(f"Sent {sent}, failed {failed}")
+                continue
+            if burst:
+                return
+            time.sleep(poll_interval)
+    finally:
+        sender.close()
+
+
+def init_app(app):
+    app.cli.add_command(email_worker_command)
@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", 500))
+# Output is handed to the WSGI server in pieces of roughly this many bytes.
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", 64 * 1024))
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = (
+    ("a", "activity_id"), ("a", "stravaActivityID"), ("a", "activity_type"), ("a", "activity_name"),
+    ("a", "date"), ("a", "start_time"), ("a", "distance"), ("a", "duration"), ("a", "pace"), ("a", "speed"),
+    ("a", "calories_burned"), ("a", "heart_rate_avg"), ("a", "heart_rate_max"), ("a", "elevation_gain"),
+    ("a", "location_city"), ("a", "location_country"), ("d", "max_speed"), ("d", "average_cadence"),
+    ("d", "average_watts"), ("d", "max_watts"), ("d", "kilojoules"), ("d", "gear_name"), ("d", "device_name"),
+    ("d", "polyline"),
+)
+EXPORT_FIELDS = tuple(column for _, column in EXPORT_COLUMNS)
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return str(value)
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), default=_json_default, separators=(",", ":")) + "\n"
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _rows(cursor, fetch_size):
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def export_activities(conn, user_id, fmt="ndjson", compress=False, fetch_size=EXPORT_FETCH_SIZE):
+    """
+    Generator yielding the user's whole activity history as NDJSON or CSV bytes.
+
+    Rows come from an unbuffered cursor (the server streams the result and the
+    client holds only `fetch_size` rows at a time), are encoded line by line
+    and handed out in ~EXPORT_CHUNK_BYTES pieces, gzip-compressed on the fly
+    when `compress` is set. Memory use therefore does not depend on the number
+    of activities.
+
+    If the consumer stops early (client disconnected) the connection is
+    discarded instead of being returned to the pool with an unread result.
+    """
+    encode_lines = _ndjson_lines if fmt == "ndjson" else _csv_lines
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: gzip container
+
+    cursor = conn.cursor(buffered=False)
+    finished = False
+    try:
+        cursor.execute(f"""
+            SELECT {', '.join(f'{table}.{column}' for table, column in EXPORT_COLUMNS)}
+            FROM activities a
+            LEFT JOIN activity_details d ON d.activity_id = a.activity_id
+            WHERE a.user_id = %s
+            ORDER BY a.date, a.activity_id
+        """, (user_id,))
+
+        pending, pending_size = [], 0
+        for line in encode_lines(_rows(cursor, fetch_size)):
+            data = line.encode("utf-8")
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+            if pending_size >= EXPORT_CHUNK_BYTES:
+                yield b"".join(pending)
+                pending, pending_size = [], 0
+        if compressor:
+            pending.append(compressor.flush())
+        if pending:
+            yield b"".join(pending)
+        finished = True
+    finally:
+        if finished:
+            cursor.close()
+        else:
+            conn.release(discard=True)
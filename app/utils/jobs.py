@@ -0,0 +1,281 @@
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+import click
+from mysql.connector import IntegrityError, errorcode
+
+from app.utils.activity_import import import_archive
+from app.utils.database import get_db_connection
+from app.utils.strava_sync import sync_user_activities
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 2))
+# Running jobs whose heartbeat is older than this are assumed to belong to a dead
+# worker and are put back in the queue.
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", 600))
+# Running jobs refresh their heartbeat this often from a separate thread, so a
+# handler blocked for a long time (e.g. waiting for Strava's rate limit) is not
+# mistaken for a dead one.
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", min(60, JOB_STALE_AFTER / 3)))
+
+JOB_COLUMNS = """
+    job_id, user_id, job_type, status, full_sync, pages_fetched, activities_written,
+    error_count, last_error, worker, created_at, started_at, heartbeat_at, finished_at
+"""
+
+
+def _run_strava_sync(conn, job, progress):
+    return sync_user_activities(conn, job["user_id"], full=bool(job["full_sync"]), progress=progress)
+
+
+def _run_archive_import(conn, job, progress):
+    archive_path = job["payload"]["archive_path"]
+    try:
+        return import_archive(conn, job["user_id"], archive_path, progress=progress)
+    finally:
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+
+
+# job_type -> handler(conn, job, progress)
+JOB_HANDLERS = {
+    "strava_sync": _run_strava_sync,
+    "archive_import": _run_archive_import,
+}
+
+
+def get_job(conn, job_id):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"SELECT {JOB_COLUMNS} FROM sync_jobs WHERE job_id = %s", (job_id,))
+        job = cursor.fetchone()
+        conn.commit()
+        return job
+    finally:
+        cursor.close()
+
+
+def enqueue_sync_job(conn, user_id, full=False):
+    """
+    Queues a Strava sync for the user.
+
+    If a sync for the same user is already queued or running, no new job is
+    created and the existing one is returned instead; a `full` request turns a
+    queued job into a full sync, but cannot change one that is already running
+    (the returned job then has full_sync false). Returns (job, created).
+    """
+    cursor = conn.cursor()
+    try:
+        for _ in range(3):
+            try:
+                cursor.execute(
+                    "INSERT INTO sync_jobs (user_id, job_type, full_sync) VALUES (%s, 'strava_sync', %s)",
+                    (user_id, full)
+                )
+                job_id = cursor.lastrowid
+                conn.commit()
+                return get_job(conn, job_id), True
+            except IntegrityError as e:
+                conn.rollback()
+                if e.errno != errorcode.ER_DUP_ENTRY:
+                    raise
+
+            cursor.execute("SELECT job_id FROM sync_jobs WHERE active_user_id = %s", (user_id,))
+            row = cursor.fetchone()
+            conn.commit()
+            if row:
+                if full:
+                    cursor.execute(
+                        "UPDATE sync_jobs SET full_sync = TRUE WHERE job_id = %s AND status = 'queued'", (row[0],)
+                    )
+                    conn.commit()
+                return get_job(conn, row[0]), False
+            # The active job finished between the INSERT and the SELECT; try again.
+        raise RuntimeError("Could not enqueue sync job.")
+    finally:
+        cursor.close()
+
+
+def enqueue_job(conn, user_id, job_type, payload=None):
+    """Queues a job of `job_type`. Unlike enqueue_sync_job() there is no deduplication. Returns the job."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO sync_jobs (user_id, job_type, payload) VALUES (%s, %s, %s)",
+            (user_id, job_type, json.dumps(payload) if payload is not None else None)
+        )
+        job_id = cursor.lastrowid
+        conn.commit()
+        return get_job(conn, job_id)
+    finally:
+        cursor.close()
+
+
+def claim_next_job(conn, worker):
+    """Atomically moves the oldest queued job to `running` and returns it, or None."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            UPDATE sync_jobs SET status = 'queued', worker = NULL
+            WHERE status = 'running' AND heartbeat_at < UTC_TIMESTAMP() - INTERVAL %s SECOND
+        """, (JOB_STALE_AFTER,))
+        conn.commit()
+
+        cursor.execute(f"""
+            SELECT {JOB_COLUMNS}, payload FROM sync_jobs
+            WHERE status = 'queued'
+            ORDER BY job_id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """)
+        job = cursor.fetchone()
+        if not job:
+            conn.commit()
+            return None
+
+        cursor.execute("""
+            UPDATE sync_jobs
+            SET status = 'running', worker = %s, started_at = UTC_TIMESTAMP(), heartbeat_at = UTC_TIMESTAMP()
+            WHERE job_id = %s
+        """, (worker, job["job_id"]))
+        conn.commit()
+        job["status"] = "running"
+        if isinstance(job["payload"], (str, bytes)):
+            job["payload"] = json.loads(job["payload"])
+        return job
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def update_job_progress(conn, job_id, pages_fetched, activities_written, error_count):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE sync_jobs
+            SET pages_fetched = %s, activities_written = %s, error_count = %s, heartbeat_at = UTC_TIMESTAMP()
+            WHERE job_id = %s
+        """, (pages_fetched, activities_written, error_count, job_id))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def _heartbeat(job_id, stopped, interval=JOB_HEARTBEAT_INTERVAL):
+    """Refreshes heartbeat_at until `stopped` is set. Runs in its own thread with its own connection."""
+    while not stopped.wait(interval):
+        conn = get_db_connection()
+        if not conn:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE sync_jobs SET heartbeat_at = UTC_TIMESTAMP() WHERE job_id = %s AND status = 'running'",
+                (job_id,)
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"[JOB ERROR] heartbeat for job {job_id}: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def finish_job(conn, job_id, status, error=None):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE sync_jobs
+            SET status = %s, last_error = COALESCE(%s, last_error), error_count = error_count + %s,
+                finished_at = UTC_TIMESTAMP(), heartbeat_at = UTC_TIMESTAMP()
+            WHERE job_id = %s
+        """, (status, error, 1 if error else 0, job_id))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def run_job(job):
+    """
+    Runs a claimed job to completion and records the outcome.
+
+    Progress is written through its own connection, so it is visible while the
+    handler is still inside its write transactions. A heartbeat thread keeps
+    the job claimed for as long as the handler runs.
+    """
+    handler = JOB_HANDLERS.get(job["job_type"])
+    status_conn = get_db_connection()
+    work_conn = get_db_connection()
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job["job_id"], stopped), daemon=True,
+                                 name=f"job-{job['job_id']}-heartbeat")
+    heartbeat.start()
+    try:
+        if not status_conn or not work_conn:
+            raise RuntimeError("Database connection failed.")
+        if handler is None:
+            raise RuntimeError(f"Unknown job type: {job['job_type']}")
+
+        def progress(pages_fetched, activities_written, error_count):
+            update_job_progress(status_conn, job["job_id"], pages_fetched, activities_written, error_count)
+
+        handler(work_conn, job, progress)
+        finish_job(status_conn, job["job_id"], "succeeded")
+    except Exception as e:
+        print(f"[JOB ERROR] job {job['job_id']}: {e}")
+        if status_conn:
+            finish_job(status_conn, job["job_id"], "failed", str(e))
+    finally:
+        stopped.set()
+        heartbeat.join()
+        if work_conn:
+            work_conn.close()
+        if status_conn:
+            status_conn.close()
+
+
+def worker_loop(poll_interval=JOB_POLL_INTERVAL, burst=False):
+    """Claims and runs jobs until stopped. With `burst`, exits once the queue is empty."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        conn = get_db_connection()
+        job = None
+        if conn:
+            try:
+                job = claim_next_job(conn, worker)
+            finally:
+                conn.close()
+
+        if job:
+            run_job(job)
+        elif burst:
+            return
+        else:
+            time.sleep(poll_interval)
+
+
+@click.command("sync-worker")
+@click.option("--processes", default=1, show_default=True, help="Number of worker processes.")
+@click.option("--poll-interval", default=JOB_POLL_INTERVAL, show_default=True,
+              help="Seconds to wait when the queue is empty.")
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty.")
+def sync_worker_command(processes, poll_interval, burst):
+    """Run background job workers (Strava syncs, archive imports)."""
+    if processes <= 1:
+        worker_loop(poll_interval, burst)
+        return
+
+    workers = [multiprocessing.Process(target=worker_loop, args=(poll_interval, burst)) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+
+def init_app(app):
+    app.cli.add_command(sync_worker_command)
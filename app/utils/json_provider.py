@@ -0,0 +1,96 @@
+import base64
+import os
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; without it the stdlib provider is used
+    orjson = None
+
+JSON_BACKEND = os.getenv("JSON_BACKEND", "orjson")  # "orjson" or "stdlib"
+# "http" keeps Flask's format for dates (Mon, 18 Aug 2025 00:00:00 GMT), which
+# existing clients parse; "iso" (2025-08-18) lets orjson encode dates natively.
+JSON_DATE_FORMAT = os.getenv("JSON_DATE_FORMAT", "http")
+
+
+def json_default(value):
+    """
+    Encodes the values mysql-connector returns that JSON has no type for.
+    Dates and Decimals come out as with Flask's default provider; TIME
+    columns (timedelta) become seconds and BLOBs base64.
+    """
+    if isinstance(value, date):  # also datetime
+        return http_date(value) if JSON_DATE_FORMAT == "http" else value.isoformat()
+    if isinstance(value, time):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return DefaultJSONProvider.default(value)  # dataclasses, UUID, __html__, or TypeError
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's json-module provider with json_default() for MySQL values."""
+
+    default = staticmethod(json_default)
+
+
+class OrjsonJSONProvider(StdlibJSONProvider):
+    """
+    Encodes and parses with orjson. Output matches StdlibJSONProvider (sorted
+    keys, compact unless debugging, same date and Decimal formats) except that
+    non-ASCII text is written as UTF-8 instead of \\u escapes. Responses
+    are written as bytes without an intermediate str, and anything orjson
+    refuses (e.g. integers over 64 bits) or calls with json-module keyword
+    arguments go through the stdlib provider.
+    """
+
+    def _options(self):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if JSON_DATE_FORMAT == "http":
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        compact = self.compact if self.compact is not None else not self._app.debug
+        if not compact:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs:
+            try:
+                return orjson.dumps(obj, default=json_default, option=self._options()).decode("utf-8")
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=json_default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    if JSON_BACKEND == "orjson" and orjson is not None:
+        app.json = OrjsonJSONProvider(app)
+    else:
+        if JSON_BACKEND == "orjson":
+            print("[JSON] orjson is not installed; using the stdlib JSON provider")
+        app.json = StdlibJSONProvider(app)
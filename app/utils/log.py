@@ -1,8 +1,15 @@
 from flask import Blueprint, request, jsonify
+import atexit
 import os
-from datetime import datetime
+import queue
+import threading
+import time
 
 LOG_DIR = "logs"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_DROP_POLICY = os.getenv("LOG_DROP_POLICY", "newest")  # "newest" or "oldest"
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 1.0))
+LOG_BATCH_SIZE = 500
 log_bp = Blueprint('log', __name__, url_prefix='/api')
 @log_bp.route('/data', methods=['POST'])
 def receive_data():
@@ -18,14 +25,138 @@ def receive_data():
     return jsonify({'message': f'Received input: {input_data}'})
 
 
+class BufferedLogWriter:
+    """
+    Writes log lines from a background thread.
+
+    Request threads only put (timestamp, action) on a bounded queue. The writer
+    thread batches lines, keeps the day's file open, switches to a new file at
+    midnight and flushes everything on shutdown. When the queue is full, the
+    record is dropped according to `drop_policy` ("newest" drops the incoming
+    record, "oldest" makes room by discarding the oldest queued one) and
+    counted in `dropped`.
+    """
+
+    def __init__(self, log_dir=LOG_DIR, max_queue=LOG_QUEUE_SIZE, drop_policy=LOG_DROP_POLICY,
+                 flush_interval=LOG_FLUSH_INTERVAL):
+        self.log_dir = log_dir
+        self.drop_policy = drop_policy
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._file_day = None
+        self._last_second = None
+        self._last_stamp = None
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != pid:
+                # After a fork (gunicorn) the thread does not exist in the child, so a new one is started
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._file, self._file_day = None, None
+                self._pid = pid
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def write(self, action):
+        self._ensure_started()
+        record = (time.time(), action)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if self.drop_policy == "oldest":
+                try:
+                    self._queue.get_nowait()
+                    self._queue.put_nowait(record)
+                except (queue.Empty, queue.Full):
+                    pass
+            self.dropped += 1
+
+    def _stream_for(self, timestamp):
+        local = time.localtime(timestamp)
+        day = time.strftime("%Y-%m-%d", local)
+        if day != self._file_day:
+            if self._file:
+                self._file.close()
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._file = open(os.path.join(self.log_dir, f"log_{day}.txt"), "a", encoding="utf-8")
+            self._file_day = day
+
+        second = int(timestamp)
+        if second != self._last_second:
+            self._last_second = second
+            self._last_stamp = time.strftime("%Y-%m-%d %H:%M:%S", local)
+        return self._file, self._last_stamp
+
+    def _write_batch(self, batch):
+        for timestamp, action in batch:
+            f, stamp = self._stream_for(timestamp)
+            f.write(f"[{stamp}] {action}\n")
+        if self._file:
+            self._file.flush()
+        self.written += len(batch)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if _STOP in batch:
+                stop = True
+                batch = [record for record in batch if record is not _STOP]
+            try:
+                self._write_batch(batch)
+            except OSError as e:
+                print(f"[LOG ERROR] {e}")
+
+        if self._file:
+            self._file.close()
+            self._file, self._file_day = None, None
+
+    def close(self, timeout=5):
+        """Flushes queued records and stops the writer thread."""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "written": self.written,
+            "dropped": self.dropped,
+            "drop_policy": self.drop_policy,
+        }
+
+
+_STOP = object()
+_writer = BufferedLogWriter()
+
+
 def log_action(action: str):
-    """Zapisuje akciju u fajl logs/log_YYYY-MM-DD.txt"""
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
+    """Zapisuje akciju u fajl logs/log_YYYY-MM-DD.txt (asinhrono, preko pozadinske niti)"""
+    _writer.write(action)
 
-    filename = f"log_{datetime.now().strftime('%Y-%m-%d')}.txt"
-    filepath = os.path.join(LOG_DIR, filename)
 
-    with open(filepath, "a", encoding="utf-8") as f:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        f.write(f"[{timestamp}] {action}\n")
\ No newline at end of file
+@log_bp.route('/log_stats', methods=['GET'])
+def log_stats():
+    return jsonify({'success': True, 'data': _writer.stats()})
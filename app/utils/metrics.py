@@ -0,0 +1,355 @@
+import atexit
+import glob
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter as Tally
+
+from flask import Blueprint, Response, g, has_request_context, request
+
+# Header that switches the sampling profiler on for one request. Its value must
+# equal PROFILE_TOKEN; without a token profiling is disabled.
+PROFILE_HEADER = "X-Profile"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("data", "profiles"))
+
+# Every process (gunicorn workers, job workers) writes its metrics to a file in
+# this directory and /metrics serves the sum of all files, so a scrape gives the
+# same totals whichever worker answers it. Empty: serve this process only.
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "triathlonforge_metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        _ensure_flusher()
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(values, labels, value):
+        values[labels] = values.get(labels, 0) + value
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        if values is None:
+            values = {tuple(labels): value for labels, value in self.snapshot()}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        _ensure_flusher()
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), list(entry)] for labels, entry in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(values, labels, entry):
+        total = values.get(labels)
+        values[labels] = list(entry) if total is None else [a + b for a, b in zip(total, entry)]
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        if values is None:
+            values = {tuple(labels): entry for labels, entry in self.snapshot()}
+        for labels, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), entry):
+                cumulative += count
+                bucket_labels = _labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {entry[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+REQUEST_DB_QUERIES = Histogram("http_request_db_queries", "MySQL queries per request.", ("route",),
+                               QUERY_COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram("http_request_db_seconds", "Time spent in MySQL per request.", ("route",))
+REQUEST_UPSTREAM_TIME = Histogram("http_request_upstream_seconds",
+                                  "Time spent calling external services per request.", ("route", "service"))
+DB_QUERIES = Counter("db_queries_total", "MySQL statements executed.")
+DB_QUERY_TIME = Histogram("db_query_duration_seconds", "MySQL statement latency (execute and fetch).")
+UPSTREAM_CALLS = Counter("upstream_requests_total", "Calls to external services.", ("service", "status"))
+UPSTREAM_TIME = Histogram("upstream_request_duration_seconds", "External service call latency.", ("service",))
+PROFILES = Counter("profiler_runs_total", "Requests run under the sampling profiler.")
+STRAVA_TOKEN_REFRESHES = Counter("strava_token_refreshes_total",
+                                 "Strava token refresh attempts (reused = another worker had refreshed).", ("result",))
+
+METRICS = (REQUESTS, REQUEST_LATENCY, REQUEST_DB_QUERIES, REQUEST_DB_TIME, REQUEST_UPSTREAM_TIME,
+           DB_QUERIES, DB_QUERY_TIME, UPSTREAM_CALLS, UPSTREAM_TIME, PROFILES, STRAVA_TOKEN_REFRESHES)
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+_metrics_file = None
+
+
+def flush_metrics():
+    """Writes this process's metrics to its file in METRICS_DIR (atomically)."""
+    if not METRICS_DIR:
+        return
+    _ensure_flusher()
+    data = {metric.name: metric.snapshot() for metric in METRICS}
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    tmp_path = _metrics_file + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, _metrics_file)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush_metrics()
+        except OSError as e:
+            print(f"[METRICS ERROR] {e}")
+
+
+def _ensure_flusher():
+    """
+    Starts the flush thread on the first metric update in each process. After
+    a fork the values inherited from the parent are dropped first; they are in
+    the parent's own file. The start time in the file name keeps a reused pid
+    from overwriting an exited worker's totals.
+    """
+    global _flusher_pid, _metrics_file
+    if _flusher_pid == os.getpid() or not METRICS_DIR:
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        if _flusher_pid is not None:
+            for metric in METRICS:
+                metric.reset()
+        _flusher_pid = os.getpid()
+        _metrics_file = os.path.join(METRICS_DIR, f"{_flusher_pid}-{time.time_ns()}.json")
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(flush_metrics)
+
+
+def clear_metrics_dir():
+    """Removes the files of earlier runs; call once before the workers start."""
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")) if METRICS_DIR else ():
+        os.remove(path)
+
+
+def record_db_time(seconds, queries=1):
+    """Counts MySQL time (a statement when `queries` is 1, fetching rows when 0) for the process and the request."""
+    if queries:
+        DB_QUERIES.inc(amount=queries)
+        DB_QUERY_TIME.observe(seconds)
+    if has_request_context():
+        stats = g.get("_request_stats")
+        if stats is not None:
+            stats["db_queries"] += queries
+            stats["db_seconds"] += seconds
+
+
+def record_upstream(service, status, seconds):
+    """Counts one outbound call (service = "strava" or "smtp")."""
+    UPSTREAM_CALLS.inc(service, str(status))
+    UPSTREAM_TIME.observe(seconds, service)
+    if has_request_context():
+        stats = g.get("_request_stats")
+        if stats is not None:
+            stats["upstream"][service] = stats["upstream"].get(service, 0.0) + seconds
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a
+    background thread and counts the stacks in collapsed (flame graph) form:
+    "module:function:line;...;module:function:line count".
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _start_request():
+    g._request_stats = {"start": time.perf_counter(), "db_queries": 0, "db_seconds": 0.0, "upstream": {}}
+    if PROFILE_TOKEN and request.headers.get(PROFILE_HEADER) == PROFILE_TOKEN:
+        g._profiler = SamplingProfiler(threading.get_ident()).start()
+
+
+def _finish_response(response):
+    g._response_status = response.status_code
+    profiler = g.pop("_profiler", None)
+    if profiler is not None:
+        samples = profiler.stop()
+        route = re.sub(r"[^A-Za-z0-9]+", "_", _route()).strip("_") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{request.method}_{route}"
+        path = os.path.join(PROFILE_DIR, f"{name}_{os.getpid()}.folded")
+        profiler.write(path)
+        PROFILES.inc()
+        response.headers["X-Profile-File"] = path
+        response.headers["X-Profile-Samples"] = str(sum(samples.values()))
+    return response
+
+
+def _record_request(exception=None):
+    stats = g.pop("_request_stats", None)
+    if stats is None:
+        return
+    profiler = g.pop("_profiler", None)  # the request failed before after_request
+    if profiler is not None:
+        profiler.stop()
+    route = _route()
+    status = g.pop("_response_status", 500)
+    REQUESTS.inc(request.method, route, str(status))
+    REQUEST_LATENCY.observe(time.perf_counter() - stats["start"], request.method, route)
+    REQUEST_DB_QUERIES.observe(stats["db_queries"], route)
+    REQUEST_DB_TIME.observe(stats["db_seconds"], route)
+    for service, seconds in stats["upstream"].items():
+        REQUEST_UPSTREAM_TIME.observe(seconds, route, service)
+
+
+def render_metrics():
+    """
+    Prometheus text for every process writing to METRICS_DIR (summed, as in
+    prometheus_client's multiprocess mode), or for this process alone.
+    Files of exited workers are kept so counters never go backwards.
+    """
+    if not METRICS_DIR:
+        merged = {metric.name: None for metric in METRICS}
+    else:
+        flush_metrics()
+        merged = {metric.name: {} for metric in METRICS}
+        by_name = {metric.name: metric for metric in METRICS}
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # removed or replaced while listing
+            for name, entries in data.items():
+                if name in by_name:
+                    for labels, value in entries:
+                        by_name[name].merge(merged[name], tuple(labels), value)
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render(merged[metric.name]))
+    return "\n".join(lines) + "\n"
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Request, MySQL and Strava/SMTP metrics of all worker processes on this host in Prometheus text format.
+    ---
+    tags:
+      - Diagnostics
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: Prometheus exposition format (summed over the processes sharing METRICS_DIR).
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_response)
+    app.teardown_request(_record_request)
+    app.register_blueprint(metrics_bp)
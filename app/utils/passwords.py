@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import argon2
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError, VerifyMismatchError
+
+ARGON2_PARAMS = {
+    "time_cost": int(os.getenv("ARGON2_TIME_COST", argon2.DEFAULT_TIME_COST)),
+    "memory_cost": int(os.getenv("ARGON2_MEMORY_COST", argon2.DEFAULT_MEMORY_COST)),
+    "parallelism": int(os.getenv("ARGON2_PARALLELISM", argon2.DEFAULT_PARALLELISM)),
+    "hash_len": int(os.getenv("ARGON2_HASH_LEN", argon2.DEFAULT_HASH_LENGTH)),
+    "salt_len": int(os.getenv("ARGON2_SALT_LEN", argon2.DEFAULT_RANDOM_SALT_LENGTH)),
+}
+# Processes doing the hashing; 0 hashes inline on the calling thread.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", 2))
+# Hash/verify calls allowed in flight (running + queued) per web worker before
+# new ones are rejected right away.
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", 8))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", 10))
+HASH_POOL_START_METHOD = os.getenv("HASH_POOL_START_METHOD", "spawn")
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated or unavailable; the request should be retried later."""
+
+
+# These run inside the pool processes, which build their own hasher once.
+_worker_hasher = None
+
+
+def _init_worker(params):
+    global _worker_hasher
+    _worker_hasher = PasswordHasher(**params)
+
+
+def _hash(password):
+    return _worker_hasher.hash(password)
+
+
+def _verify(stored_hash, password):
+    """Returns (matches, new_hash); new_hash is set when the stored parameters are outdated."""
+    try:
+        _worker_hasher.verify(stored_hash, password)
+    except VerifyMismatchError:
+        return False, None
+    if _worker_hasher.check_needs_rehash(stored_hash):
+        return True, _worker_hasher.hash(password)
+    return True, None
+
+
+class PasswordService:
+    """
+    Runs Argon2 hashing and verification on a bounded process pool.
+
+    Argon2 is deliberately CPU- and memory-heavy, so running it on the request
+    thread lets a burst of logins starve every other endpoint. Calls go to
+    HASH_WORKERS processes instead, and once HASH_MAX_PENDING calls are in
+    flight new ones fail fast with HashingBusy.
+    """
+
+    def __init__(self, params=None, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING, timeout=HASH_TIMEOUT):
+        self.params = params or ARGON2_PARAMS
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _get_executor(self):
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(HASH_POOL_START_METHOD),
+                        initializer=_init_worker,
+                        initargs=(self.params,)
+                    )
+                    self._executor_pid = pid
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy("Password hashing is saturated, try again shortly.")
+        if self.workers <= 0:
+            try:
+                if _worker_hasher is None:
+                    _init_worker(self.params)
+                return fn(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is freed when the hash actually finishes (or is cancelled), so calls
+        # that timed out but still occupy a pool process keep counting against max_pending
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingBusy("Password hashing timed out, try again shortly.")
+        except BrokenProcessPool:
+            # A pool process died; the next call creates a new pool
+            with self._lock:
+                self._executor = None
+            raise HashingBusy("Password hashing is unavailable, try again shortly.")
+
+    def hash(self, password):
+        return self._run(_hash, password)
+
+    def verify(self, stored_hash, password):
+        """
+        Checks a password against its stored hash.
+
+        Returns (matches, new_hash). new_hash is a fresh hash with the current
+        parameters when the stored one needs rehashing, otherwise None.
+        Missing and malformed hashes count as a mismatch.
+        """
+        if not stored_hash:
+            return False, None
+        try:
+            return self._run(_verify, stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False, None
+
+
+_service = None
+
+
+def get_password_service():
+    global _service
+    if _service is None:
+        _service = PasswordService()
+    return _service
@@ -0,0 +1,162 @@
+from array import array
+
+# Routes are kept as flat array('i') buffers of interleaved latitude/longitude in
+# 1e-5 degrees (the precision of Google's encoded polyline format): lat0, lng0,
+# lat1, lng1, ... That avoids a Python tuple and two floats per point.
+SCALE = 100000
+BINARY_MAGIC = b"PL1"
+# Douglas-Peucker tolerance in screen pixels at the requested zoom level.
+SIMPLIFY_PIXELS = 1.0
+
+
+def decode(encoded):
+    """Decodes a Google encoded polyline (Strava's summary_polyline) into an array('i')."""
+    coords = array("i")
+    if not encoded:
+        return coords
+    data = encoded.encode("ascii")
+    index, lat, lng = 0, 0, 0
+    length = len(data)
+    while index < length:
+        for axis in (0, 1):
+            shift, result = 0, 0
+            while True:
+                byte = data[index] - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if axis == 0:
+                lat += delta
+                coords.append(lat)
+            else:
+                lng += delta
+                coords.append(lng)
+    return coords
+
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append((0x20 | (value & 0x1F)) + 63)
+        value >>= 5
+    out.append(value + 63)
+
+
+def encode(coords):
+    """Encodes an array('i') of interleaved lat/lng back into a Google encoded polyline."""
+    out = bytearray()
+    prev_lat, prev_lng = 0, 0
+    for i in range(0, len(coords), 2):
+        lat, lng = coords[i], coords[i + 1]
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lng - prev_lng, out)
+        prev_lat, prev_lng = lat, lng
+    return out.decode("ascii")
+
+
+def to_binary(coords):
+    """
+    Packs coordinates for storage: a magic header followed by zigzag varint
+    deltas. Consecutive GPS points differ by a few units, so most values take
+    one or two bytes.
+    """
+    out = bytearray(BINARY_MAGIC)
+    prev_lat, prev_lng = 0, 0
+    for i in range(0, len(coords), 2):
+        for delta in (coords[i] - prev_lat, coords[i + 1] - prev_lng):
+            value = (delta << 1) ^ (delta >> 63)
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        prev_lat, prev_lng = coords[i], coords[i + 1]
+    return bytes(out)
+
+
+def from_binary(data):
+    """Unpacks to_binary() output into an array('i')."""
+    coords = array("i")
+    if not data:
+        return coords
+    if not data.startswith(BINARY_MAGIC):
+        raise ValueError("Not a packed polyline")
+    index, length = len(BINARY_MAGIC), len(data)
+    previous = [0, 0]
+    axis = 0
+    while index < length:
+        shift, value = 0, 0
+        while True:
+            byte = data[index]
+            index += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        previous[axis] += (value >> 1) ^ -(value & 1)
+        coords.append(previous[axis])
+        axis ^= 1
+    return coords
+
+
+def zoom_tolerance(zoom, pixels=SIMPLIFY_PIXELS):
+    """
+    Simplification tolerance (in 1e-5 degrees) for a web-mercator zoom level.
+
+    One 256px tile spans 360 / 2**zoom degrees of longitude, so a pixel is
+    360 / (256 * 2**zoom) degrees at every latitude.
+    """
+    return pixels * 360.0 / (256 * 2 ** zoom) * SCALE
+
+
+def simplify(coords, tolerance):
+    """
+    Douglas-Peucker simplification of interleaved coordinates.
+
+    Iterative (no recursion limit on long routes). Returns a new array('i')
+    that always keeps the first and last point.
+    """
+    count = len(coords) // 2
+    if count <= 2 or tolerance <= 0:
+        return array("i", coords)
+
+    keep = bytearray(count)
+    keep[0] = keep[count - 1] = 1
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = coords[2 * first + 1], coords[2 * first]
+        bx, by = coords[2 * last + 1], coords[2 * last]
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+
+        max_dist_sq, index = -1.0, first
+        for i in range(first + 1, last):
+            px, py = coords[2 * i + 1], coords[2 * i]
+            if length_sq == 0:
+                dist_sq = (px - ax) ** 2 + (py - ay) ** 2
+            else:
+                cross = dx * (py - ay) - dy * (px - ax)
+                dist_sq = cross * cross / length_sq
+            if dist_sq > max_dist_sq:
+                max_dist_sq, index = dist_sq, i
+
+        if max_dist_sq > tolerance_sq:
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+
+    simplified = array("i")
+    for i in range(count):
+        if keep[i]:
+            simplified.append(coords[2 * i])
+            simplified.append(coords[2 * i + 1])
+    return simplified
+
+
+def to_latlng(coords):
+    """[[lat, lng], ...] in degrees, for JSON responses."""
+    return [[coords[i] / SCALE, coords[i + 1] / SCALE] for i in range(0, len(coords), 2)]
@@ -0,0 +1,195 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+STRAVA_RATE_LIMIT_FILE = os.getenv(
+    "STRAVA_RATE_LIMIT_FILE", os.path.join(tempfile.gettempdir(), "triathlonforge_strava_ratelimit.json")
+)
+# Strava's default application limits; replaced by the X-RateLimit-Limit header once seen.
+STRAVA_SHORT_LIMIT = int(os.getenv("STRAVA_SHORT_LIMIT", 200))
+STRAVA_DAILY_LIMIT = int(os.getenv("STRAVA_DAILY_LIMIT", 2000))
+# Bulk calls are paced by a token bucket refilled at short_limit / 15 minutes,
+# holding at most this many tokens.
+STRAVA_RATE_BURST = int(os.getenv("STRAVA_RATE_BURST", 20))
+# Share of each window that only interactive calls may use.
+STRAVA_INTERACTIVE_RESERVE = float(os.getenv("STRAVA_INTERACTIVE_RESERVE", 0.2))
+# Longest a call waits for budget before RateLimitExceeded. Bulk calls run in
+# job workers and may wait out a window; interactive calls run on web request
+# threads, which must answer (with a 429) well within gunicorn's timeout.
+STRAVA_RATE_MAX_WAIT = float(os.getenv("STRAVA_RATE_MAX_WAIT", 900))
+STRAVA_RATE_MAX_WAIT_INTERACTIVE = float(os.getenv("STRAVA_RATE_MAX_WAIT_INTERACTIVE", 2))
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+SHORT_WINDOW = 15 * 60
+DAILY_WINDOW = 24 * 60 * 60
+
+
+class RateLimitExceeded(Exception):
+    """Raised when no Strava request budget frees up within the allowed wait."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitScheduler:
+    """
+    Strava request budget shared by every worker process on the host.
+
+    The state lives in a small JSON file guarded by an exclusive flock, so all
+    gunicorn workers and sync workers draw from the same 15-minute and daily
+    quotas. Usage is corrected from Strava's X-RateLimit-* headers after each
+    response. Interactive calls may use the whole remaining quota; bulk calls
+    (backfills) are paced by a token bucket and leave a reserve untouched.
+    """
+
+    def __init__(self, path=STRAVA_RATE_LIMIT_FILE, burst=STRAVA_RATE_BURST, reserve=STRAVA_INTERACTIVE_RESERVE,
+                 max_wait=STRAVA_RATE_MAX_WAIT, interactive_max_wait=STRAVA_RATE_MAX_WAIT_INTERACTIVE):
+        self.path = path
+        self.burst = burst
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.interactive_max_wait = interactive_max_wait
+        self._thread_lock = threading.Lock()
+
+    def _locked_update(self, update):
+        """Runs update(state, now) under the file lock and persists the result."""
+        with self._thread_lock, open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        state = json.load(f)
+                except (OSError, ValueError):
+                    state = {}
+
+                now = time.time()
+                self._roll_windows(state, now)
+                result = update(state, now)
+
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.path)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _roll_windows(self, state, now):
+        short_start = now - now % SHORT_WINDOW
+        daily_start = now - now % DAILY_WINDOW
+        state.setdefault("short_limit", STRAVA_SHORT_LIMIT)
+        state.setdefault("daily_limit", STRAVA_DAILY_LIMIT)
+        if state.get("short_window") != short_start:
+            state["short_window"] = short_start
+            state["short_used"] = 0
+        if state.get("daily_window") != daily_start:
+            state["daily_window"] = daily_start
+            state["daily_used"] = 0
+
+        rate = state["short_limit"] / SHORT_WINDOW
+        tokens = state.get("tokens", self.burst) + (now - state.get("tokens_at", now)) * rate
+        state["tokens"] = min(tokens, self.burst)
+        state["tokens_at"] = now
+
+    def _try_acquire(self, state, now, priority):
+        short_left = state["short_limit"] - state["short_used"]
+        daily_left = state["daily_limit"] - state["daily_used"]
+
+        if priority == PRIORITY_BULK:
+            short_left -= int(state["short_limit"] * self.reserve)
+            daily_left -= int(state["daily_limit"] * self.reserve)
+
+        if daily_left <= 0:
+            return state["daily_window"] + DAILY_WINDOW - now
+        if short_left <= 0:
+            return state["short_window"] + SHORT_WINDOW - now
+        if priority == PRIORITY_BULK:
+            if state["tokens"] < 1:
+                return (1 - state["tokens"]) / (state["short_limit"] / SHORT_WINDOW)
+            state["tokens"] -= 1
+
+        state["short_used"] += 1
+        state["daily_used"] += 1
+        return 0
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        """
+        Blocks until a request may be sent. Raises RateLimitExceeded (with
+        `retry_after` in seconds) if that would take longer than the
+        priority's maximum wait.
+        """
+        max_wait = self.interactive_max_wait if priority == PRIORITY_INTERACTIVE else self.max_wait
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self._locked_update(lambda state, now: self._try_acquire(state, now, priority))
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"Strava rate limit reached; next slot in {int(wait)}s",
+                                        retry_after=int(wait) + 1)
+            time.sleep(min(wait, 5))
+
+    def record_response(self, headers, status_code=None):
+        """Corrects the shared usage from Strava's X-RateLimit-Limit / X-RateLimit-Usage headers."""
+        limits = _parse_pair(headers.get("X-RateLimit-Limit"))
+        usage = _parse_pair(headers.get("X-RateLimit-Usage"))
+        if not limits and not usage and status_code != 429:
+            return
+
+        def update(state, now):
+            if limits:
+                state["short_limit"], state["daily_limit"] = limits
+            if usage:
+                # Other hosts may share the same Strava app, so never trust a lower local count.
+                state["short_used"] = max(state["short_used"], usage[0])
+                state["daily_used"] = max(state["daily_used"], usage[1])
+            if status_code == 429:
+                state["short_used"] = max(state["short_used"], state["short_limit"])
+
+        self._locked_update(update)
+
+    def status(self):
+        """Remaining budget in the current 15-minute and daily windows."""
+
+        def read(state, now):
+            return {
+                "short_limit": state["short_limit"],
+                "short_used": state["short_used"],
+                "short_remaining": max(state["short_limit"] - state["short_used"], 0),
+                "short_resets_in": int(state["short_window"] + SHORT_WINDOW - now),
+                "daily_limit": state["daily_limit"],
+                "daily_used": state["daily_used"],
+                "daily_remaining": max(state["daily_limit"] - state["daily_used"], 0),
+                "daily_resets_in": int(state["daily_window"] + DAILY_WINDOW - now),
+                "bulk_tokens": round(state["tokens"], 2),
+                "interactive_reserve": self.reserve,
+            }
+
+        return self._locked_update(read)
+
+
+def _parse_pair(value):
+    """Parses a "short,daily" header value such as "200,2000"."""
+    if not value:
+        return None
+    try:
+        short, daily = (int(part) for part in value.split(",")[:2])
+    except ValueError:
+        return None
+    return short, daily
+
+
+_scheduler = None
+
+
+def get_rate_limit_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RateLimitScheduler()
+    return _scheduler
@@ -0,0 +1,147 @@
+from datetime import date, timedelta
+
+import click
+
+from app.utils.database import get_db_connection
+from app.utils.sports import sport_of
+
+PERIODS = ("week", "month")
+ROLLUP_COLUMNS = ("activity_count", "distance", "duration", "elevation_gain", "calories_burned")
+
+
+def period_start(day, period):
+    """Monday of the week or first day of the month containing `day`."""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _period_end(day, period):
+    if period == "week":
+        return period_start(day, "week") + timedelta(days=6)
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def update_activity_rollups(conn, user_id, from_date=None, to_date=None):
+    """
+    Recomputes the user's weeks and months that overlap [from_date, to_date].
+
+    Only those periods are re-aggregated (one GROUP BY over the affected date
+    range, served by the (user_id, date) index) and replaced, so re-synced
+    activities are never counted twice. Without dates all of the user's
+    rollups are rebuilt. Returns the number of rollup rows written.
+    """
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        if from_date is None or to_date is None:
+            cursor.execute("SELECT MIN(date) AS first_day, MAX(date) AS last_day FROM activities WHERE user_id = %s",
+                           (user_id,))
+            bounds = cursor.fetchone()
+            cursor.execute("DELETE FROM activity_rollups WHERE user_id = %s", (user_id,))
+            if bounds["first_day"] is None:
+                conn.commit()
+                return 0
+            from_date, to_date = bounds["first_day"], bounds["last_day"]
+        from_date = date.fromisoformat(str(from_date)[:10])
+        to_date = date.fromisoformat(str(to_date)[:10])
+
+        ranges = {period: (period_start(from_date, period), _period_end(to_date, period)) for period in PERIODS}
+        range_start = min(start for start, _ in ranges.values())
+        range_end = max(end for _, end in ranges.values())
+
+        cursor.execute("""
+            SELECT date, activity_type, COUNT(*) AS activity_count,
+                   COALESCE(SUM(distance), 0) AS distance, COALESCE(SUM(duration), 0) AS duration,
+                   COALESCE(SUM(elevation_gain), 0) AS elevation_gain,
+                   COALESCE(SUM(calories_burned), 0) AS calories_burned
+            FROM activities
+            WHERE user_id = %s AND date BETWEEN %s AND %s
+            GROUP BY date, activity_type
+        """, (user_id, range_start, range_end))
+
+        totals = {}
+        for row in cursor.fetchall():
+            day = date.fromisoformat(str(row["date"])[:10])
+            sport = sport_of(row["activity_type"])
+            for period in PERIODS:
+                start = period_start(day, period)
+                if not ranges[period][0] <= start <= ranges[period][1]:
+                    continue
+                bucket = totals.setdefault((period, start, sport), [0.0] * len(ROLLUP_COLUMNS))
+                for i, column in enumerate(ROLLUP_COLUMNS):
+                    bucket[i] += float(row[column])  # SUM() returns Decimal
+
+        for period, (start, end) in ranges.items():
+            cursor.execute(
+                "DELETE FROM activity_rollups WHERE user_id = %s AND period = %s AND period_start BETWEEN %s AND %s",
+                (user_id, period, start, end)
+            )
+        if totals:
+            cursor.executemany(f"""
+                INSERT INTO activity_rollups (user_id, period, period_start, sport, {', '.join(ROLLUP_COLUMNS)})
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, [(user_id, period, start, sport, int(values[0]), float(values[1]), int(values[2]),
+                   float(values[3]), float(values[4]))
+                  for (period, start, sport), values in totals.items()])
+        conn.commit()
+        return len(totals)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def get_rollups(conn, user_id, period, from_date=None, to_date=None, sports=None):
+    """Rollup rows for the user, oldest period first. Only reads activity_rollups."""
+    query = f"""
+        SELECT period_start, sport, {', '.join(ROLLUP_COLUMNS)}
+        FROM activity_rollups
+        WHERE user_id = %s AND period = %s
+    """
+    params = [user_id, period]
+    if from_date:
+        query += " AND period_start >= %s"
+        params.append(period_start(from_date, period))
+    if to_date:
+        query += " AND period_start <= %s"
+        params.append(to_date)
+    if sports:
+        query += f" AND sport IN ({', '.join(['%s'] * len(sports))})"
+        params += list(sports)
+    query += " ORDER BY period_start, sport"
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+@click.command("rebuild-rollups")
+@click.option("--user-id", type=int, default=None, help="Only this user (default: every user with activities).")
+def rebuild_rollups_command(user_id):
+    """Rebuild activity_rollups from the activities table (after backfills or manual edits)."""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException("Database connection failed.")
+    cursor = conn.cursor()
+    try:
+        if user_id is None:
+            # Users whose activities were all deleted lose their old rollup rows too
+            cursor.execute("SELECT user_id FROM activities UNION SELECT user_id FROM activity_rollups")
+            user_ids = [row[0] for row in cursor.fetchall()]
+        else:
+            user_ids = [user_id]
+        for uid in user_ids:
+            rows = update_activity_rollups(conn, uid)
+            click.echo(f"User {uid}: {rows} rollup rows")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_rollups_command)
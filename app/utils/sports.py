@@ -0,0 +1,13 @@
+# Strava activity types grouped into the three triathlon disciplines.
+SPORT_TYPES = {
+    "swim": ("Swim",),
+    "bike": ("Ride", "VirtualRide", "EBikeRide", "GravelRide", "MountainBikeRide", "Handcycle", "Velomobile"),
+    "run": ("Run", "TrailRun", "VirtualRun", "Walk", "Hike"),
+}
+ACTIVITY_TYPE_SPORT = {activity_type: sport for sport, types in SPORT_TYPES.items() for activity_type in types}
+SPORTS = tuple(SPORT_TYPES) + ("other",)
+
+
+def sport_of(activity_type):
+    """Maps a Strava activity type (e.g. "VirtualRide") to swim, bike, run or other."""
+    return ACTIVITY_TYPE_SPORT.get(activity_type, "other")
@@ -0,0 +1,166 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.metrics import record_upstream
+from app.utils.rate_limit import PRIORITY_INTERACTIVE, get_rate_limit_scheduler
+
+STRAVA_CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
+STRAVA_CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
+STRAVA_API_URL = os.getenv("STRAVA_API_URL", "https://www.strava.com/api/v3")
+STRAVA_OAUTH_URL = os.getenv("STRAVA_OAUTH_URL", "https://www.strava.com/oauth")
+STRAVA_CONCURRENCY = int(os.getenv("STRAVA_CONCURRENCY", 8))
+STRAVA_TIMEOUT = float(os.getenv("STRAVA_TIMEOUT", 10))
+STRAVA_MAX_RETRIES = int(os.getenv("STRAVA_MAX_RETRIES", 3))
+STRAVA_BACKOFF = float(os.getenv("STRAVA_BACKOFF", 0.5))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class StravaClient:
+    """
+    Strava API client sharing one keep-alive `requests.Session`.
+
+    Connections are pooled per host, so consecutive calls reuse the TLS
+    session instead of handshaking every time. Failed calls (connection
+    errors, timeouts, 429 and 5xx) are retried with exponential backoff,
+    and activity details are fetched concurrently on a bounded thread pool.
+    API calls (not OAuth) first draw from the shared rate-limit scheduler and
+    report Strava's rate-limit headers back to it.
+
+    Token exchanges are never retried: Strava rotates refresh tokens, so a
+    retry after a lost response could send one that was already spent.
+    """
+
+    def __init__(self, concurrency=STRAVA_CONCURRENCY, timeout=STRAVA_TIMEOUT, max_retries=STRAVA_MAX_RETRIES,
+                 backoff=STRAVA_BACKOFF, api_url=STRAVA_API_URL, oauth_url=STRAVA_OAUTH_URL, scheduler=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.api_url = api_url.rstrip("/")
+        self.oauth_url = oauth_url.rstrip("/")
+        self.scheduler = scheduler or get_rate_limit_scheduler()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="strava")
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = self.backoff * (2 ** attempt)
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            delay = max(delay, int(response.headers["Retry-After"]))
+        time.sleep(delay + random.uniform(0, self.backoff))
+
+    def request(self, method, url, access_token=None, priority=PRIORITY_INTERACTIVE, retry=True, **kwargs):
+        """Sends a request, retrying transient failures unless `retry` is False. Returns the final response."""
+        if not url.startswith("http"):
+            url = f"{self.api_url}/{url.lstrip('/')}"
+        rate_limited = url.startswith(self.api_url)
+        headers = kwargs.pop("headers", {})
+        if access_token:
+            headers["Authorization"] = f"Bearer {access_token}"
+        kwargs.setdefault("timeout", self.timeout)
+        max_retries = self.max_retries if retry else 0
+
+        for attempt in range(max_retries + 1):
+            if rate_limited:
+                self.scheduler.acquire(priority)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                record_upstream("strava", "error", time.perf_counter() - start)
+                if attempt == max_retries:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+            record_upstream("strava", response.status_code, time.perf_counter() - start)
+            if rate_limited:
+                self.scheduler.record_response(response.headers, response.status_code)
+
+            if response.status_code in RETRY_STATUSES and attempt < max_retries:
+                self._sleep_before_retry(attempt, response)
+                continue
+            return response
+
+    def exchange_token(self, payload):
+        """POSTs to /oauth/token (authorization_code or refresh_token grant). Never retried."""
+        return self.request("POST", f"{self.oauth_url}/token", retry=False, data=payload)
+
+    def refresh_access_token(self, refresh_token):
+        return self.exchange_token({
+            "client_id": STRAVA_CLIENT_ID,
+            "client_secret": STRAVA_CLIENT_SECRET,
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token"
+        })
+
+    def list_activities(self, access_token, page=1, per_page=200, after=None, priority=PRIORITY_INTERACTIVE):
+        params = {"page": page, "per_page": per_page}
+        if after is not None:
+            params["after"] = after
+        return self.request("GET", "athlete/activities", access_token, priority, params=params)
+
+    def get_activity(self, access_token, activity_id, priority=PRIORITY_INTERACTIVE):
+        return self.request("GET", f"activities/{activity_id}", access_token, priority)
+
+    def fetch_activity_details(self, access_token, activity_ids, priority=PRIORITY_INTERACTIVE, retryable=None):
+        """
+        Fetches /activities/{id} for every id concurrently.
+
+        Returns a dict mapping each id to its detail JSON, or to None if the
+        detail could not be fetched, so one failing activity does not abort
+        the whole sync. If `retryable` is a set, it is filled with the ids
+        whose failure was transient (connection errors, 401, 429, 5xx, a 200
+        whose body is not JSON), as opposed to permanent ones such as a 404
+        for a deleted or private activity. RateLimitExceeded is raised
+        instead when the request budget runs out, since every remaining call
+        would fail the same way.
+        """
+
+        def fetch(activity_id):
+            try:
+                response = self.get_activity(access_token, activity_id, priority)
+            except requests.RequestException as e:
+                print(f"[STRAVA ERROR] activity {activity_id}: {e}")
+                return activity_id, None, True
+            if response.status_code != 200:
+                return activity_id, None, response.status_code in RETRY_STATUSES or response.status_code == 401
+            try:
+                return activity_id, response.json(), False
+            except ValueError as e:
+                # A truncated or non-JSON 200 (e.g. from a proxy) is worth another try
+                print(f"[STRAVA ERROR] activity {activity_id}: invalid JSON ({e})")
+                return activity_id, None, True
+
+        details = {}
+        for activity_id, detail, transient in self._executor.map(fetch, activity_ids):
+            details[activity_id] = detail
+            if transient and retryable is not None:
+                retryable.add(activity_id)
+        return details
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_strava_client():
+    """Returns the process-wide Strava client, creating a fresh one after a fork."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = StravaClient()
+                _client_pid = pid
+    return _client
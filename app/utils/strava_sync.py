@@ -0,0 +1,180 @@
+import os
+from datetime import datetime, timezone
+
+from app.utils.activity_store import ACTIVITY_DATE_INDEX, strava_activity_row, upsert_strava_activities
+from app.utils.rate_limit import PRIORITY_BULK, RateLimitExceeded
+from app.utils.rollups import update_activity_rollups
+from app.utils.streams import ingest_streams
+from app.utils.strava_client import get_strava_client
+from app.utils.strava_tokens import get_token_manager
+from app.utils.training_load import update_training_load
+
+# Incremental syncs re-read this many seconds before the watermark, so activities
+# uploaded late (e.g. a watch synced a day after the workout) are still picked up.
+STRAVA_SYNC_OVERLAP = int(os.getenv("STRAVA_SYNC_OVERLAP", 86400))
+STRAVA_PAGE_SIZE = 200
+# Also download /streams for every synced activity (one extra API call each).
+STRAVA_SYNC_STREAMS = os.getenv("STRAVA_SYNC_STREAMS", "false").lower() in ("1", "true", "yes")
+
+
+class StravaSyncError(Exception):
+    """Raised when a sync cannot continue because Strava refused a listing call."""
+
+    def __init__(self, message, status_code=None, error=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error = error
+
+
+def _start_date_epoch(start_date):
+    """Converts Strava's `start_date` (UTC, e.g. 2025-08-18T06:30:00Z) to a Unix timestamp."""
+    if not start_date:
+        return None
+    return int(datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp())
+
+
+def update_derived_tables(conn, user_id, first_day=None, last_day=None):
+    """
+    Brings training load and volume rollups up to date after activities
+    between `first_day` and `last_day` changed. Without dates both are rebuilt
+    from the user's whole history. Failures are logged, not raised: the
+    activities themselves are already committed.
+    """
+    try:
+        update_training_load(conn, user_id, first_day)
+    except Exception as e:
+        print(f"[TRAINING LOAD ERROR] user {user_id}: {e}")
+    try:
+        update_activity_rollups(conn, user_id, first_day, last_day)
+    except Exception as e:
+        print(f"[ROLLUPS ERROR] user {user_id}: {e}")
+
+
+def sync_user_activities(conn, user_id, full=False, progress=None):
+    """
+    Pulls the user's activities from Strava and stores them in the database.
+
+    Only activities newer than the user's sync watermark (the latest start_date
+    seen by a previous sync) are requested, using Strava's `after=` filter,
+    unless `full` is set. Activities are written page by page, and
+    `progress(pages_fetched, activities_written, errors)` is called after each
+    page so callers can report how far the sync got.
+
+    Training load and the weekly/monthly rollups are then recomputed for the
+    date range the written activities fall into.
+
+    Activities whose details could not be fetched are written without them
+    (stored details are kept). If the failure was transient, the watermark
+    stays before the earliest such activity so the next incremental sync
+    fetches it again; permanent failures (e.g. a 404) do not hold it back,
+    or a single deleted activity would pin it forever. If the rate limit
+    runs out, the page is not written and StravaSyncError (429) is raised.
+
+    Returns a dict with the final counters. Raises StravaTokenError if the user
+    does not exist or has no usable token, StravaSyncError if Strava rejects
+    the listing calls.
+    """
+    client = get_strava_client()
+    tokens = get_token_manager()
+    access_token = tokens.get_token(conn, user_id, client)
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+
+        after = None
+        if not full:
+            cursor.execute("SELECT last_start_date FROM strava_sync_state WHERE user_id = %s", (user_id,))
+            state = cursor.fetchone()
+            if state and state["last_start_date"]:
+                after = max(state["last_start_date"] - STRAVA_SYNC_OVERLAP, 0)
+
+        pages_fetched, activities_written, errors = 0, 0, 0
+        watermark = None
+        retry_from = None  # start_date of the earliest activity left without details
+        first_day, last_day = None, None
+        page = 1
+
+        while True:
+            resp = client.list_activities(access_token, page=page, per_page=STRAVA_PAGE_SIZE, after=after,
+                                          priority=PRIORITY_BULK)
+            if resp.status_code != 200:
+                if resp.status_code == 401:
+                    tokens.invalidate(user_id)  # revoked or expired early
+                raise StravaSyncError("Failed to fetch activities", resp.status_code, resp.text)
+
+            activities = resp.json()
+            if not activities:
+                break
+            pages_fetched += 1
+
+            # Details (location, gear, polyline) in parallel over the shared session
+            retryable = set()
+            try:
+                details = client.fetch_activity_details(access_token, [act.get("id") for act in activities],
+                                                        priority=PRIORITY_BULK, retryable=retryable)
+            except RateLimitExceeded as e:
+                # The page is not written; the watermark stays, so the next sync fetches it again
+                if first_day:
+                    update_derived_tables(conn, user_id, first_day, last_day)
+                raise StravaSyncError("Strava rate limit reached", 429, str(e))
+            errors += sum(1 for detail in details.values() if detail is None)
+
+            rows = [strava_activity_row(user_id, act, details.get(act.get("id"))) for act in activities]
+            local_ids = {}
+            activities_written += upsert_strava_activities(conn, user_id, rows, resolved_ids=local_ids)
+
+            if STRAVA_SYNC_STREAMS:
+                try:
+                    ingest_streams(conn, client, access_token,
+                                   [(local_id, strava_id) for strava_id, local_id in local_ids.items()],
+                                   priority=PRIORITY_BULK)
+                except RateLimitExceeded as e:
+                    # Streams are optional; /streams fetches missing ones on demand
+                    print(f"[STREAMS ERROR] user {user_id}: {e}")
+
+            days = [values[ACTIVITY_DATE_INDEX] for values, _ in rows if values[ACTIVITY_DATE_INDEX]]
+            if days:
+                first_day = min(days + ([first_day] if first_day else []))
+                last_day = max(days + ([last_day] if last_day else []))
+
+            for act in activities:
+                start = _start_date_epoch(act.get("start_date"))
+                if start is None:
+                    continue
+                if watermark is None or start > watermark:
+                    watermark = start
+                if act.get("id") in retryable and (retry_from is None or start < retry_from):
+                    retry_from = start
+
+            if progress:
+                progress(pages_fetched, activities_written, errors)
+            page += 1
+
+        if retry_from is not None:
+            # The watermark goes before the activity without details, below the stored one if needed
+            watermark = min(watermark, retry_from - 1)
+
+        # Move the watermark only once every activity is written
+        cursor.execute("""
+            INSERT INTO strava_sync_state (user_id, last_start_date, last_synced_at, last_full_sync_at)
+            VALUES (%s, %s, UTC_TIMESTAMP(), IF(%s, UTC_TIMESTAMP(), NULL))
+            ON DUPLICATE KEY UPDATE
+                last_start_date = IF(%s, LEAST(COALESCE(last_start_date, VALUES(last_start_date)),
+                                               VALUES(last_start_date)),
+                                     GREATEST(COALESCE(last_start_date, 0), COALESCE(VALUES(last_start_date), 0))),
+                last_synced_at = VALUES(last_synced_at),
+                last_full_sync_at = COALESCE(VALUES(last_full_sync_at), last_full_sync_at)
+        """, (user_id, watermark, full, retry_from is not None))
+        conn.commit()
+
+        if first_day:
+            update_derived_tables(conn, user_id, None if full else first_day, None if full else last_day)
+
+        return {
+            "pages_fetched": pages_fetched,
+            "activities_written": activities_written,
+            "errors": errors,
+            "full": full,
+            "after": after,
+        }
+    finally:
+        cursor.close()
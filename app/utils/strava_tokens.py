@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+
+import requests
+
+from app.utils.metrics import STRAVA_TOKEN_REFRESHES
+from app.utils.strava_client import get_strava_client
+
+# Tokens are refreshed once they expire within this many seconds, so a sync
+# never starts with a token that runs out halfway through.
+STRAVA_TOKEN_REFRESH_MARGIN = int(os.getenv("STRAVA_TOKEN_REFRESH_MARGIN", 600))
+# How long a process trusts its cached copy before re-reading `users` (bounds
+# how long a token revoked through another worker keeps being used).
+STRAVA_TOKEN_CACHE_TTL = int(os.getenv("STRAVA_TOKEN_CACHE_TTL", 300))
+STRAVA_TOKEN_CACHE_SIZE = int(os.getenv("STRAVA_TOKEN_CACHE_SIZE", 10000))
+# Seconds to wait for another worker's refresh of the same user (MySQL GET_LOCK).
+STRAVA_TOKEN_LOCK_TIMEOUT = int(os.getenv("STRAVA_TOKEN_LOCK_TIMEOUT", 30))
+# After a failed early refresh the still valid old token is reused for this many
+# seconds before the next refresh attempt, so a Strava outage is not hit on every call.
+STRAVA_TOKEN_RETRY_AFTER = int(os.getenv("STRAVA_TOKEN_RETRY_AFTER", 60))
+
+
+class StravaTokenError(Exception):
+    """Raised when no usable token can be had (unknown user, Strava not connected, refresh refused)."""
+
+    def __init__(self, message, status_code=None, error=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error = error
+
+
+class TokenManager:
+    """
+    Hands out valid Strava access tokens per user.
+
+    Valid tokens are cached in process until they come within `margin`
+    seconds of expiry (at most `ttl` seconds); when the cache is full, expired
+    entries and then the ones expiring soonest are evicted. A token that is
+    about to expire is refreshed ahead of time, with at most one refresh per
+    user in flight: threads of this process wait on a per-user lock, and
+    processes (web and job workers) on a MySQL named lock, after which the
+    stored token is read again so a refresh another worker just finished is
+    reused instead of repeated with an already rotated refresh token.
+    """
+
+    def __init__(self, margin=STRAVA_TOKEN_REFRESH_MARGIN, ttl=STRAVA_TOKEN_CACHE_TTL,
+                 max_entries=STRAVA_TOKEN_CACHE_SIZE, lock_timeout=STRAVA_TOKEN_LOCK_TIMEOUT,
+                 retry_after=STRAVA_TOKEN_RETRY_AFTER):
+        self.margin = margin
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+        self._entries = {}  # user_id -> (cached_until, access_token)
+        self._lock = threading.Lock()
+        self._refresh_locks = {}  # user_id -> [lock, number of threads using it]
+
+    def _cached(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[user_id]
+                return None
+            return entry[1]
+
+    def store(self, user_id, access_token, expires_at, ttl=None):
+        """
+        Caches a token known to be current (e.g. just received from the OAuth callback).
+
+        With `ttl` the token is cached for that many seconds, up to its real
+        expiry rather than `margin` before it (a fallback after a failed refresh).
+        """
+        user_id = int(user_id)
+        now = time.time()
+        if ttl is None:
+            cached_until = min((expires_at or 0) - self.margin, now + self.ttl)
+        else:
+            cached_until = min(expires_at or 0, now + ttl)
+        if not access_token or cached_until <= now:
+            return
+        with self._lock:
+            self._entries[user_id] = (cached_until, access_token)
+            if len(self._entries) > self.max_entries:
+                self._evict(now)
+
+    def _evict(self, now):
+        for user_id in [user_id for user_id, entry in self._entries.items() if entry[0] <= now]:
+            del self._entries[user_id]
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            # The rest are evicted by expiry, in a batch so it does not sort on every store
+            soonest = sorted(self._entries, key=lambda user_id: self._entries[user_id][0])
+            for user_id in soonest[:overflow + self.max_entries // 10]:
+                del self._entries[user_id]
+
+    def invalidate(self, user_id):
+        """Drops the cached token (Strava rejected it, or the athlete disconnected)."""
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+    def _refresh_lock(self, user_id):
+        with self._lock:
+            entry = self._refresh_locks.setdefault(user_id, [threading.Lock(), 0])
+            entry[1] += 1
+        return entry
+
+    def _release_refresh_lock(self, user_id, entry):
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._refresh_locks[user_id]
+
+    def _stored(self, cursor, user_id):
+        cursor.execute("""
+            SELECT strava_access_token, strava_refresh_token, strava_token_expires_at
+            FROM users WHERE user_id = %s
+        """, (user_id,))
+        user = cursor.fetchone()
+        if not user:
+            raise StravaTokenError("User not found", status_code=404)
+        if not user["strava_refresh_token"]:
+            raise StravaTokenError("User has not connected Strava", status_code=400)
+        return user
+
+    def _usable(self, user):
+        return user["strava_access_token"] and (user["strava_token_expires_at"] or 0) - self.margin > time.time()
+
+    def get_token(self, conn, user_id, client=None):
+        """Returns a valid access token for the user. Raises StravaTokenError if there is none."""
+        user_id = int(user_id)
+        token = self._cached(user_id)
+        if token:
+            return token
+
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            user = self._stored(cursor, user_id)
+        finally:
+            cursor.close()
+        if self._usable(user):
+            self.store(user_id, user["strava_access_token"], user["strava_token_expires_at"])
+            return user["strava_access_token"]
+
+        entry = self._refresh_lock(user_id)
+        try:
+            with entry[0]:
+                # Another thread may have refreshed the token while we waited
+                token = self._cached(user_id)
+                if token:
+                    return token
+                return self._refresh(conn, user_id, client or get_strava_client())
+        finally:
+            self._release_refresh_lock(user_id, entry)
+
+    def _refresh(self, conn, user_id, client):
+        lock_name = f"strava_token:{user_id}"
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, %s) AS acquired", (lock_name, self.lock_timeout))
+            if not cursor.fetchone()["acquired"]:
+                raise StravaTokenError("Timed out waiting for a Strava token refresh", status_code=503)
+            try:
+                # End the read snapshot so a refresh committed by another worker is visible
+                conn.commit()
+                user = self._stored(cursor, user_id)
+                if self._usable(user):
+                    STRAVA_TOKEN_REFRESHES.inc("reused")
+                    self.store(user_id, user["strava_access_token"], user["strava_token_expires_at"])
+                    return user["strava_access_token"]
+
+                try:
+                    response = client.refresh_access_token(user["strava_refresh_token"])
+                except requests.RequestException as e:
+                    return self._refresh_failed(user_id, user, StravaTokenError(
+                        "Failed to refresh Strava token", 502, f"{type(e).__name__}: {e}"))
+                if response.status_code != 200:
+                    return self._refresh_failed(user_id, user, StravaTokenError(
+                        "Failed to refresh Strava token", response.status_code, response.text))
+                try:
+                    tokens = response.json()
+                    tokens = {key: tokens[key] for key in ("access_token", "refresh_token", "expires_at")}
+                except (ValueError, KeyError, TypeError):
+                    return self._refresh_failed(user_id, user, StravaTokenError(
+                        "Strava returned an invalid token response", 502, response.text))
+
+                cursor.execute("""
+                    UPDATE users
+                    SET strava_access_token = %s, strava_refresh_token = %s, strava_token_expires_at = %s
+                    WHERE user_id = %s
+                """, (tokens["access_token"], tokens["refresh_token"], tokens["expires_at"], user_id))
+                conn.commit()
+                STRAVA_TOKEN_REFRESHES.inc("refreshed")
+                self.store(user_id, tokens["access_token"], tokens["expires_at"])
+                return tokens["access_token"]
+            finally:
+                cursor.execute("DO RELEASE_LOCK(%s)", (lock_name,))
+        finally:
+            cursor.close()
+
+    def _refresh_failed(self, user_id, user, error):
+        """
+        Falls back to the stored token if it has not expired yet, otherwise raises
+        `error`. The fallback is cached for `retry_after` seconds, so the next
+        refresh is not attempted on every call.
+        """
+        STRAVA_TOKEN_REFRESHES.inc("failed")
+        if user["strava_access_token"] and (user["strava_token_expires_at"] or 0) > time.time():
+            # The early refresh failed, but the old token is still valid
+            print(f"[STRAVA TOKEN ERROR] user {user_id}: {error} ({error.status_code})")
+            self.store(user_id, user["strava_access_token"], user["strava_token_expires_at"], ttl=self.retry_after)
+            return user["strava_access_token"]
+        raise error
+
+
+_manager = None
+_manager_pid = None
+_manager_lock = threading.Lock()
+
+
+def get_token_manager():
+    """Returns the process-wide token manager, creating a fresh one after a fork."""
+    global _manager, _manager_pid
+    pid = os.getpid()
+    if _manager is None or _manager_pid != pid:
+        with _manager_lock:
+            if _manager is None or _manager_pid != pid:
+                _manager = TokenManager()
+                _manager_pid = pid
+    return _manager
+
+
+def get_user_access_token(conn, user_id, client=None):
+    """Returns a valid Strava access token for the user, refreshing it if it is about to expire."""
+    return get_token_manager().get_token(conn, user_id, client)
@@ -0,0 +1,281 @@
+import json
+import os
+import time
+
+import click
+
+from app.utils.activity_store import ACTIVITY_DATE_INDEX, strava_activity_row, upsert_strava_activities
+from app.utils.cache import get_cache
+from app.utils.database import get_db_connection
+from app.utils.rate_limit import PRIORITY_BULK
+from app.utils.streams import delete_streams
+from app.utils.strava_client import get_strava_client
+from app.utils.strava_sync import update_derived_tables
+from app.utils.strava_tokens import get_token_manager, get_user_access_token
+
+STRAVA_WEBHOOK_VERIFY_TOKEN = os.getenv("STRAVA_WEBHOOK_VERIFY_TOKEN")
+# When set, events from any other subscription are ignored.
+STRAVA_WEBHOOK_SUBSCRIPTION_ID = os.getenv("STRAVA_WEBHOOK_SUBSCRIPTION_ID")
+# Events for an object are applied only once it has been quiet this long, so a
+# create followed by a few title/type edits turns into a single activity fetch.
+WEBHOOK_COALESCE_SECONDS = int(os.getenv("WEBHOOK_COALESCE_SECONDS", 5))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 50))
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", 2))
+WEBHOOK_PROCESSING_LEASE = int(os.getenv("WEBHOOK_PROCESSING_LEASE", 300))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 5))
+WEBHOOK_RETRY_BACKOFF = int(os.getenv("WEBHOOK_RETRY_BACKOFF", 60))
+
+EVENT_FIELDS = ("object_type", "object_id", "aspect_type", "owner_id", "event_time")
+
+
+def record_event(conn, event):
+    """
+    Stores a pushed event for the webhook worker.
+
+    Returns False for redeliveries of an event that is already stored.
+    Raises ValueError when required fields are missing.
+    """
+    if any(event.get(field) in (None, "") for field in EVENT_FIELDS):
+        raise ValueError(f"Event must contain {', '.join(EVENT_FIELDS)}")
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT IGNORE INTO strava_webhook_events
+                (subscription_id, object_type, object_id, aspect_type, owner_id, event_time, updates,
+                 received_at, next_attempt_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, UTC_TIMESTAMP(), UTC_TIMESTAMP())
+        """, (
+            event.get("subscription_id"),
+            event["object_type"],
+            int(event["object_id"]),
+            event["aspect_type"],
+            int(event["owner_id"]),
+            int(event["event_time"]),
+            json.dumps(event.get("updates") or {}),
+        ))
+        conn.commit()
+        return cursor.rowcount == 1
+    finally:
+        cursor.close()
+
+
+def _user_for_athlete(cursor, athlete_id):
+    cursor.execute("SELECT user_id FROM users WHERE strava_athlete_id = %s", (athlete_id,))
+    row = cursor.fetchone()
+    return row["user_id"] if row else None
+
+
+def _stored_activity(cursor, user_id, strava_activity_id):
+    cursor.execute(
+        "SELECT activity_id, date FROM activities WHERE user_id = %s AND stravaActivityID = %s",
+        (user_id, strava_activity_id)
+    )
+    return cursor.fetchone()
+
+
+def delete_activity(conn, user_id, strava_activity_id):
+    """Removes one activity with its details and streams. Returns its date, or None if it was not stored."""
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        stored = _stored_activity(cursor, user_id, strava_activity_id)
+        if not stored:
+            return None
+        cursor.execute("DELETE FROM activity_details WHERE activity_id = %s", (stored["activity_id"],))
+        delete_streams(conn, stored["activity_id"])
+        cursor.execute("DELETE FROM activities WHERE activity_id = %s", (stored["activity_id"],))
+        conn.commit()
+        get_cache().invalidate_user(user_id)
+        return stored["date"]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _apply_activity_events(conn, user_id, strava_activity_id, events):
+    """Applies the newest state of one activity: a single fetch and upsert, or a delete."""
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        stored = _stored_activity(cursor, user_id, strava_activity_id)
+    finally:
+        cursor.close()
+    old_day = stored["date"] if stored else None
+
+    if events[-1]["aspect_type"] == "delete":
+        deleted_day = delete_activity(conn, user_id, strava_activity_id)
+        if deleted_day:
+            update_derived_tables(conn, user_id, deleted_day, deleted_day)
+        return
+
+    client = get_strava_client()
+    access_token = get_user_access_token(conn, user_id, client)
+    response = client.get_activity(access_token, strava_activity_id, priority=PRIORITY_BULK)
+    if response.status_code == 401:
+        get_token_manager().invalidate(user_id)
+    if response.status_code == 404:
+        # Deleted or made private before we got to fetch it
+        deleted_day = delete_activity(conn, user_id, strava_activity_id)
+        if deleted_day:
+            update_derived_tables(conn, user_id, deleted_day, deleted_day)
+        return
+    response.raise_for_status()
+
+    detail = response.json()
+    activity_values, detail_values = strava_activity_row(user_id, detail, detail)
+    upsert_strava_activities(conn, user_id, [(activity_values, detail_values)])
+    days = [str(day) for day in (old_day, activity_values[ACTIVITY_DATE_INDEX]) if day]
+    if days:
+        update_derived_tables(conn, user_id, min(days), max(days))
+
+
+def deauthorize_athlete(conn, athlete_id):
+    """Forgets the Strava tokens of an athlete who revoked access. Returns True if a user was found."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT user_id FROM users WHERE strava_athlete_id = %s", (athlete_id,))
+        user_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            UPDATE users
+            SET strava_access_token = NULL, strava_refresh_token = NULL, strava_token_expires_at = NULL
+            WHERE strava_athlete_id = %s
+        """, (athlete_id,))
+        conn.commit()
+        for user_id in user_ids:
+            get_token_manager().invalidate(user_id)
+        return bool(user_ids)
+    finally:
+        cursor.close()
+
+
+def _apply_events(conn, object_type, object_id, owner_id, events):
+    if object_type == "athlete":
+        if any(str(event["updates"].get("authorized")).lower() == "false" for event in events):
+            deauthorize_athlete(conn, owner_id)
+        return
+
+    if object_type != "activity":
+        return
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        user_id = _user_for_athlete(cursor, owner_id)
+    finally:
+        cursor.close()
+    if user_id is None:
+        return  # an athlete not connected to us (or already deauthorized)
+    _apply_activity_events(conn, user_id, object_id, events)
+
+
+def process_webhook_events(conn, batch_size=WEBHOOK_BATCH_SIZE, coalesce_seconds=WEBHOOK_COALESCE_SECONDS):
+    """
+    Applies one batch of stored events. Returns (objects_applied, events_applied, failed).
+
+    Pending events are grouped per object (an activity or an athlete), and an
+    object is only picked up once its newest event is `coalesce_seconds` old.
+    All of its pending events are then claimed together and applied as one
+    change: the activity is fetched once, or deleted if the last event was a
+    delete. Claimed events are leased like the email outbox, and failures are
+    retried with exponential backoff up to WEBHOOK_MAX_ATTEMPTS.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT object_type, object_id, owner_id, MAX(event_id) AS last_event_id
+            FROM strava_webhook_events
+            WHERE status IN ('pending', 'processing') AND next_attempt_at <= UTC_TIMESTAMP()
+            GROUP BY object_type, object_id, owner_id
+            HAVING MAX(received_at) <= UTC_TIMESTAMP() - INTERVAL %s SECOND
+            ORDER BY MIN(event_id)
+            LIMIT %s
+        """, (coalesce_seconds, batch_size))
+        objects = cursor.fetchall()
+        conn.commit()
+
+        applied, events_applied, failed = 0, 0, 0
+        for obj in objects:
+            key = (obj["object_type"], obj["object_id"], obj["owner_id"], obj["last_event_id"])
+            cursor.execute("""
+                UPDATE strava_webhook_events
+                SET status = 'processing', next_attempt_at = UTC_TIMESTAMP() + INTERVAL %s SECOND
+                WHERE object_type = %s AND object_id = %s AND owner_id = %s AND event_id <= %s
+                  AND status IN ('pending', 'processing') AND next_attempt_at <= UTC_TIMESTAMP()
+            """, (WEBHOOK_PROCESSING_LEASE, *key))
+            claimed = cursor.rowcount
+            conn.commit()
+            if not claimed:
+                continue  # claimed by another worker
+
+            cursor.execute("""
+                SELECT event_id, aspect_type, updates, attempts FROM strava_webhook_events
+                WHERE object_type = %s AND object_id = %s AND owner_id = %s AND event_id <= %s
+                  AND status = 'processing'
+                ORDER BY event_time, event_id
+            """, key)
+            events = cursor.fetchall()
+            conn.commit()
+            for event in events:
+                if isinstance(event["updates"], (str, bytes)):
+                    event["updates"] = json.loads(event["updates"])
+                event["updates"] = event["updates"] or {}
+            event_ids = [event["event_id"] for event in events]
+            placeholders = ", ".join(["%s"] * len(event_ids))
+
+            try:
+                _apply_events(conn, obj["object_type"], obj["object_id"], obj["owner_id"], events)
+                cursor.execute(
+                    f"UPDATE strava_webhook_events SET status = 'done', processed_at = UTC_TIMESTAMP(), "
+                    f"attempts = attempts + 1 WHERE event_id IN ({placeholders})",
+                    event_ids
+                )
+                applied += 1
+                events_applied += len(events)
+            except Exception as e:
+                conn.rollback()
+                print(f"[WEBHOOK ERROR] {obj['object_type']} {obj['object_id']}: {e}")
+                attempts = max(event["attempts"] for event in events) + 1
+                cursor.execute(f"""
+                    UPDATE strava_webhook_events
+                    SET status = %s, attempts = %s, last_error = %s,
+                        next_attempt_at = UTC_TIMESTAMP() + INTERVAL %s SECOND
+                    WHERE event_id IN ({placeholders})
+                """, [
+                    "failed" if attempts >= WEBHOOK_MAX_ATTEMPTS else "pending",
+                    attempts,
+                    str(e),
+                    WEBHOOK_RETRY_BACKOFF * 2 ** (attempts - 1),
+                    *event_ids
+                ])
+                failed += 1
+            conn.commit()
+        return applied, events_applied, failed
+    finally:
+        cursor.close()
+
+
+@click.command("webhook-worker")
+@click.option("--batch-size", default=WEBHOOK_BATCH_SIZE, show_default=True)
+@click.option("--poll-interval", default=WEBHOOK_POLL_INTERVAL, show_default=True,
+              help="Seconds to wait when no events are due.")
+@click.option("--coalesce-seconds", default=WEBHOOK_COALESCE_SECONDS, show_default=True,
+              help="Quiet period before an object's events are applied.")
+@click.option("--burst", is_flag=True, help="Exit once no events are due.")
+def webhook_worker_command(batch_size, poll_interval, coalesce_seconds, burst):
+    """Apply Strava webhook events (activity create/update/delete, deauthorization)."""
+    while True:
+        conn = get_db_connection()
+        applied = events = failed = 0
+        if conn:
+            try:
+                applied, events, failed = process_webhook_events(conn, batch_size, coalesce_seconds)
+            finally:
+                conn.close()
+        if applied or failed:
+            click.echo(f"Applied {events} events to {applied} objects, failed {failed}")
+            continue
+        if burst:
+            return
+        time.sleep(poll_interval)
+
+
+def init_app(app):
+    app.cli.add_command(webhook_worker_command)
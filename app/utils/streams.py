@@ -0,0 +1,179 @@
+import os
+import shutil
+
+import numpy as np
+
+from app.utils.rate_limit import PRIORITY_INTERACTIVE, RateLimitExceeded
+
+STREAMS_DIR = os.getenv("STREAMS_DIR", os.path.join("data", "streams"))
+# Compressed .npz archives are smaller; uncompressed .npy columns can be memory-mapped.
+STREAMS_COMPRESS = os.getenv("STREAMS_COMPRESS", "true").lower() in ("1", "true", "yes")
+
+# Strava stream type -> storage dtype. latlng is stored as an (n, 2) array.
+STREAM_DTYPES = {
+    "time": np.int32,
+    "distance": np.float32,
+    "heartrate": np.int16,
+    "watts": np.int16,
+    "cadence": np.int16,
+    "altitude": np.float32,
+    "latlng": np.float64,
+}
+STREAM_KEYS = tuple(STREAM_DTYPES)
+# Strava sends null for samples without a reading (e.g. a dropped heart rate
+# strap). Float streams store those as NaN, integer streams as this value.
+STREAM_MISSING = -1
+
+
+def _archive_path(activity_id):
+    return os.path.join(STREAMS_DIR, f"{int(activity_id)}.npz")  # int(): an id must never become a path
+
+
+def _column_dir(activity_id):
+    return os.path.join(STREAMS_DIR, str(int(activity_id)))
+
+
+def fetch_streams(client, access_token, strava_activity_id, keys=STREAM_KEYS, priority=PRIORITY_INTERACTIVE):
+    """
+    Downloads /activities/{id}/streams and converts every stream to a typed
+    NumPy array. Returns {} when Strava has no streams for the activity.
+    """
+    response = client.request(
+        "GET", f"activities/{strava_activity_id}/streams", access_token, priority,
+        params={"keys": ",".join(keys), "key_by_type": "true"}
+    )
+    if response.status_code == 404:
+        return {}
+    response.raise_for_status()
+
+    streams = {}
+    for key, stream in response.json().items():
+        if key in STREAM_DTYPES and stream.get("data"):
+            streams[key] = _to_array(key, stream["data"])
+    return streams
+
+
+def _to_array(key, data):
+    dtype = STREAM_DTYPES[key]
+    if key == "latlng":
+        data = [(None, None) if point is None else point for point in data]
+    elif np.issubdtype(dtype, np.integer):
+        data = [STREAM_MISSING if value is None else value for value in data]
+    return np.asarray(data, dtype=dtype)
+
+
+def stream_to_list(key, values):
+    """Converts a stored stream back to a JSON-ready list, with missing samples as None."""
+    if np.issubdtype(values.dtype, np.integer):
+        missing = values == STREAM_MISSING
+    else:
+        missing = np.isnan(values)
+    if not missing.any():
+        return values.tolist()
+    result = values.astype(object)
+    result[missing] = None
+    return result.tolist()
+
+
+def save_streams(activity_id, streams):
+    """Stores one column per stream, replacing anything stored for the activity before."""
+    os.makedirs(STREAMS_DIR, exist_ok=True)
+    if STREAMS_COMPRESS:
+        tmp_path = _archive_path(activity_id) + ".tmp.npz"
+        np.savez_compressed(tmp_path, **streams)
+        os.replace(tmp_path, _archive_path(activity_id))
+        return
+
+    directory = _column_dir(activity_id)
+    os.makedirs(directory, exist_ok=True)
+    for key, values in streams.items():
+        tmp_path = os.path.join(directory, f"{key}.tmp.npy")
+        np.save(tmp_path, values)
+        os.replace(tmp_path, os.path.join(directory, f"{key}.npy"))
+
+
+def load_streams(activity_id, keys=None, mmap=True):
+    """
+    Loads stored streams for analytics as {key: numpy array}.
+
+    Only the requested columns are read. Uncompressed columns are
+    memory-mapped (read-only) unless `mmap` is False. Missing streams are
+    left out of the result.
+    """
+    wanted = keys or STREAM_KEYS
+    directory = _column_dir(activity_id)
+    streams = {}
+    if os.path.isdir(directory):
+        for key in wanted:
+            path = os.path.join(directory, f"{key}.npy")
+            if os.path.exists(path):
+                streams[key] = np.load(path, mmap_mode="r" if mmap else None)
+        return streams
+
+    path = _archive_path(activity_id)
+    if os.path.exists(path):
+        with np.load(path) as archive:
+            for key in wanted:
+                if key in archive.files:
+                    streams[key] = archive[key]
+    return streams
+
+
+def record_streams(conn, activity_id, streams):
+    """Notes which streams are stored for the activity (no commit)."""
+    sample_count = max((len(values) for values in streams.values()), default=0)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO activity_streams (activity_id, stream_keys, sample_count, stored_at)
+            VALUES (%s, %s, %s, UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE
+                stream_keys = VALUES(stream_keys),
+                sample_count = VALUES(sample_count),
+                stored_at = VALUES(stored_at)
+        """, (activity_id, ",".join(sorted(streams)), sample_count))
+    finally:
+        cursor.close()
+
+
+def delete_streams(conn, activity_id):
+    """Removes the stored streams of a deleted activity (no commit)."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM activity_streams WHERE activity_id = %s", (activity_id,))
+    finally:
+        cursor.close()
+    if os.path.exists(_archive_path(activity_id)):
+        os.remove(_archive_path(activity_id))
+    shutil.rmtree(_column_dir(activity_id), ignore_errors=True)
+
+
+def ingest_streams(conn, client, access_token, activities, priority=PRIORITY_INTERACTIVE):
+    """
+    Fetches and stores streams for [(activity_id, strava_activity_id), ...].
+
+    Returns the number of activities whose streams were stored. Failures
+    (including disk writes) are logged and skipped so one bad activity does
+    not stop the rest; RateLimitExceeded is raised, since every remaining
+    call would fail the same way.
+    """
+    stored = 0
+    for activity_id, strava_activity_id in activities:
+        try:
+            streams = fetch_streams(client, access_token, strava_activity_id, priority=priority)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"[STREAMS ERROR] activity {activity_id}: {e}")
+            continue
+        if not streams:
+            continue
+        try:
+            save_streams(activity_id, streams)
+        except OSError as e:
+            print(f"[STREAMS ERROR] activity {activity_id}: {e}")
+            continue
+        record_streams(conn, activity_id, streams)
+        conn.commit()
+        stored += 1
+    return stored
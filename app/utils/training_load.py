@@ -0,0 +1,217 @@
+import os
+from datetime import date, datetime, timedelta
+
+import click
+import numpy as np
+
+from app.utils.database import get_db_connection
+from app.utils.sports import sport_of
+
+# Thresholds used to turn an activity into an intensity factor (IF).
+TRAINING_FTP = float(os.getenv("TRAINING_FTP", 200))  # W
+TRAINING_RUN_THRESHOLD_SPEED = float(os.getenv("TRAINING_RUN_THRESHOLD_SPEED", 3.5))  # m/s (~4:45 min/km)
+TRAINING_SWIM_THRESHOLD_SPEED = float(os.getenv("TRAINING_SWIM_THRESHOLD_SPEED", 1.1))  # m/s (~1:30 min/100m)
+TRAINING_MAX_HR = float(os.getenv("TRAINING_MAX_HR", 185))  # when the user has no birth_year
+TRAINING_DEFAULT_IF = 0.65  # activity without power, pace and heart rate
+TRAINING_MAX_IF = 1.5
+CTL_DAYS = 42  # fitness
+ATL_DAYS = 7  # fatigue
+# EWMA is evaluated in closed form per block of days; a^-n stays well inside float64 at this size.
+EWMA_BLOCK_DAYS = 128
+TRAINING_WRITE_CHUNK = int(os.getenv("TRAINING_WRITE_CHUNK", 500))
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def activity_stress(duration, heart_rate_avg, average_watts, speed, sports, max_hr=TRAINING_MAX_HR):
+    """
+    Training stress score per activity, vectorized over NumPy arrays.
+
+    stress = hours * IF^2 * 100, where IF comes from power (average_watts /
+    FTP) when there is power, otherwise from speed for runs and swims
+    (speed / threshold speed), otherwise from heart rate (heart_rate_avg /
+    lactate threshold, taken as 90% of max HR). Missing values are NaN.
+    """
+    hours = np.nan_to_num(duration) / 3600.0
+    lthr = 0.9 * max_hr
+
+    threshold_speed = np.where(sports == "run", TRAINING_RUN_THRESHOLD_SPEED,
+                               np.where(sports == "swim", TRAINING_SWIM_THRESHOLD_SPEED, np.nan))
+    with np.errstate(invalid="ignore"):
+        intensity = np.full(hours.shape, TRAINING_DEFAULT_IF)
+        intensity = np.where(heart_rate_avg > 0, heart_rate_avg / lthr, intensity)
+        intensity = np.where((speed > 0) & (threshold_speed > 0), speed / threshold_speed, intensity)
+        intensity = np.where(average_watts > 0, average_watts / TRAINING_FTP, intensity)
+    intensity = np.clip(intensity, 0.0, TRAINING_MAX_IF)
+    return hours * intensity ** 2 * 100.0
+
+
+def ewma(values, days, seed=0.0):
+    """
+    Exponentially weighted average y[t] = a * y[t-1] + k * x[t], with
+    k = 1 - exp(-1/days) and a = 1 - k, starting from `seed`.
+
+    Each block of days is solved at once as
+    y[i] = a^(i+1) * seed + k * a^i * cumsum(x[j] / a^j)
+    instead of looping day by day in Python.
+    """
+    k = 1.0 - np.exp(-1.0 / days)
+    a = 1.0 - k
+    out = np.empty(len(values))
+    previous = seed
+    for start in range(0, len(values), EWMA_BLOCK_DAYS):
+        block = values[start:start + EWMA_BLOCK_DAYS]
+        powers = a ** np.arange(len(block))
+        result = a * powers * previous + k * powers * np.cumsum(block / powers)
+        out[start:start + len(block)] = result
+        previous = result[-1]
+    return out
+
+
+def update_training_load(conn, user_id, from_date=None):
+    """
+    Recomputes the user's training_load_daily rows from `from_date` to today.
+
+    CTL/ATL continue from the last materialized day before `from_date`, so a
+    sync that wrote activities from last week only touches the rows from last
+    week on. Without `from_date`, or when nothing before it is materialized
+    but older activities exist, the whole history is rebuilt. Returns the
+    number of days written.
+    """
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        if from_date is None:
+            cursor.execute("SELECT MIN(date) AS first_day FROM activities WHERE user_id = %s", (user_id,))
+            first_day = cursor.fetchone()["first_day"]
+            cursor.execute("DELETE FROM training_load_daily WHERE user_id = %s", (user_id,))
+            if first_day is None:
+                conn.commit()
+                return 0
+            start = _to_date(first_day)
+        else:
+            start = _to_date(from_date)
+
+        # Continue from the last computed day before start (days without activities have stress 0)
+        cursor.execute("""
+            SELECT day, ctl, atl FROM training_load_daily
+            WHERE user_id = %s AND day < %s
+            ORDER BY day DESC LIMIT 1
+        """, (user_id, start))
+        seed = cursor.fetchone()
+        ctl_seed, atl_seed = 0.0, 0.0
+        if seed:
+            start = seed["day"] + timedelta(days=1)
+            ctl_seed, atl_seed = seed["ctl"], seed["atl"]
+        elif from_date is not None:
+            # Nothing materialized yet, but older activities exist: a zero seed would drop their load
+            cursor.execute("SELECT 1 FROM activities WHERE user_id = %s AND date < %s LIMIT 1", (user_id, start))
+            if cursor.fetchone():
+                return update_training_load(conn, user_id)
+
+        cursor.execute("SELECT birth_year FROM users WHERE user_id = %s", (user_id,))
+        user = cursor.fetchone()
+        max_hr = TRAINING_MAX_HR
+        if user and user["birth_year"]:
+            max_hr = 220.0 - (date.today().year - int(user["birth_year"]))
+
+        cursor.execute("""
+            SELECT a.date, a.activity_type, a.duration, a.heart_rate_avg, a.speed, d.average_watts
+            FROM activities a
+            LEFT JOIN activity_details d ON d.activity_id = a.activity_id
+            WHERE a.user_id = %s AND a.date >= %s
+        """, (user_id, start))
+        rows = cursor.fetchall()
+
+        end = max([date.today()] + [_to_date(row["date"]) for row in rows])
+        day_count = (end - start).days + 1
+        if day_count <= 0:
+            return 0
+
+        daily_stress = np.zeros(day_count)
+        if rows:
+            stress = activity_stress(
+                np.array([row["duration"] for row in rows], dtype=float),
+                np.array([row["heart_rate_avg"] for row in rows], dtype=float),
+                np.array([row["average_watts"] for row in rows], dtype=float),
+                np.array([row["speed"] for row in rows], dtype=float),
+                np.array([sport_of(row["activity_type"]) for row in rows]),
+                max_hr
+            )
+            day_index = np.array([(_to_date(row["date"]) - start).days for row in rows])
+            np.add.at(daily_stress, day_index, stress)
+
+        ctl = ewma(daily_stress, CTL_DAYS, ctl_seed)
+        atl = ewma(daily_stress, ATL_DAYS, atl_seed)
+        # Form for a day = yesterday's fitness - yesterday's fatigue
+        tsb = np.concatenate(([ctl_seed - atl_seed], (ctl - atl)[:-1]))
+
+        values = [
+            (user_id, start + timedelta(days=i), float(daily_stress[i]), float(ctl[i]), float(atl[i]), float(tsb[i]))
+            for i in range(day_count)
+        ]
+        for chunk_start in range(0, len(values), TRAINING_WRITE_CHUNK):
+            cursor.executemany("""
+                INSERT INTO training_load_daily (user_id, day, stress, ctl, atl, tsb)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    stress = VALUES(stress), ctl = VALUES(ctl), atl = VALUES(atl), tsb = VALUES(tsb)
+            """, values[chunk_start:chunk_start + TRAINING_WRITE_CHUNK])
+        conn.commit()
+        return day_count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def get_training_load(conn, user_id, from_date=None, to_date=None):
+    """Materialized daily rows for the user, oldest first."""
+    query = "SELECT day, stress, ctl, atl, tsb FROM training_load_daily WHERE user_id = %s"
+    params = [user_id]
+    if from_date:
+        query += " AND day >= %s"
+        params.append(from_date)
+    if to_date:
+        query += " AND day <= %s"
+        params.append(to_date)
+    query += " ORDER BY day"
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+@click.command("rebuild-training-load")
+@click.option("--user-id", type=int, default=None, help="Only this user (default: every user with activities).")
+def rebuild_training_load_command(user_id):
+    """Recompute training_load_daily from the full activity history."""
+    conn = get_db_connection()
+    if not conn:
+        raise click.ClickException("Database connection failed.")
+    cursor = conn.cursor()
+    try:
+        if user_id is None:
+            cursor.execute("SELECT DISTINCT user_id FROM activities")
+            user_ids = [row[0] for row in cursor.fetchall()]
+        else:
+            user_ids = [user_id]
+        for uid in user_ids:
+            days = update_training_load(conn, uid)
+            click.echo(f"User {uid}: {days} days")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_training_load_command)
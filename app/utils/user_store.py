@@ -0,0 +1,84 @@
+import time
+
+from app.utils.metrics import record_db_time
+
+# Queries on `users` used by the auth endpoints. Each one selects only the columns
+# its caller needs and runs as a server-side prepared statement. Prepared cursors
+# are cached on the underlying connection, so with pooled connections MySQL parses
+# each statement once per connection instead of once per request.
+STATEMENTS = {
+    "email_exists": "SELECT EXISTS(SELECT 1 FROM users WHERE email = %s)",
+    "login_lookup": """
+        SELECT user_id, email, first_name, last_name, password_hash
+        FROM users WHERE email = %s LIMIT 1
+    """,
+    "verification_lookup": """
+        SELECT user_id FROM users WHERE email = %s AND verification_code = %s LIMIT 1
+    """,
+    "mark_verified": "UPDATE users SET verified = TRUE, verification_code = NULL WHERE user_id = %s",
+    "update_password_hash": "UPDATE users SET password_hash = %s WHERE user_id = %s",
+    "insert_user": """
+        INSERT INTO users (first_name, last_name, email, password_hash, bio, birth_year, strava_profile,
+                           garmin_profile, verification_code)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+}
+
+
+def _prepared(conn, name):
+    """Returns the cached prepared cursor for statement `name` on this connection."""
+    raw = getattr(conn, "raw_connection", conn)
+    cursors = getattr(raw, "_prepared_statements", None)
+    if cursors is None:
+        cursors = raw._prepared_statements = {}
+    cursor = cursors.get(name)
+    if cursor is None:
+        cursor = cursors[name] = raw.cursor(prepared=True)
+    return cursor
+
+
+def _execute(conn, name, params):
+    cursor = _prepared(conn, name)
+    start = time.perf_counter()
+    # The same string object is passed every time, so the cursor keeps its prepared statement.
+    cursor.execute(STATEMENTS[name], params)
+    record_db_time(time.perf_counter() - start)
+    return cursor
+
+
+def _fetch_one_dict(cursor):
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    return dict(zip(cursor.column_names, rows[0]))
+
+
+def email_exists(conn, email):
+    cursor = _execute(conn, "email_exists", (email,))
+    return bool(cursor.fetchall()[0][0])
+
+
+def get_login_user(conn, email):
+    """Returns user_id, email, first_name, last_name and password_hash, or None."""
+    return _fetch_one_dict(_execute(conn, "login_lookup", (email,)))
+
+
+def find_pending_verification(conn, email, verification_code):
+    """Returns the user_id whose email and verification code match, or None."""
+    row = _fetch_one_dict(_execute(conn, "verification_lookup", (email, verification_code)))
+    return row["user_id"] if row else None
+
+
+def mark_verified(conn, user_id):
+    _execute(conn, "mark_verified", (user_id,))
+
+
+def update_password_hash(conn, user_id, password_hash):
+    _execute(conn, "update_password_hash", (password_hash, user_id))
+
+
+def insert_user(conn, first_name, last_name, email, password_hash, bio, birth_year, strava_profile, garmin_profile,
+                verification_code):
+    cursor = _execute(conn, "insert_user", (first_name, last_name, email, password_hash, bio, birth_year,
+                                            strava_profile, garmin_profile, verification_code))
+    return cursor.lastrowid
@@ -0,0 +1,32 @@
+import subprocess
+
+
+def compare(current, previous, tolerance, higher_is_better=()):
+    """
+    Prints flat {metric: value} results next to a baseline run. Metrics whose
+    name ends in one of `higher_is_better` count as regressed when they drop,
+    all others when they grow, by more than `tolerance` (a fraction).
+    Returns the names of the regressed metrics.
+    """
+    regressions = []
+    print(f"\n{'metric':<34} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, value in current.items():
+        before = previous.get(name)
+        if not before:
+            print(f"{name:<34} {'-':>10} {value:>10} {'':>8}")
+            continue
+        change = (value - before) / before
+        worse = -change if name.endswith(tuple(higher_is_better)) else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<34} {before:>10} {value:>10} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
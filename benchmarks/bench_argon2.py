@@ -0,0 +1,64 @@
+"""
+Argon2 throughput per parameter set.
+
+Reports hashes/sec on one thread and through PasswordService with the given
+number of pool processes, to help pick ARGON2_* and HASH_WORKERS values:
+
+    python -m benchmarks.bench_argon2 --count 20 --workers 4
+    python -m benchmarks.bench_argon2 --params 2:19456:1 --params 3:65536:4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from argon2 import PasswordHasher
+
+from app.utils.passwords import ARGON2_PARAMS, PasswordService
+
+DEFAULT_PARAM_SETS = [
+    "2:19456:1",  # OWASP minimum (19 MiB)
+    "3:65536:4",  # argon2-cffi default / RFC 9106 low-memory profile
+    "4:131072:4",
+]
+
+
+def parse_params(value):
+    time_cost, memory_cost, parallelism = (int(part) for part in value.split(":"))
+    return dict(ARGON2_PARAMS, time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+
+def bench_inline(params, count):
+    hasher = PasswordHasher(**params)
+    started = time.perf_counter()
+    for i in range(count):
+        hasher.hash(f"password-{i}")
+    return count / (time.perf_counter() - started)
+
+
+def bench_service(params, count, workers):
+    service = PasswordService(params=params, workers=workers, max_pending=count)
+    service.hash("warm-up")  # start the pool processes outside the timing
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers * 2) as pool:
+        list(pool.map(service.hash, (f"password-{i}" for i in range(count))))
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Argon2 hashes/sec per parameter set.")
+    parser.add_argument("--params", action="append", help="time_cost:memory_cost_kib:parallelism (repeatable)")
+    parser.add_argument("--count", type=int, default=20, help="Hashes per measurement.")
+    parser.add_argument("--workers", type=int, default=2, help="PasswordService pool processes.")
+    args = parser.parse_args()
+
+    print(f"{'time':>5} {'memory KiB':>11} {'par':>4} {'inline h/s':>11} {'pool h/s':>9}")
+    for value in args.params or DEFAULT_PARAM_SETS:
+        params = parse_params(value)
+        inline = bench_inline(params, args.count)
+        pooled = bench_service(params, args.count, args.workers)
+        print(f"{params['time_cost']:>5} {params['memory_cost']:>11} {params['parallelism']:>4} "
+              f"{inline:>11.1f} {pooled:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Sync throughput and API latency under concurrent load, against the seeded
+benchmark database and the local Strava stand-in (benchmarks/fake_strava.py).
+
+    python -m benchmarks.seed_db --users 200 --activities 500 --sync-users 4
+    python -m benchmarks.bench_load --concurrency 16 --requests 400 --output results.json
+
+The sync part queues a full sync for every seeded sync user (what
+GET /api/strava/activities?full=true does), runs the jobs on --sync-workers
+job-worker threads and reports activities/sec. The fake answers every call
+after --strava-latency ± --strava-jitter ms and fails --strava-error-rate of them.
+
+The load part sends --requests requests per endpoint (get_activities,
+get_activity, login, register) from --concurrency client threads and
+reports p50/p95/p99 latency and requests/sec. By default the app is served
+in this process by a threaded Werkzeug server; use --target to load an
+already running server instead (started with DB_NAME set to the benchmark
+database).
+
+Results can be compared against a stored run. Baselines are machine
+specific, so record one on the machine that runs the comparison:
+
+    python -m benchmarks.bench_load --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_load --baseline benchmarks/baseline.json --tolerance 0.15
+
+A metric that got worse by more than --tolerance is reported as a
+regression and the exit status is 1.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.baseline import compare, git_commit
+from benchmarks.environment import (BENCH_DB_NAME, BENCH_EMAIL, BENCH_PASSWORD, BENCH_SYNC_EMAIL, configure,
+                                    free_port)
+
+ENDPOINTS = ("get_activities", "get_activity", "login", "register")
+# metric -> True if higher is better
+METRIC_DIRECTIONS = {
+    "activities_per_sec": True,
+    "requests_per_sec": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+}
+SYNC_TABLES = ("activity_details", "activities", "strava_sync_state", "training_load_daily", "activity_rollups",
+               "sync_jobs")
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(max(math.ceil(fraction * len(sorted_values)) - 1, 0), len(sorted_values) - 1)]
+
+
+def _query(sql, params=()):
+    from app.utils.database import get_db_connection
+
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError(f"Cannot connect to {BENCH_DB_NAME}; run benchmarks.seed_db first.")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        if cursor.with_rows:
+            return cursor.fetchall()
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def bench_sync(workers):
+    from app.utils.database import get_db_connection
+    from app.utils.jobs import enqueue_sync_job, worker_loop
+
+    user_ids = [row[0] for row in _query("SELECT user_id FROM users WHERE email LIKE %s ORDER BY user_id",
+                                         (BENCH_SYNC_EMAIL.format("%"),))]
+    if not user_ids:
+        raise RuntimeError("No sync users seeded; run benchmarks.seed_db with --sync-users.")
+
+    # From scratch every time: empty history and an expired token (the first call goes to /oauth/token)
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    _query(f"DELETE FROM activity_details WHERE activity_id IN "
+           f"(SELECT activity_id FROM activities WHERE user_id IN ({placeholders}))", user_ids)
+    for table in SYNC_TABLES[1:]:
+        _query(f"DELETE FROM {table} WHERE user_id IN ({placeholders})", user_ids)
+    _query(f"UPDATE users SET strava_access_token = NULL, strava_token_expires_at = 0 "
+           f"WHERE user_id IN ({placeholders})", user_ids)
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        for user_id in user_ids:
+            enqueue_sync_job(conn, user_id, full=True)
+    finally:
+        conn.close()
+    threads = [threading.Thread(target=worker_loop, kwargs={"burst": True}) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    written, failed = _query(f"""
+        SELECT COALESCE(SUM(activities_written), 0), COALESCE(SUM(status = 'failed'), 0)
+        FROM sync_jobs WHERE user_id IN ({placeholders})
+    """, user_ids)[0]
+    return {
+        "users": len(user_ids),
+        "workers": workers,
+        "activities": int(written),
+        "failed_jobs": int(failed),
+        "seconds": round(elapsed, 3),
+        "activities_per_sec": round(int(written) / elapsed, 1),
+    }
+
+
+def _request_factories(run_id):
+    """endpoint -> function(n) returning (path, json body) of the n-th request."""
+    users = [row[0] for row in _query("SELECT user_id FROM users WHERE email LIKE %s", (BENCH_EMAIL.format("%"),))]
+    if not users:
+        raise RuntimeError("No users seeded; run benchmarks.seed_db first.")
+    sample = _query(f"""
+        SELECT user_id, activity_id FROM activities
+        WHERE user_id IN ({", ".join(["%s"] * len(users))})
+        ORDER BY RAND() LIMIT 2000
+    """, users)
+    user_count = len(users)
+
+    return {
+        "get_activities": lambda n: ("/api/strava/get_activities",
+                                     {"user_id": users[n % user_count], "limit": 15}),
+        "get_activity": lambda n: ("/api/strava/get_activity",
+                                   dict(zip(("user_id", "activity_id"), sample[n % len(sample)]))),
+        "login": lambda n: ("/api/login",
+                            {"email": BENCH_EMAIL.format(n % user_count), "password": BENCH_PASSWORD}),
+        "register": lambda n: ("/api/register", {
+            "first_name": "Bench", "last_name": "Register", "email": f"bench-register-{run_id}-{n}@example.com",
+            "password": BENCH_PASSWORD, "birth_year": 1990,
+        }),
+    }
+
+
+def bench_endpoint(base_url, factory, count, concurrency, warmup):
+    import requests
+
+    local = threading.local()
+
+    def send(n):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        path, body = factory(n)
+        start = time.perf_counter()
+        try:
+            status = session.post(base_url + path, json=body, timeout=60).status_code
+        except requests.RequestException:
+            status = None
+        return time.perf_counter() - start, status
+
+    offset = random.randrange(1_000_000)  # so consecutive runs do not rely on the same cache
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(offset, offset + warmup)))
+        started = time.perf_counter()
+        results = list(pool.map(send, range(offset + warmup, offset + warmup + count)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, _ in results)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": count,
+        "errors": sum(1 for _, status in results if status is None or status >= 400),
+        "statuses": statuses,
+        "requests_per_sec": round(count / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+    }
+
+
+def _metrics(results):
+    """Flattens results to {"sync.activities_per_sec": ..., "login.p95_ms": ...}."""
+    flat = {}
+    for section, values in [("sync", results.get("sync") or {}), *(results.get("endpoints") or {}).items()]:
+        for metric in METRIC_DIRECTIONS:
+            if values.get(metric) is not None:
+                flat[f"{section}.{metric}"] = values[metric]
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skip-sync", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--sync-workers", type=int, default=2, help="Job worker threads for the sync run.")
+    parser.add_argument("--strava-activities", type=int, default=500, help="Activities per fake Strava athlete.")
+    parser.add_argument("--strava-latency", type=float, default=50.0, help="Fake Strava latency per call (ms).")
+    parser.add_argument("--strava-jitter", type=float, default=20.0, help="Latency spread (± ms).")
+    parser.add_argument("--strava-error-rate", type=float, default=0.0)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated subset to load.")
+    parser.add_argument("--requests", type=int, default=400, help="Measured requests per endpoint.")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint first.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Client threads.")
+    parser.add_argument("--target", help="Base URL of a running server (default: serve the app in-process).")
+    parser.add_argument("--output", help="Write the results as JSON.")
+    parser.add_argument("--baseline", help="Compare against a results JSON file.")
+    parser.add_argument("--save-baseline", help="Write the results as the new baseline file.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown per metric.")
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    strava_port = free_port()
+    configure(f"http://127.0.0.1:{strava_port}")
+
+    from werkzeug.serving import make_server
+
+    from app import create_app
+    from benchmarks.fake_strava import QuietRequestHandler, start_fake_strava
+
+    fake, _ = start_fake_strava(port=strava_port, activities=args.strava_activities, latency_ms=args.strava_latency,
+                                jitter_ms=args.strava_jitter, error_rate=args.strava_error_rate)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "database": BENCH_DB_NAME,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "strava_latency_ms": args.strava_latency,
+            "strava_error_rate": args.strava_error_rate,
+        },
+    }
+    server = None
+    try:
+        if not args.skip_sync:
+            results["sync"] = bench_sync(args.sync_workers)
+            results["sync"]["strava_requests"] = fake.app.config["FAKE_STRAVA_STATE"].snapshot()
+            sync = results["sync"]
+            print(f"sync: {sync['activities']} activities for {sync['users']} users in {sync['seconds']}s "
+                  f"-> {sync['activities_per_sec']} activities/s ({sync['failed_jobs']} failed jobs)")
+
+        if not args.skip_load and endpoints:
+            base_url = args.target
+            if not base_url:
+                server = make_server("127.0.0.1", 0, create_app(), threaded=True,
+                                     request_handler=QuietRequestHandler)
+                threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+                base_url = f"http://127.0.0.1:{server.server_port}"
+            factories = _request_factories(int(time.time()))
+
+            results["endpoints"] = {}
+            print(f"\n{'endpoint':<16} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+            for name in endpoints:
+                stats = bench_endpoint(base_url.rstrip("/"), factories[name], args.requests, args.concurrency,
+                                       args.warmup)
+                results["endpoints"][name] = stats
+                print(f"{name:<16} {stats['requests_per_sec']:>8} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+                      f"{stats['p99_ms']:>9} {stats['errors']:>7}")
+    finally:
+        if server:
+            server.shutdown()
+        fake.shutdown()
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(_metrics(results), _metrics(json.load(f)), args.tolerance,
+                                  [name for name, higher in METRIC_DIRECTIONS.items() if higher])
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
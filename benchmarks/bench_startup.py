@@ -0,0 +1,109 @@
+"""
+Worker startup cost: time to import the app, run create_app() and answer the
+first requests, each measured in a fresh interpreter (what every gunicorn
+worker pays without --preload):
+
+    python -m benchmarks.bench_startup --runs 7
+    python -m benchmarks.bench_startup --save-baseline startup.json
+    python -m benchmarks.bench_startup --baseline startup.json
+
+Runs once with the Swagger spec built lazily on the first /apispec_1.json
+request and once with a spec precomputed by `flask build-apispec`, and
+reports the median of --runs runs. No database is needed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.baseline import compare, git_commit
+
+# Runs in the child interpreter; prints one JSON object with the timings.
+CHILD = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+client = flask_app.test_client()
+timings = {"import_ms": imported - started, "create_app_ms": created - imported}
+for name, path in (("first_apispec_ms", "/apispec_1.json"), ("second_apispec_ms", "/apispec_1.json"),
+                   ("first_metrics_ms", "/metrics")):
+    start = time.perf_counter()
+    assert client.get(path).status_code == 200, path
+    timings[name] = time.perf_counter() - start
+timings["total_ms"] = time.perf_counter() - started
+print(json.dumps({name: round(seconds * 1000, 2) for name, seconds in timings.items()}))
+"""
+
+BUILD_SPEC = """
+import sys, app
+from app.utils.apispec import write_apispec
+write_apispec(app.create_app(), sys.argv[1])
+print("ok")
+"""
+
+
+def run_child(code, env, *args):
+    # Logs and data/ directories are created in a temporary directory, not in the repo
+    result = subprocess.run([sys.executable, "-c", code, *args], env=env, cwd=env["BENCH_WORKDIR"],
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def measure(env, runs):
+    samples = [json.loads(run_child(CHILD, env)) for _ in range(runs)]
+    return {name: round(statistics.median(sample[name] for sample in samples), 2) for name in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per variant.")
+    parser.add_argument("--output", help="Write the results as JSON.")
+    parser.add_argument("--baseline", help="Compare against a results JSON file.")
+    parser.add_argument("--save-baseline", help="Write the results as the new baseline file.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown per metric.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    spec_file = os.path.join(workdir, "apispec.json")
+    base_env = dict(os.environ, PYTHONPATH=os.getcwd(), BENCH_WORKDIR=workdir)
+
+    lazy_env = dict(base_env, API_SPEC_FILE=os.path.join(workdir, "missing.json"))
+    precomputed_env = dict(base_env, API_SPEC_FILE=spec_file)
+    run_child(BUILD_SPEC, base_env, spec_file)
+
+    results = {"meta": {"commit": git_commit(), "runs": args.runs, "python": sys.version.split()[0]}}
+    results["lazy"] = measure(lazy_env, args.runs)
+    results["precomputed"] = measure(precomputed_env, args.runs)
+
+    names = list(results["lazy"])
+    print(f"{'median ms':<20} {'lazy spec':>10} {'precomputed':>12}")
+    for name in names:
+        print(f"{name:<20} {results['lazy'][name]:>10} {results['precomputed'][name]:>12}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        def flat(data):
+            return {f"{variant}.{name}": value for variant in ("lazy", "precomputed")
+                    for name, value in (data.get(variant) or {}).items()}
+
+        regressions = compare(flat(results), flat(baseline), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
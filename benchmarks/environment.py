@@ -0,0 +1,34 @@
+import os
+import socket
+import tempfile
+
+# The benchmarks never touch DB_NAME: they seed and load their own database.
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", "TriathlonForge_bench")
+BENCH_PASSWORD = "benchmark-password"
+BENCH_EMAIL = "bench-user-{}@example.com"
+# Users whose activities the sync benchmark deletes and re-syncs every run
+BENCH_SYNC_EMAIL = "bench-sync-{}@example.com"
+# Seeded user i is Strava athlete BENCH_ATHLETE_BASE + i in the fake Strava.
+BENCH_ATHLETE_BASE = 1000
+
+
+def configure(strava_url=None):
+    """
+    Points the app's configuration at the benchmark database (and the fake
+    Strava at `strava_url`). The app reads its settings from the environment
+    at import time, so this must run before anything from `app` is imported.
+    """
+    os.environ["DB_NAME"] = BENCH_DB_NAME
+    os.environ.setdefault("STRAVA_RATE_LIMIT_FILE", os.path.join(tempfile.mkdtemp(prefix="bench-"), "rate.json"))
+    # Start from the fake's limits instead of Strava's until its headers are seen
+    os.environ.setdefault("STRAVA_SHORT_LIMIT", "100000")
+    os.environ.setdefault("STRAVA_DAILY_LIMIT", "1000000")
+    if strava_url:
+        os.environ["STRAVA_API_URL"] = f"{strava_url}/api/v3"
+        os.environ["STRAVA_OAUTH_URL"] = f"{strava_url}/oauth"
+
+
+def free_port(host="127.0.0.1"):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
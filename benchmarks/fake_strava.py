@@ -0,0 +1,306 @@
+"""
+Local stand-in for the Strava API used by the benchmarks.
+
+Serves the calls the sync makes (POST /oauth/token, GET
+/api/v3/athlete/activities, /api/v3/activities/{id} and its /streams) from
+deterministic generated data, with configurable latency, error rate and
+rate-limit headers:
+
+    python -m benchmarks.fake_strava --port 5055 --latency 80 --jitter 40 --error-rate 0.01
+
+and point the app at it:
+
+    STRAVA_API_URL=http://127.0.0.1:5055/api/v3 STRAVA_OAUTH_URL=http://127.0.0.1:5055/oauth
+
+Athletes are identified by their tokens: refresh token "fake-refresh-<athlete id>"
+(what benchmarks.seed_db stores) is exchanged for access token
+"fake-access-<athlete id>". Every athlete owns --activities activities, one
+per day going back from today (UTC).
+"""
+import argparse
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app.utils import polyline as polyline_codec
+
+ACCESS_PREFIX = "fake-access-"
+REFRESH_PREFIX = "fake-refresh-"
+# Strava ids of an athlete's activities: athlete_id * ACTIVITY_ID_STRIDE + index
+ACTIVITY_ID_STRIDE = 1_000_000
+TOKEN_LIFETIME = 6 * 3600
+ROUTE_POINTS = 200
+SPORTS = (("Run", 3.0, 2700), ("Ride", 8.0, 5400), ("Swim", 1.1, 2400), ("Run", 3.2, 3600))
+
+
+class FakeStravaState:
+    """Request counters and the two rate-limit windows, shared by the server threads."""
+
+    def __init__(self, short_limit, daily_limit):
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.short_usage = 0
+        self.daily_usage = 0
+        self.requests = {}
+
+    def count(self, endpoint):
+        """Counts one API request. Returns False if it is over the limit."""
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= 900:
+                self.window_start, self.short_usage = now, 0
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if self.short_usage >= self.short_limit or self.daily_usage >= self.daily_limit:
+                return False
+            self.short_usage += 1
+            self.daily_usage += 1
+            return True
+
+    def headers(self):
+        with self.lock:
+            return {
+                "X-RateLimit-Limit": f"{self.short_limit},{self.daily_limit}",
+                "X-RateLimit-Usage": f"{self.short_usage},{self.daily_usage}",
+            }
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.requests)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Skips the per-request access log line, which would dominate a benchmark's output."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def newest_start():
+    """Default start of every athlete's newest activity: today's midnight (UTC)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _start(athlete_id, index, newest):
+    # One activity a day, at different times of day
+    return newest - timedelta(days=index, minutes=(athlete_id * 37 + index * 53) % 600)
+
+
+def _route(activity_id):
+    rng = random.Random(activity_id)
+    lat, lng = 44.8 + rng.random() * 0.1, 20.4 + rng.random() * 0.1
+    coords = []
+    for i in range(ROUTE_POINTS):
+        angle = 2 * math.pi * i / ROUTE_POINTS
+        coords.append((lat + 0.01 * math.sin(angle) + rng.random() * 1e-4,
+                       lng + 0.015 * math.cos(angle) + rng.random() * 1e-4))
+    return coords
+
+
+def _polyline(activity_id):
+    # encode() takes interleaved lat/lng integers in 1e5 units
+    return polyline_codec.encode([round(value * 1e5) for point in _route(activity_id) for value in point])
+
+
+def summary_activity(athlete_id, index, newest):
+    activity_id = athlete_id * ACTIVITY_ID_STRIDE + index
+    rng = random.Random(activity_id)
+    sport, speed, duration = SPORTS[index % len(SPORTS)]
+    moving_time = int(duration * (0.7 + rng.random() * 0.6))
+    average_speed = round(speed * (0.9 + rng.random() * 0.2), 3)
+    start = _start(athlete_id, index, newest)
+    return {
+        "id": activity_id,
+        "athlete": {"id": athlete_id},
+        "name": f"{sport} #{index}",
+        "type": sport,
+        "sport_type": sport,
+        "distance": round(average_speed * moving_time, 1),
+        "moving_time": moving_time,
+        "elapsed_time": moving_time + rng.randint(0, 300),
+        "total_elevation_gain": round(rng.random() * 300, 1),
+        "start_date": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "start_date_local": (start + timedelta(hours=2)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "average_speed": average_speed,
+        "max_speed": round(average_speed * 1.4, 3),
+        "average_heartrate": 120 + rng.randint(0, 40),
+        "max_heartrate": 165 + rng.randint(0, 25),
+        "average_cadence": 80 + rng.randint(0, 10),
+        "average_watts": 150 + rng.randint(0, 100) if sport == "Ride" else None,
+        "max_watts": 400 + rng.randint(0, 300) if sport == "Ride" else None,
+        "kilojoules": round(moving_time * 0.2, 1) if sport == "Ride" else None,
+    }
+
+
+def detailed_activity(athlete_id, index, newest):
+    activity = summary_activity(athlete_id, index, newest)
+    activity.update({
+        "calories": round(activity["moving_time"] * 0.18, 1),
+        "location_city": "Belgrade",
+        "location_country": "Serbia",
+        "gear": {"id": f"g{athlete_id}", "name": "Benchmark shoes"},
+        "device_name": "Benchmark Watch",
+        "map": {"id": f"a{activity['id']}", "summary_polyline": _polyline(activity["id"])},
+    })
+    return activity
+
+
+def activity_streams(activity_id, moving_time):
+    rng = random.Random(activity_id)
+    count = max(moving_time, 1)
+    route = _route(activity_id)
+    return {
+        "time": {"data": list(range(count))},
+        "distance": {"data": [round(i * 3.0, 1) for i in range(count)]},
+        "heartrate": {"data": [130 + rng.randint(0, 30) for _ in range(count)]},
+        "cadence": {"data": [85 + rng.randint(0, 5) for _ in range(count)]},
+        "altitude": {"data": [round(100 + 20 * math.sin(i / 300), 1) for i in range(count)]},
+        "latlng": {"data": [list(route[i * len(route) // count]) for i in range(count)]},
+    }
+
+
+def create_fake_strava(activities=500, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, short_limit=100_000,
+                       daily_limit=1_000_000, newest=None, seed=None):
+    """
+    Flask app imitating Strava. Every API call sleeps `latency_ms` ± `jitter_ms`
+    and fails with a 500 with probability `error_rate`; calls over the
+    short/daily limits get a 429. X-RateLimit-* headers are always sent.
+    """
+    app = Flask("fake_strava")
+    state = app.config["FAKE_STRAVA_STATE"] = FakeStravaState(short_limit, daily_limit)
+    newest = newest or newest_start()
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def athlete_from_token(header, prefix):
+        token = (header or "").removeprefix("Bearer ").strip()
+        if not token.startswith(prefix):
+            return None
+        try:
+            return int(token[len(prefix):])
+        except ValueError:
+            return None
+
+    def simulate(endpoint):
+        """Latency, injected errors and rate limiting. Returns an error response or None."""
+        with rng_lock:
+            delay = max(latency_ms + rng.uniform(-jitter_ms, jitter_ms), 0) / 1000
+            fail = rng.random() < error_rate
+        if delay:
+            time.sleep(delay)
+        if not state.count(endpoint):
+            return jsonify({"message": "Rate Limit Exceeded"}), 429
+        if fail:
+            return jsonify({"message": "Injected error"}), 500
+        return None
+
+    @app.after_request
+    def rate_limit_headers(response):
+        if request.path.startswith("/api/v3/"):
+            response.headers.update(state.headers())
+        return response
+
+    @app.route("/oauth/token", methods=["POST"])
+    def token():
+        error = simulate("token")
+        if error:
+            return error
+        if request.form.get("grant_type") == "authorization_code":
+            athlete_id = int(request.form.get("code", "0").removeprefix("fake-code-") or 0)
+        else:
+            athlete_id = athlete_from_token(request.form.get("refresh_token"), REFRESH_PREFIX)
+        if not athlete_id:
+            return jsonify({"message": "Bad Request", "errors": [{"field": "refresh_token"}]}), 400
+        return jsonify({
+            "token_type": "Bearer",
+            "access_token": f"{ACCESS_PREFIX}{athlete_id}",
+            "refresh_token": f"{REFRESH_PREFIX}{athlete_id}",
+            "expires_at": int(time.time()) + TOKEN_LIFETIME,
+            "expires_in": TOKEN_LIFETIME,
+            "athlete": {"id": athlete_id},
+        })
+
+    @app.route("/api/v3/athlete/activities", methods=["GET"])
+    def list_activities():
+        athlete_id = athlete_from_token(request.headers.get("Authorization"), ACCESS_PREFIX)
+        if not athlete_id:
+            return jsonify({"message": "Authorization Error"}), 401
+        error = simulate("list")
+        if error:
+            return error
+        page = max(request.args.get("page", 1, type=int), 1)
+        per_page = min(max(request.args.get("per_page", 30, type=int), 1), 200)
+        after = request.args.get("after", type=int)
+
+        indexes = range(activities)  # newest first, like Strava without after=
+        if after is not None:
+            cutoff = datetime.fromtimestamp(after, timezone.utc).replace(tzinfo=None)
+            indexes = [i for i in reversed(indexes) if _start(athlete_id, i, newest) > cutoff]
+        selected = list(indexes)[(page - 1) * per_page:page * per_page]
+        return jsonify([summary_activity(athlete_id, i, newest) for i in selected])
+
+    def owned(activity_id):
+        athlete_id = athlete_from_token(request.headers.get("Authorization"), ACCESS_PREFIX)
+        index = activity_id - (athlete_id or 0) * ACTIVITY_ID_STRIDE
+        return (athlete_id, index) if athlete_id and 0 <= index < activities else (athlete_id, None)
+
+    @app.route("/api/v3/activities/<int:activity_id>", methods=["GET"])
+    def get_activity(activity_id):
+        error = simulate("activity")
+        if error:
+            return error
+        athlete_id, index = owned(activity_id)
+        if index is None:
+            return jsonify({"message": "Record Not Found"}), 404
+        return jsonify(detailed_activity(athlete_id, index, newest))
+
+    @app.route("/api/v3/activities/<int:activity_id>/streams", methods=["GET"])
+    def get_streams(activity_id):
+        error = simulate("streams")
+        if error:
+            return error
+        athlete_id, index = owned(activity_id)
+        if index is None:
+            return jsonify({"message": "Record Not Found"}), 404
+        moving_time = summary_activity(athlete_id, index, newest)["moving_time"]
+        return jsonify(activity_streams(activity_id, moving_time))
+
+    return app
+
+
+def start_fake_strava(host="127.0.0.1", port=0, **options):
+    """Runs the fake on a background thread. Returns (server, base_url); call server.shutdown() to stop it."""
+    server = make_server(host, port, create_fake_strava(**options), threaded=True,
+                         request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, name="fake-strava", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--activities", type=int, default=500, help="Activities per athlete.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean latency per call (ms).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency spread (± ms).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 500.")
+    parser.add_argument("--short-limit", type=int, default=100_000, help="Requests per 15 minutes.")
+    parser.add_argument("--daily-limit", type=int, default=1_000_000, help="Requests per day.")
+    parser.add_argument("--seed", type=int, help="Seed for latency and error injection.")
+    args = parser.parse_args()
+
+    app = create_fake_strava(args.activities, args.latency, args.jitter, args.error_rate, args.short_limit,
+                             args.daily_limit, seed=args.seed)
+    print(f"Fake Strava: STRAVA_API_URL=http://{args.host}:{args.port}/api/v3 "
+          f"STRAVA_OAUTH_URL=http://{args.host}:{args.port}/oauth")
+    make_server(args.host, args.port, app, threaded=True).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
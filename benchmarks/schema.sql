@@ -0,0 +1,51 @@
+-- Base tables the migrations/ files build on, for creating an empty benchmark database
+-- (see benchmarks/seed_db.py). Matches the columns the application reads and writes.
+CREATE TABLE IF NOT EXISTS users (
+    user_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    first_name VARCHAR(100) NULL,
+    last_name VARCHAR(100) NULL,
+    email VARCHAR(255) NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    bio TEXT NULL,
+    birth_year INT NULL,
+    strava_profile VARCHAR(255) NULL,
+    garmin_profile VARCHAR(255) NULL,
+    verification_code VARCHAR(16) NULL,
+    verified BOOLEAN NOT NULL DEFAULT FALSE,
+    strava_access_token VARCHAR(255) NULL,
+    strava_refresh_token VARCHAR(255) NULL,
+    strava_token_expires_at BIGINT NULL
+);
+
+CREATE TABLE IF NOT EXISTS activities (
+    activity_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    stravaActivityID BIGINT NULL,
+    activity_type VARCHAR(50) NULL,
+    activity_name VARCHAR(255) NULL,
+    distance DOUBLE NULL,
+    duration INT NULL,
+    pace DOUBLE NULL,
+    speed DOUBLE NULL,
+    calories_burned DOUBLE NULL,
+    heart_rate_avg DOUBLE NULL,
+    heart_rate_max DOUBLE NULL,
+    elevation_gain DOUBLE NULL,
+    date DATE NULL,
+    location_city VARCHAR(100) NULL,
+    location_country VARCHAR(100) NULL,
+    UNIQUE KEY uq_activities_user_strava (user_id, stravaActivityID)
+);
+
+CREATE TABLE IF NOT EXISTS activity_details (
+    activity_id INT NOT NULL PRIMARY KEY,
+    max_speed DOUBLE NULL,
+    average_cadence DOUBLE NULL,
+    average_watts DOUBLE NULL,
+    max_watts DOUBLE NULL,
+    kilojoules DOUBLE NULL,
+    calories DOUBLE NULL,
+    gear_name VARCHAR(255) NULL,
+    device_name VARCHAR(255) NULL,
+    polyline MEDIUMTEXT NULL
+);
@@ -0,0 +1,111 @@
+"""
+Creates and fills the benchmark database (BENCH_DB_NAME, default
+TriathlonForge_bench) on the MySQL server from DB_HOST/DB_PORT/DB_USER:
+
+    python -m benchmarks.seed_db --users 200 --activities 500 --sync-users 4
+
+The database is dropped and recreated from benchmarks/schema.sql plus every
+migration, so its schema is what the app expects after `flask migrate`. It
+then holds --users verified users (bench-user-<i>@example.com, password
+"benchmark-password") with --activities activities each, written with the
+same upsert the Strava sync uses and taken from the fake Strava's data, and
+--sync-users Strava-connected users without activities for the sync
+benchmark. All users hold refresh tokens the fake Strava accepts.
+"""
+import argparse
+import os
+import time
+
+from benchmarks.environment import (BENCH_ATHLETE_BASE, BENCH_DB_NAME, BENCH_EMAIL, BENCH_PASSWORD, BENCH_SYNC_EMAIL,
+                                    configure)
+
+configure()
+
+import mysql.connector  # noqa: E402
+from argon2 import PasswordHasher  # noqa: E402
+
+from app.utils.activity_store import strava_activity_row, upsert_strava_activities  # noqa: E402
+from app.utils.database import DB_HOST, DB_PASSWORD, DB_PORT, DB_USER, apply_migrations  # noqa: E402
+from app.utils.passwords import ARGON2_PARAMS  # noqa: E402
+from app.utils.strava_sync import update_derived_tables  # noqa: E402
+from benchmarks.fake_strava import REFRESH_PREFIX, detailed_activity, newest_start  # noqa: E402
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+
+def create_database(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{BENCH_DB_NAME}`")
+        cursor.execute(f"CREATE DATABASE `{BENCH_DB_NAME}` CHARACTER SET utf8mb4")
+        cursor.execute(f"USE `{BENCH_DB_NAME}`")
+        with open(SCHEMA_FILE, encoding="utf-8") as f:
+            sql = "\n".join(line for line in f if not line.lstrip().startswith("--"))
+        for statement in sql.split(";"):
+            if statement.strip():
+                cursor.execute(statement)
+        conn.commit()
+    finally:
+        cursor.close()
+    return apply_migrations(conn)
+
+
+def insert_users(conn, emails, first_athlete_id, password_hash):
+    """Inserts verified, Strava-connected users. Returns [(user_id, athlete_id), ...]."""
+    cursor = conn.cursor()
+    try:
+        users = []
+        for offset, email in enumerate(emails):
+            athlete_id = first_athlete_id + offset
+            cursor.execute("""
+                INSERT INTO users (first_name, last_name, email, password_hash, birth_year, verified,
+                                   strava_refresh_token, strava_token_expires_at, strava_athlete_id)
+                VALUES (%s, %s, %s, %s, %s, TRUE, %s, 0, %s)
+            """, ("Bench", f"User {athlete_id}", email, password_hash, 1970 + athlete_id % 35,
+                  f"{REFRESH_PREFIX}{athlete_id}", athlete_id))
+            users.append((cursor.lastrowid, athlete_id))
+        conn.commit()
+        return users
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="Users with activities (read/login load).")
+    parser.add_argument("--activities", type=int, default=500, help="Activities per user.")
+    parser.add_argument("--sync-users", type=int, default=4, help="Strava-connected users left empty for syncing.")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD)
+    try:
+        started = time.perf_counter()
+        applied = create_database(conn)
+        print(f"Created {BENCH_DB_NAME} ({len(applied)} migrations applied)")
+
+        # Same hash for every user: login verifies it with the same parameters as in production
+        password_hash = PasswordHasher(**ARGON2_PARAMS).hash(BENCH_PASSWORD)
+        users = insert_users(conn, [BENCH_EMAIL.format(i) for i in range(args.users)],
+                             BENCH_ATHLETE_BASE, password_hash)
+        insert_users(conn, [BENCH_SYNC_EMAIL.format(i) for i in range(args.sync_users)],
+                     BENCH_ATHLETE_BASE + args.users, password_hash)
+
+        newest = newest_start()
+        for count, (user_id, athlete_id) in enumerate(users, 1):
+            rows = []
+            for index in range(args.activities):
+                activity = detailed_activity(athlete_id, index, newest)
+                rows.append(strava_activity_row(user_id, activity, activity))
+            upsert_strava_activities(conn, user_id, rows)
+            update_derived_tables(conn, user_id)
+            if count % 20 == 0 or count == len(users):
+                print(f"  {count}/{len(users)} users seeded")
+
+        print(f"Seeded {args.users} users x {args.activities} activities and {args.sync_users} sync users "
+              f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+
+# gunicorn main:app (reads this file from the working directory)
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("GUNICORN_WORKERS", 4))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+
+# The app is imported and created once in the master and workers fork with every
+# module loaded. create_app() opens no MySQL connection, threads or process pools;
+# the connection pool, Strava client, log writer and hashing pool are created per
+# process on first use, so nothing from the master is shared with a worker.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+
+def on_starting(server):
+    # Metric files of the previous run would be summed into the new totals
+    from app.utils.metrics import clear_metrics_dir
+
+    clear_metrics_dir()
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from app.utils.apispec import API_SPEC_ENDPOINT, build_apispec
+
+    app = server.app.wsgi()
+    if API_SPEC_ENDPOINT not in app.swag.apispecs:
+        # Without a `flask build-apispec` file the spec is built once here, not in every worker
+        build_apispec(app)
@@ -0,0 +1,9 @@
+-- Per-user Strava sync watermark used for incremental syncs.
+-- last_start_date is the newest activity start_date seen, as a Unix timestamp,
+-- which is what Strava's `after=` filter on /athlete/activities expects.
+CREATE TABLE IF NOT EXISTS strava_sync_state (
+    user_id INT NOT NULL PRIMARY KEY,
+    last_start_date BIGINT NULL,
+    last_synced_at DATETIME NULL,
+    last_full_sync_at DATETIME NULL
+);
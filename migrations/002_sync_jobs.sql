@@ -0,0 +1,24 @@
+-- Background job queue for Strava syncs (and other long-running per-user jobs).
+-- active_user_id is only set while a strava_sync job is queued or running, so the
+-- unique key allows at most one active sync per user; duplicate requests collapse
+-- into the existing job.
+CREATE TABLE IF NOT EXISTS sync_jobs (
+    job_id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    job_type VARCHAR(32) NOT NULL DEFAULT 'strava_sync',
+    status ENUM('queued', 'running', 'succeeded', 'failed') NOT NULL DEFAULT 'queued',
+    full_sync BOOLEAN NOT NULL DEFAULT FALSE,
+    pages_fetched INT NOT NULL DEFAULT 0,
+    activities_written INT NOT NULL DEFAULT 0,
+    error_count INT NOT NULL DEFAULT 0,
+    last_error TEXT NULL,
+    worker VARCHAR(128) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    heartbeat_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    active_user_id INT AS (IF(job_type = 'strava_sync' AND status IN ('queued', 'running'), user_id, NULL)) STORED,
+    UNIQUE KEY uq_sync_jobs_active_user (active_user_id),
+    KEY idx_sync_jobs_status (status, job_id),
+    KEY idx_sync_jobs_user (user_id, job_id)
+);
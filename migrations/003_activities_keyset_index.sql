@@ -0,0 +1,3 @@
+-- Backs keyset pagination in /api/strava/get_activities:
+-- WHERE user_id = ? AND (date, activity_id) < (?, ?) ORDER BY date DESC, activity_id DESC
+ALTER TABLE activities ADD INDEX idx_activities_user_date_id (user_id, date, activity_id);
@@ -0,0 +1,15 @@
+-- Outbox for transactional email. Rows are inserted in the same transaction as the
+-- change that triggers them (e.g. registration) and sent by `flask email-worker`.
+CREATE TABLE IF NOT EXISTS email_outbox (
+    email_id INT AUTO_INCREMENT PRIMARY KEY,
+    to_email VARCHAR(255) NOT NULL,
+    template VARCHAR(64) NOT NULL,
+    context JSON NOT NULL,
+    status ENUM('pending', 'sending', 'sent', 'failed') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    last_error TEXT NULL,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    KEY idx_email_outbox_due (status, next_attempt_at)
+);
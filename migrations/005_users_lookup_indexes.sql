@@ -0,0 +1,4 @@
+-- Lookups done by /login, /register and /verify.
+-- The unique index fails to build if duplicate emails already exist; remove them first.
+ALTER TABLE users ADD UNIQUE INDEX uq_users_email (email);
+ALTER TABLE users ADD INDEX idx_users_email_verification (email, verification_code);
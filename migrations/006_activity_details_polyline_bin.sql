@@ -0,0 +1,3 @@
+-- Decoded route stored as zigzag-varint deltas (see app/utils/polyline.py).
+-- The text polyline column is kept for existing clients.
+ALTER TABLE activity_details ADD COLUMN polyline_bin MEDIUMBLOB NULL;
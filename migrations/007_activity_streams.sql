@@ -0,0 +1,7 @@
+-- Which Strava streams are stored on disk for an activity (see app/utils/streams.py).
+CREATE TABLE IF NOT EXISTS activity_streams (
+    activity_id INT NOT NULL PRIMARY KEY,
+    stream_keys VARCHAR(255) NOT NULL,
+    sample_count INT NOT NULL,
+    stored_at DATETIME NOT NULL
+);
@@ -0,0 +1,10 @@
+-- Materialized fitness/fatigue/form per user and day (see app/utils/training_load.py).
+CREATE TABLE IF NOT EXISTS training_load_daily (
+    user_id INT NOT NULL,
+    day DATE NOT NULL,
+    stress FLOAT NOT NULL,
+    ctl FLOAT NOT NULL,
+    atl FLOAT NOT NULL,
+    tsb FLOAT NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
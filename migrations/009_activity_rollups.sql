@@ -0,0 +1,14 @@
+-- Weekly/monthly volume per user and sport, maintained by the sync (see app/utils/rollups.py).
+-- period_start is the Monday of the week or the first day of the month.
+CREATE TABLE IF NOT EXISTS activity_rollups (
+    user_id INT NOT NULL,
+    period ENUM('week', 'month') NOT NULL,
+    period_start DATE NOT NULL,
+    sport VARCHAR(8) NOT NULL,
+    activity_count INT NOT NULL,
+    distance DOUBLE NOT NULL,
+    duration BIGINT NOT NULL,
+    elevation_gain DOUBLE NOT NULL,
+    calories_burned DOUBLE NOT NULL,
+    PRIMARY KEY (user_id, period, period_start, sport)
+);
@@ -0,0 +1,27 @@
+-- Strava push subscription (see app/utils/strava_webhook.py).
+-- Events reference the athlete, so users are looked up by their Strava athlete id.
+ALTER TABLE users ADD COLUMN strava_athlete_id BIGINT NULL;
+ALTER TABLE users ADD UNIQUE INDEX uq_users_strava_athlete (strava_athlete_id);
+
+-- Received events. Strava redelivers an event until it gets a 200, so the unique key
+-- turns redeliveries into no-ops. Pending events for the same object are applied
+-- together by `flask webhook-worker`.
+CREATE TABLE IF NOT EXISTS strava_webhook_events (
+    event_id INT AUTO_INCREMENT PRIMARY KEY,
+    subscription_id BIGINT NULL,
+    object_type VARCHAR(16) NOT NULL,
+    object_id BIGINT NOT NULL,
+    aspect_type VARCHAR(16) NOT NULL,
+    owner_id BIGINT NOT NULL,
+    event_time BIGINT NOT NULL,
+    updates JSON NULL,
+    status ENUM('pending', 'processing', 'done', 'failed') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    last_error TEXT NULL,
+    received_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    processed_at DATETIME NULL,
+    UNIQUE KEY uq_strava_webhook_event (object_type, object_id, aspect_type, event_time),
+    KEY idx_strava_webhook_due (status, next_attempt_at),
+    KEY idx_strava_webhook_object (object_type, object_id, status)
+);
@@ -0,0 +1,10 @@
+-- File imports (see app/utils/activity_import.py).
+-- start_time (UTC) is used to find an imported file's twin among existing activities;
+-- external_id identifies activities that did not come from Strava (hash of the source file).
+ALTER TABLE activities ADD COLUMN start_time DATETIME NULL;
+ALTER TABLE activities ADD COLUMN external_id VARCHAR(64) NULL;
+ALTER TABLE activities ADD INDEX idx_activities_user_start (user_id, start_time);
+ALTER TABLE activities ADD UNIQUE INDEX uq_activities_user_external (user_id, external_id);
+
+-- Job parameters that do not fit the fixed columns (e.g. the uploaded archive path).
+ALTER TABLE sync_jobs ADD COLUMN payload JSON NULL;
@@ -0,0 +1,4 @@
+-- strava_webhook_events timestamps are compared with UTC_TIMESTAMP(), so they are
+-- written as UTC by record_event(); CURRENT_TIMESTAMP would be the session's local time.
+ALTER TABLE strava_webhook_events ALTER COLUMN received_at DROP DEFAULT;
+ALTER TABLE strava_webhook_events ALTER COLUMN next_attempt_at DROP DEFAULT;
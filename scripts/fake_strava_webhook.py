@@ -0,0 +1,76 @@
+"""
+Local stand-in for Strava's push subscription service.
+
+Runs the GET handshake against the webhook endpoint and then posts a burst of
+events the way Strava would, including a redelivery, so deduplication and
+coalescing can be tried without a public callback URL:
+
+    STRAVA_WEBHOOK_VERIFY_TOKEN=dev flask --app main run
+    python scripts/fake_strava_webhook.py --athlete-id 123 --activity-id 456 --updates 5
+    flask --app main webhook-worker --coalesce-seconds 0 --burst
+
+The athlete id must match users.strava_athlete_id. Use --delete to finish the
+burst with a delete and --deauthorize to also revoke the athlete's access.
+"""
+import argparse
+import secrets
+import time
+
+import requests
+
+
+def post(session, url, event):
+    response = session.post(url, json=event, timeout=5)
+    print(f"{event['object_type']:8} {event['aspect_type']:7} {event['object_id']} -> "
+          f"{response.status_code} {response.text.strip()}")
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000/api/strava/webhook")
+    parser.add_argument("--verify-token", default="dev")
+    parser.add_argument("--subscription-id", type=int, default=1)
+    parser.add_argument("--athlete-id", type=int, required=True)
+    parser.add_argument("--activity-id", type=int, required=True)
+    parser.add_argument("--updates", type=int, default=3, help="Title updates posted after the create.")
+    parser.add_argument("--delete", action="store_true", help="End the burst with a delete.")
+    parser.add_argument("--deauthorize", action="store_true", help="Also post an athlete deauthorization.")
+    args = parser.parse_args()
+
+    session = requests.Session()
+    challenge = secrets.token_hex(8)
+    response = session.get(args.url, params={
+        "hub.mode": "subscribe", "hub.verify_token": args.verify_token, "hub.challenge": challenge
+    }, timeout=5)
+    echoed = response.ok and response.json().get("hub.challenge") == challenge
+    print(f"handshake -> {response.status_code} {'ok' if echoed else 'FAILED'}")
+
+    now = int(time.time())
+
+    def event(object_type, object_id, aspect_type, event_time, updates=None):
+        return {
+            "aspect_type": aspect_type,
+            "event_time": event_time,
+            "object_id": object_id,
+            "object_type": object_type,
+            "owner_id": args.athlete_id,
+            "subscription_id": args.subscription_id,
+            "updates": updates or {},
+        }
+
+    create = event("activity", args.activity_id, "create", now)
+    post(session, args.url, create)
+    post(session, args.url, create)  # Strava resends an event that was not acknowledged
+    for i in range(args.updates):
+        post(session, args.url, event("activity", args.activity_id, "update", now + i + 1,
+                                      {"title": f"Fake update {i + 1}"}))
+    if args.delete:
+        post(session, args.url, event("activity", args.activity_id, "delete", now + args.updates + 1))
+    if args.deauthorize:
+        post(session, args.url, event("athlete", args.athlete_id, "update", now + args.updates + 2,
+                                      {"authorized": "false"}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Local SMTP stand-in for trying the email outbox without a real mail server.
+
+Accepts any login, prints every received message and optionally writes it to
+a directory. Run it and point the worker at it:
+
+    python scripts/local_smtp.py --port 1025 --outdir /tmp/mail
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=1025 SMTP_USE_SSL=false \
+    SMTP_USER=dev@localhost SMTP_PASSWORD=dev flask --app main email-worker --burst
+
+Use --fail-every N to make every Nth message fail with a 451, to exercise retries.
+"""
+import argparse
+import itertools
+import os
+import socketserver
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    counter = itertools.count(1)
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 localhost local-smtp ready")
+        mail_from, rcpt_to = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                parts = command.split()
+                if len(parts) == 2 and parts[1].upper() == "LOGIN":
+                    self.reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                self.reply("235 Authentication successful")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = command[10:], []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_to.append(command[8:])
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for raw in self.rfile:
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw[1:] if raw.startswith(b"..") else raw)
+                self.deliver(mail_from, rcpt_to, b"".join(data))
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def deliver(self, mail_from, rcpt_to, data):
+        number = next(self.counter)
+        if self.server.fail_every and number % self.server.fail_every == 0:
+            self.reply("451 Simulated temporary failure")
+            return
+        print(f"[{number}] from {mail_from} to {', '.join(rcpt_to)} ({len(data)} bytes)")
+        if self.server.outdir:
+            with open(os.path.join(self.server.outdir, f"{number:05d}.eml"), "wb") as f:
+                f.write(data)
+        self.reply("250 OK: queued")
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--outdir")
+    parser.add_argument("--fail-every", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+    with SMTPServer((args.host, args.port), SMTPHandler) as server:
+        server.outdir = args.outdir
+        server.fail_every = args.fail_every
+        print(f"Local SMTP listening on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()